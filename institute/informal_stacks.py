@@ -34,6 +34,10 @@ to the lagend below because they are too big, which also means that the
 Roughly speaking, we first measure all sizes and try to find the best positions
 for then, *then* we create the PDF canvas and actually print them on it.
 
+The very same drawing code also yields the PNG thumbnail: Instead of the PDF
+canvas, it draws on a `DrawingCanvas`, which collects the geometry in a
+ReportLab drawing that is rasterised in-process by ``renderPM``.
+
 All dimension variables here are in big points (bp) because this is the native
 unit of measurement in ReportLab.
 """
@@ -43,10 +47,13 @@ import django.utils.six as six
 
 import random, math, decimal
 from reportlab.pdfgen import canvas
+from reportlab.graphics import renderPM
+from reportlab.graphics.shapes import Drawing, Group, Path as DrawingPath, Rect, Line, String
 from reportlab.lib.units import cm
 from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.colors import black, getAllNamedColors
-from reportlab.lib.enums import TA_LEFT
+from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
+from reportlab.lib.utils import simpleSplit
 from reportlab.platypus import Paragraph
 
 
@@ -82,6 +89,144 @@ lineskip = single_label_style.leading
 line_height = single_label_style.fontSize
 
 
+class DrawingCanvas(object):
+    """Canvas which collects everything drawn on it in a ReportLab drawing
+    instead of writing a PDF.  The drawing can be rasterised in-process with
+    ``renderPM``.  It offers the subset of the interface of ReportLab's PDF
+    ``Canvas`` which is used in this module.  Paragraphs are drawn with
+    `draw_paragraph`.
+
+    :ivar drawing: the drawing with all shapes drawn so far
+
+    :type drawing: ``reportlab.graphics.shapes.Drawing``
+    """
+
+    def __init__(self, width, height):
+        """
+        :param width: the width of the diagram
+        :param height: the height of the diagram
+
+        :type width: float
+        :type height: float
+        """
+        self.drawing = Drawing(width, height)
+        self.group = Group()
+        self.drawing.add(self.group)
+        self.fill_color = self.stroke_color = black
+        self.line_width = 1
+        self.line_join = self.line_cap = 0
+        self.font_name, self.font_size = single_label_style.fontName, single_label_style.fontSize
+        self.saved_states = []
+
+    def saveState(self):
+        self.saved_states.append((self.group, self.fill_color, self.stroke_color, self.line_width, self.line_join,
+                                  self.line_cap))
+
+    def restoreState(self):
+        self.group, self.fill_color, self.stroke_color, self.line_width, self.line_join, self.line_cap = \
+            self.saved_states.pop()
+
+    def translate(self, dx, dy):
+        group = Group(transform=(1, 0, 0, 1, dx, dy))
+        self.group.add(group)
+        self.group = group
+
+    def setFillColor(self, color):
+        self.fill_color = color
+
+    def setStrokeColor(self, color):
+        self.stroke_color = color
+
+    def setLineWidth(self, width):
+        self.line_width = width
+
+    def setLineJoin(self, mode):
+        self.line_join = mode
+
+    def setLineCap(self, mode):
+        self.line_cap = mode
+
+    def beginPath(self):
+        return DrawingPath()
+
+    def drawPath(self, path, stroke=True, fill=False):
+        if fill:
+            path.closePath()
+        path.fillColor = self.fill_color if fill else None
+        path.strokeColor = self.stroke_color if stroke else None
+        path.strokeWidth, path.strokeLineJoin, path.strokeLineCap = self.line_width, self.line_join, self.line_cap
+        self.group.add(path)
+
+    def rect(self, x, y, width, height, stroke=1, fill=0):
+        self.group.add(Rect(x, y, width, height, fillColor=self.fill_color if fill else None,
+                            strokeColor=self.stroke_color if stroke else None, strokeWidth=self.line_width))
+
+    def line(self, x1, y1, x2, y2):
+        self.group.add(Line(x1, y1, x2, y2, strokeColor=self.stroke_color, strokeWidth=self.line_width,
+                            strokeLineCap=self.line_cap))
+
+    def drawString(self, x, y, text):
+        self.group.add(String(x, y, text, fontName=self.font_name, fontSize=self.font_size, fillColor=self.fill_color))
+
+    def draw_paragraph(self, paragraph, x, y):
+        """Draws a paragraph which has already been wrapped.  The markup is
+        reduced to plain text in the font and colour of its beginning, which
+        is good enough for thumbnails.
+
+        :param paragraph: the paragraph to be drawn
+        :param x: the horizontal coordinate of the left edge of the paragraph
+        :param y: the vertical coordinate of the bottom edge of the paragraph
+
+        :type paragraph: Paragraph
+        :type x: float
+        :type y: float
+        """
+        style = paragraph.style
+        fragments = [fragment for fragment in paragraph.frags if getattr(fragment, "text", None)]
+        text = "".join(fragment.text for fragment in fragments)
+        font_name = fragments[0].fontName if fragments else style.fontName
+        color = fragments[0].textColor if fragments else style.textColor
+        bullet_text = paragraph.bulletText
+        if bullet_text and not isinstance(bullet_text, six.string_types):
+            bullet_text = "".join(fragment.text for fragment in bullet_text)
+        left = x + style.leftIndent
+        available_width = paragraph.width - style.leftIndent - style.rightIndent
+        if style.alignment == TA_RIGHT:
+            text_x, text_anchor = left + available_width, "end"
+        elif style.alignment == TA_CENTER:
+            text_x, text_anchor = left + available_width / 2, "middle"
+        else:
+            text_x, text_anchor = left, "start"
+        baseline = y + paragraph.height - style.fontSize
+        if bullet_text:
+            self.group.add(String(x + style.bulletIndent, baseline, bullet_text, fontName=style.bulletFontName,
+                                  fontSize=style.bulletFontSize, fillColor=color))
+        for line in simpleSplit(text, font_name, style.fontSize, available_width):
+            self.group.add(String(text_x, baseline, line, fontName=font_name, fontSize=style.fontSize,
+                                  fillColor=color, textAnchor=text_anchor))
+            baseline -= style.leading
+
+
+def draw_paragraph(canvas, paragraph, x, y):
+    """Draws a paragraph which has already been wrapped on either a PDF canvas
+    or a `DrawingCanvas`.
+
+    :param canvas: the canvas to be used
+    :param paragraph: the paragraph to be drawn
+    :param x: the horizontal coordinate of the left edge of the paragraph
+    :param y: the vertical coordinate of the bottom edge of the paragraph
+
+    :type canvas: canvas.Canvas or `DrawingCanvas`
+    :type paragraph: Paragraph
+    :type x: float
+    :type y: float
+    """
+    if isinstance(canvas, DrawingCanvas):
+        canvas.draw_paragraph(paragraph, x, y)
+    else:
+        paragraph.drawOn(canvas, x, y)
+
+
 def get_circled_number(number, largest_number):
     """Converts a number to a string using the nicest way possible.  If only
     numbers ≤ 10 occur in the diagram, the circled unicode numbers like “➉” are
@@ -641,7 +786,7 @@ class Label(object):
             self.text = """<para alignment="right">{0}</para>""".format(self.text)
         paragraph = Paragraph(self.text, single_label_style)
         __, height = paragraph.wrap(dimensions["label_width"], 10 * lineskip)
-        paragraph.drawOn(canvas, hoffset, self.voffset - height / 2)
+        draw_paragraph(canvas, paragraph, hoffset, self.voffset - height / 2)
 
 
 class NumberedLabel(Label):
@@ -668,7 +813,7 @@ class NumberedLabel(Label):
     :type voffset: float
     :type right_row: bool
     """
-    largest_number = None
+    largest_number = 0
 
     def __init__(self, lower, upper, voffset, right_row):
         """
@@ -771,19 +916,22 @@ def build_legend(displaced_labels, width):
     return legend, total_height
 
 
-def generate_diagram(filepath, layers, title, subject):
-    """Generates the stack diagram and writes it to a PDF file.
+def prepare_diagram(layers):
+    """Calculates the layout of the stack diagram.  The result can be drawn on
+    any canvas, see `generate_diagram` and `generate_thumbnail`.
 
-    :param filepath: the path to the PDF file that should be written
     :param layers: the layers of the stack in chronological order
-    :param title: the title of the PDF file
-    :param subject: the subject of the PDF file
 
-    :type filepath: str
     :type layers: list of `Layer`
-    :type title: unicode
-    :type subject: unicode
+
+    :return:
+      the width of the diagram, the height of the diagram, and a function
+      which draws the diagram on the canvas given to it as its only parameter
+
+    :rtype: float, float, callable
     """
+    Label.needs_left_row = False
+    NumberedLabel.largest_number = 0
     scale = Scale(layers)
     stack_height = build_stack(layers, scale)
     labels, displaced_labels = place_labels(layers)
@@ -802,43 +950,81 @@ def generate_diagram(filepath, layers, title, subject):
         width += 2 * red_line_space
         height += 2 * red_line_space
         total_margin += red_line_space
+    visible_layers = [layer for layer in reversed(layers) if layer.nm >= 0]
+    needs_left_row = Label.needs_left_row
+
+    def draw(c):
+        c.setLineJoin(1)
+        c.setLineCap(1)
+        if not verified:
+            red_line_position = dimensions["red_line_width"] / 2 + dimensions["red_line_skip"]
+            c.saveState()
+            c.setStrokeColor(getAllNamedColors()["red"])
+            c.setLineWidth(dimensions["red_line_width"])
+            c.rect(red_line_position, red_line_position, width - 2 * red_line_position, height - 2 * red_line_position)
+            c.restoreState()
+        c.translate(total_margin, total_margin)
+        yoffset = 0
+        for item in reversed(legend):
+            draw_paragraph(c, item, 0, yoffset)
+            yoffset += item.height + 0.3 * lineskip
+        if legend:
+            c.translate(0, legend_height + dimensions["legend_skip"])
+        for label in labels:
+            label.print_label(c)
+        c.saveState()
+        if needs_left_row:
+            c.translate(full_label_width, 0)
+        for layer in visible_layers:
+            layer.draw(c)
+        c.restoreState()
+        c.translate(full_label_width if needs_left_row else 0, stack_height + dimensions["scale_skip"])
+        scale.draw(c)
+
+    return width, height, draw
 
+
+def generate_diagram(filepath, layers, title, subject):
+    """Generates the stack diagram and writes it to a PDF file.
+
+    :param filepath: the path to the PDF file that should be written
+    :param layers: the layers of the stack in chronological order
+    :param title: the title of the PDF file
+    :param subject: the subject of the PDF file
+
+    :type filepath: str
+    :type layers: list of `Layer`
+    :type title: unicode
+    :type subject: unicode
+    """
+    width, height, draw = prepare_diagram(layers)
     c = canvas.Canvas(filepath, pagesize=(width, height), pageCompression=True)
     c.setAuthor("JuliaBase samples database")
     c.setTitle(title)
     c.setSubject(subject)
-    c.setLineJoin(1)
-    c.setLineCap(1)
-
-    if not verified:
-        red_line_position = dimensions["red_line_width"] / 2 + dimensions["red_line_skip"]
-        c.saveState()
-        c.setStrokeColor(getAllNamedColors()["red"])
-        c.setLineWidth(dimensions["red_line_width"])
-        c.rect(red_line_position, red_line_position, width - 2 * red_line_position, height - 2 * red_line_position)
-        c.restoreState()
-    c.translate(total_margin, total_margin)
-    yoffset = 0
-    for item in reversed(legend):
-        item.drawOn(c, 0, yoffset)
-        yoffset += item.height + 0.3 * lineskip
-    if legend:
-        c.translate(0, legend_height + dimensions["legend_skip"])
-    for label in labels:
-        label.print_label(c)
-    c.saveState()
-    if Label.needs_left_row:
-        c.translate(full_label_width, 0)
-    layers = [layer for layer in reversed(layers) if layer.nm >= 0]
-    for i, layer in enumerate(layers):
-        layer.draw(c)
-    c.restoreState()
-    c.translate(full_label_width if Label.needs_left_row else 0, stack_height + dimensions["scale_skip"])
-    scale.draw(c)
+    draw(c)
     c.showPage()
     c.save()
 
 
+def generate_thumbnail(filepath, layers, resolution=100):
+    """Generates the stack diagram and writes it to a PNG file.  The bitmap is
+    rendered in-process, without going through the PDF.
+
+    :param filepath: the path to the PNG file that should be written
+    :param layers: the layers of the stack in chronological order
+    :param resolution: the resolution of the bitmap in dpi
+
+    :type filepath: str
+    :type layers: list of `Layer`
+    :type resolution: float
+    """
+    width, height, draw = prepare_diagram(layers)
+    c = DrawingCanvas(width, height)
+    draw(c)
+    renderPM.drawToFile(c.drawing, filepath, fmt="PNG", dpi=resolution)
+
+
 if __name__ == "__main__":
     layers = [Layer("Glas", 2e3, "lightblue", textured=True),
               Layer("Eine <i>wirklich</i> <b>wunderschöne</b> <a href='http://www.fz-juelich.de'>αβγ</a>-Schicht", 1e2,
@@ -31,19 +31,48 @@ layouts are realised with masks.
 
 So far, we have only the cell structuring layouts implemented.  They are used
 in the solarsimulator measurements.
+
+The structurings of a sample are cached as a timeline, see
+`get_structuring_timelines`, so that finding the structuring which is in
+charge for a process doesn't need a database query.
+
+The rendered layouts are cached in ``CACHE_ROOT/layouts``.  The filenames
+contain a hash over everything the drawing depends on, see
+`Layout.get_cache_key`, so that cached files are never outdated.
 """
 
 from __future__ import division, unicode_literals
+import django.utils.six as six
 
+import os, hashlib, glob, bisect, tempfile, json
+import numpy
 from reportlab.pdfgen.canvas import Canvas
+from reportlab.graphics import renderPM
+from reportlab.lib import colors
 from reportlab.lib.units import mm
 import reportlab.pdfbase.pdfmetrics
 from django.conf import settings
+from django.core.cache import cache
 import jb_common.utils.base as utils
+import samples.models
 import institute.models
 from institute.reportlab_config import default_fontname
 
 
+cell_colors = [(0, 0, 0.5), (0, 0.6, 0.88), (0, 0.77, 0.8), (0.11, 0.64, 0.22), (0, 1, 0.2), (1, 0.9, 0),
+               (0.93, 0.68, 0.05), (1, 0.5, 0), (0.8, 0.07, 0)]
+"""The colours of the cells in solarsimulator measurements, from bad to good.
+"""
+
+default_cell_color_thresholds = {"AM1.5": [0.33, 3.1, 5.3, 6.3, 7.0, 7.7, 8.4, 9.2],
+                                 "OG590": [2.5, 3.6, 4.3, 5.0, 6.7, 9.1, 10, 12],
+                                 "BG7": [1.66, 2.45, 2.65, 2.77, 2.87, 2.93, 3.00, 3.13]}
+"""The thresholds between the `cell_colors` for every irradiation, used as
+long as `update_cell_color_thresholds` hasn't determined them from the
+measured values, i.e. as long as its file doesn't exist.
+"""
+
+
 class NoStructuringFound(Exception):
     def __init__(self, sample, timestamp):
         message = "No structuring process before {0} for sample {1} found.".format(timestamp, sample) if timestamp else \
@@ -51,6 +80,88 @@ class NoStructuringFound(Exception):
         super(NoStructuringFound, self).__init__(message)
 
 
+def _get_structuring_timeline_cache_key(sample_id):
+    return "structuring-timeline:{0}".format(sample_id)
+
+
+def get_structuring_timelines(sample_ids):
+    """Returns the structuring timelines of the given samples.  A timeline is
+    the list of all structuring processes of the sample, sorted by their
+    timestamps.  The timelines are cached; the cache items are deleted by
+    `expire_structuring_timelines` if a structuring is changed.  All timelines
+    which are not in the cache are read with two queries.
+
+    :param sample_ids: the IDs of the samples
+
+    :type sample_ids: iterable of int
+
+    :return:
+      the timelines of the samples, mapping the sample ID to a list of
+      (timestamp, structuring) tuples
+
+    :rtype: dict mapping int to list of (datetime.datetime,
+      `institute.models.Structuring`)
+    """
+    cache_keys = dict((sample_id, _get_structuring_timeline_cache_key(sample_id)) for sample_id in sample_ids)
+    cached_timelines = cache.get_many(list(cache_keys.values()))
+    timelines = {}
+    for sample_id, cache_key in cache_keys.items():
+        if cache_key in cached_timelines:
+            timelines[sample_id] = cached_timelines[cache_key]
+    missing_sample_ids = set(cache_keys) - set(timelines)
+    if missing_sample_ids:
+        structurings = dict((structuring.id, structuring) for structuring in
+                            institute.models.Structuring.objects.filter(samples__in=missing_sample_ids).distinct())
+        new_timelines = dict((sample_id, []) for sample_id in missing_sample_ids)
+        for sample_id, structuring_id in samples.models.Sample.processes.through.objects.filter(
+                sample__in=missing_sample_ids, process__in=list(structurings)).values_list("sample_id", "process_id"):
+            structuring = structurings[structuring_id]
+            new_timelines[sample_id].append((structuring.timestamp, structuring))
+        for timeline in new_timelines.values():
+            timeline.sort(key=lambda item: item[0])
+        cache.set_many(dict((cache_keys[sample_id], timeline) for sample_id, timeline in new_timelines.items()))
+        timelines.update(new_timelines)
+    return timelines
+
+
+def expire_structuring_timelines(sample_ids):
+    """Removes the structuring timelines of the given samples from the cache.
+    This happens after the commit, so that no outdated timeline can be cached
+    again by a concurrent request.
+
+    :param sample_ids: the IDs of the samples
+
+    :type sample_ids: iterable of int
+    """
+    cache_keys = [_get_structuring_timeline_cache_key(sample_id) for sample_id in sample_ids]
+    if cache_keys:
+        utils.run_after_commit(lambda: cache.delete_many(cache_keys))
+
+
+def _find_structuring(timeline, timestamp):
+    """Returns the latest structuring in the timeline before or on the given
+    timestamp.
+
+    :param timeline: the structuring timeline of a sample as returned by
+        `get_structuring_timelines`
+    :param timestamp: the found structuring is the latest structuring before or
+        on this timestamp; if ``None``, the very latest structuring is returned
+
+    :type timeline: list of (datetime.datetime, `institute.models.Structuring`)
+    :type timestamp: datetime.datetime
+
+    :return:
+      the structuring, or ``None`` if there is none
+
+    :rtype: `institute.models.Structuring` or NoneType
+    """
+    if timestamp is None:
+        index = len(timeline)
+    else:
+        index = bisect.bisect_right([item[0] for item in timeline], timestamp)
+    return timeline[index - 1][1] if index else None
+
+
 def get_current_structuring(sample, timestamp=None):
     """Returns the most recent structuring process of the given sample, optionally
     before a timestamp.  This timestamp typically is the timestamp of the
@@ -72,13 +183,38 @@ def get_current_structuring(sample, timestamp=None):
 
     :raises NoStructuringFound: if no matching structuring was found
     """
-    query_set = institute.models.Structuring.objects.filter(samples=sample)
-    if timestamp:
-        query_set = query_set.filter(timestamp__lte=timestamp)
-    try:
-        return query_set.latest("timestamp")
-    except institute.models.Structuring.DoesNotExist:
+    structuring = _find_structuring(get_structuring_timelines([sample.id])[sample.id], timestamp)
+    if structuring is None:
         raise NoStructuringFound(sample, timestamp)
+    return structuring
+
+
+def get_layouts(samples_and_processes):
+    """Batch version of `get_layout`.  It needs at most two database queries
+    for all layouts together.
+
+    :param samples_and_processes: the samples and the processes for which the
+        layouts should be found
+
+    :type samples_and_processes: iterable of (`samples.models.Sample`,
+      `samples.models.Process`)
+
+    :return:
+      the layouts, mapping (sample ID, process ID) tuples to the layout objects;
+      see `get_layout` for when the layout is ``None``
+
+    :rtype: dict mapping (int, int) to `Layout` or NoneType
+    """
+    samples_and_processes = list(samples_and_processes)
+    timelines = get_structuring_timelines(set(sample.id for sample, __ in samples_and_processes))
+    layout_classes = {"inm standard": INMStandard,
+                      "acme1": ACME1}
+    layouts = {}
+    for sample, process in samples_and_processes:
+        current_structuring = _find_structuring(timelines[sample.id], process.timestamp)
+        layout_class = current_structuring and layout_classes.get(current_structuring.layout)
+        layouts[sample.id, process.id] = layout_class and layout_class(sample, process, current_structuring)
+    return layouts
 
 
 def get_layout(sample, process):
@@ -108,14 +244,77 @@ def get_layout(sample, process):
     # they need its interface.  Alternatively, this function does the limiting
     # itself basing on the type of `process`.  However, this may be too
     # implicit.
+    return get_layouts([(sample, process)])[sample.id, process.id]
+
+
+def _get_cell_color_thresholds_filepath():
+    """Returns the path to the file in which `update_cell_color_thresholds`
+    stores the thresholds, so that they survive restarts and evictions of the
+    cache.
+
+    :return:
+      the absolute path to the JSON file with the thresholds
+
+    :rtype: str
+    """
+    return os.path.join(settings.CACHE_ROOT, "layouts", "cell_color_thresholds.json")
+
+
+def get_cell_color_thresholds(irradiation):
+    """Returns the thresholds between the `cell_colors` for solarsimulator
+    measurements with the given irradiation.  They are read from the cache, or,
+    if they have been evicted from it, from the file written by
+    `update_cell_color_thresholds`.
+
+    :param irradiation: the irradiation of the solarsimulator measurement
+
+    :type irradiation: unicode
+
+    :return:
+      the ascending thresholds, one less than there are cell colours; ``None``
+      if the irradiation is unknown
+
+    :rtype: list of float or NoneType
+    """
+    thresholds = cache.get("cell-color-thresholds")
+    if thresholds is None:
+        try:
+            with open(_get_cell_color_thresholds_filepath()) as thresholds_file:
+                thresholds = json.load(thresholds_file)
+        except (IOError, ValueError):
+            thresholds = {}
+        cache.set("cell-color-thresholds", thresholds, None)
+    return thresholds.get(irradiation, default_cell_color_thresholds.get(irradiation))
+
+
+def update_cell_color_thresholds():
+    """Determines the thresholds between the `cell_colors` from all measured
+    cells so that each colour occurs with equal probability, i.e. the
+    thresholds are the quantiles of the characteristic values of the cells.
+    They are stored in a JSON file in ``CACHE_ROOT/layouts`` and in the cache.
+    Irradiations with too few measured cells keep their default thresholds.
+    This is called nightly by the ``maintain`` signal.
+    """
+    thresholds = {}
+    quantiles = numpy.linspace(0, 100, len(cell_colors) + 1)[1:-1]
+    for irradiation, quantity in institute.models.SolarsimulatorMeasurement.characteristic_quantities.items():
+        values = numpy.fromiter(institute.models.SolarsimulatorCellMeasurement.objects.filter(
+            measurement__irradiation=irradiation, **{quantity + "__isnull": False}).
+                                values_list(quantity, flat=True).iterator(), dtype=float)
+        if len(values) >= 10 * len(cell_colors):
+            thresholds[irradiation] = [float(utils.round(threshold, 3))
+                                       for threshold in numpy.percentile(values, quantiles)]
+    filepath = _get_cell_color_thresholds_filepath()
+    utils.mkdirs(filepath)
+    file_descriptor, temporary_filepath = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(filepath))
     try:
-        current_structuring = get_current_structuring(sample, process.timestamp)
-    except NoStructuringFound:
-        return None
-    else:
-        layout_class = {"inm standard": INMStandard,
-                        "acme1": ACME1}.get(current_structuring.layout)
-        return layout_class and layout_class(sample, process, current_structuring)
+        with os.fdopen(file_descriptor, "w") as thresholds_file:
+            os.chmod(temporary_filepath, 0o644)
+            json.dump(thresholds, thresholds_file)
+        os.rename(temporary_filepath, filepath)
+    finally:
+        utils.remove_file(temporary_filepath)
+    cache.set("cell-color-thresholds", thresholds, None)
 
 
 def _draw_constrained_text(canvas, text, x, y, fontsize, width, graylevel, background_color):
@@ -165,6 +364,61 @@ def _draw_constrained_text(canvas, text, x, y, fontsize, width, graylevel, backg
     canvas.drawCentredString(x, y - ascent / 2, text)
 
 
+class PixelCanvas(object):
+    """Canvas which draws into a bitmap in-process by means of ReportLab's
+    ``renderPM``.  It offers the subset of the interface of ReportLab's PDF
+    ``Canvas`` which is used in the ``draw_layout`` methods of the layouts, so
+    that the very same drawing code yields both the PDF and the PNG.  If you
+    use further canvas methods in your layouts, add them here.
+
+    :ivar pm_canvas: the underlying bitmap canvas
+
+    :type pm_canvas: ``reportlab.graphics.renderPM.PMCanvas``
+    """
+
+    def __init__(self, width, height, dpi):
+        """Class constructor.
+
+        :param width: the width of the canvas in bp
+        :param height: the height of the canvas in bp
+        :param dpi: the resolution of the bitmap
+
+        :type width: float
+        :type height: float
+        :type dpi: float
+        """
+        self.pm_canvas = renderPM.PMCanvas(width, height, dpi=dpi, bg=0xffffff)
+        self.pm_canvas.setStrokeColor(colors.black)
+        self.pm_canvas.setLineWidth(1)
+        self.fontsize = 10
+        self.pm_canvas.setFont(default_fontname, self.fontsize)
+
+    def setFillColorRGB(self, red, green, blue):
+        self.pm_canvas.setFillColor(colors.Color(red, green, blue))
+
+    def setFillGray(self, graylevel):
+        self.setFillColorRGB(graylevel, graylevel, graylevel)
+
+    def setFontSize(self, size):
+        self.fontsize = size
+        self.pm_canvas.setFont(default_fontname, size)
+
+    def rect(self, x, y, width, height, stroke=1, fill=0):
+        self.pm_canvas.rect(x, y, width, height, stroke=stroke, fill=fill)
+
+    def drawCentredString(self, x, y, text):
+        self.pm_canvas.drawCentredString(x, y, text)
+
+    def save(self, filename):
+        """Writes the bitmap to a PNG file.
+
+        :param filename: the full path to the PNG that should be created
+
+        :type filename: str
+        """
+        self.pm_canvas.saveToFile(filename, fmt="PNG")
+
+
 class Layout(object):
     """Abstract base class for structuring layouts.  The main purpose of
     layouts is to have something to draw.
@@ -222,6 +476,98 @@ class Layout(object):
         canvas.showPage()
         canvas.save()
 
+    def generate_png(self, filename):
+        """Draws the layout and writes it to a PNG file with a width of
+        ``THUMBNAIL_WIDTH`` pixels.  The bitmap is rendered in-process, see
+        `PixelCanvas`.
+
+        :param filename: the full path to the PNG that should be created
+
+        :type filename: unicode
+        """
+        canvas = PixelCanvas(self.width, self.height, dpi=settings.THUMBNAIL_WIDTH / (self.width / 72))
+        self.draw_layout(canvas)
+        canvas.save(filename)
+
+    def get_cache_key_items(self):
+        """Returns everything the drawing of this layout depends on.  The
+        default implementation returns the structuring and the process
+        together with their last modifications.  Override this method (and
+        call the super method) if the drawing depends on further data.
+
+        :return:
+          all items that enter the cache key; they must have a stable string
+          representation
+
+        :rtype: list of object
+        """
+        return [self.__class__.__name__, self.structuring.id, self.structuring.last_modified,
+                self.process.id, self.process.last_modified, settings.THUMBNAIL_WIDTH]
+
+    def get_cache_key(self):
+        """Returns the hash over `get_cache_key_items`.  It is used as the name of
+        the cached layout files, and as the ETag of the thumbnail.
+
+        :return:
+          the cache key of this layout
+
+        :rtype: str
+        """
+        return hashlib.sha1("\x04".join(six.text_type(item) for item in self.get_cache_key_items()).
+                            encode("utf-8")).hexdigest()
+
+    def get_filepath(self, thumbnail):
+        """Returns the path to the cached layout file in the local filesystem.
+
+        :param thumbnail: whether the PNG thumbnail rather than the PDF is meant
+
+        :type thumbnail: bool
+
+        :return:
+          the absolute path to the layout file; it may not exist yet
+
+        :rtype: str
+        """
+        return os.path.join(settings.CACHE_ROOT, "layouts", "{0}-{1}-{2}.{3}".format(
+            self.process.id, self.sample.id, self.get_cache_key(), "png" if thumbnail else "pdf"))
+
+    def generate_file(self, thumbnail):
+        """Generates the cached layout file.  The file is written atomically
+        because it may be requested concurrently.  Afterwards, outdated files
+        of the same sample and process are removed.
+
+        :param thumbnail: whether the PNG thumbnail rather than the PDF should be
+            generated
+
+        :type thumbnail: bool
+
+        :return:
+          the absolute path to the generated layout file
+
+        :rtype: str
+        """
+        filepath = self.get_filepath(thumbnail)
+        utils.mkdirs(filepath)
+        # The temporary file must be unique also among the threads of this
+        # process because they may generate the same layout concurrently.
+        file_descriptor, temporary_filepath = tempfile.mkstemp(
+            prefix=os.path.basename(filepath) + ".", suffix=".tmp", dir=os.path.dirname(filepath))
+        os.close(file_descriptor)
+        try:
+            os.chmod(temporary_filepath, 0o644)
+            if thumbnail:
+                self.generate_png(temporary_filepath)
+            else:
+                self.generate_pdf(temporary_filepath)
+            os.rename(temporary_filepath, filepath)
+        finally:
+            utils.remove_file(temporary_filepath)
+        for outdated_filepath in glob.glob(os.path.join(os.path.dirname(filepath), "{0}-{1}-*{2}".format(
+                self.process.id, self.sample.id, os.path.splitext(filepath)[1]))):
+            if outdated_filepath != filepath:
+                utils.remove_file(outdated_filepath)
+        return filepath
+
 
 class CellsLayout(Layout):
     """Abstract class for cell layouts.  These layouts are primarily used in
@@ -272,11 +618,22 @@ class CellsLayout(Layout):
                                                    self.height - coords[0][1]))}
         return map_shapes
 
+    def get_cache_key_items(self):
+        items = super(CellsLayout, self).get_cache_key_items()
+        if isinstance(self.process, institute.models.SolarsimulatorMeasurement):
+            cell_array = self.process.get_cell_array()
+            items.extend(zip(cell_array.positions, cell_array.eta, cell_array.isc))
+            items.append(get_cell_color_thresholds(self.process.irradiation))
+        return items
+
     @staticmethod
     def _get_colors_and_labels(solarsimulator_measurement):
         """Returns the colours and labels for all cells in a particular
         solarsimulator measurement.  This is a helper routine for
-        `draw_layout`.
+        `draw_layout`.  The colour is determined by the characteristic value
+        of the cell (η for AM1.5 measurements and Isc for BG7 and OG590
+        measurements), see `get_cell_color_thresholds`.  Cells without value
+        are missing in the result.
 
         :param solarsimulator_measurement: the solarsimulator measurement for
             which the colouring should be determined
@@ -291,43 +648,15 @@ class CellsLayout(Layout):
 
         :rtype: dict mapping unicode to ((float, float, float), unicode)
         """
-        def map_value_to_RGB(value, thresholds):
-            """Returns the cell colour associated with `value`.  `thresholds`
-            is a list of threshold values.  It must contain 8 positive float
-            items.
-
-            `value` is η for AM1.5 measurements and Isc for BG7 and OG590
-            measurements.  `thresholds` should be determined once by looking at
-            the already-measured values: Each colour should occur with equal
-            probability (the areas in the histogram of each colour are the
-            same).
-            """
-            colors = [(0, 0, 0.5), (0, 0.6, 0.88), (0, 0.77, 0.8), (0.11, 0.64, 0.22), (0, 1, 0.2), (1, 0.9, 0),
-                      (0.93, 0.68, 0.05), (1, 0.5, 0), (0.8, 0.07, 0)]
-            assert len(thresholds) == len(colors) - 1
-            i = 0
-            while thresholds[i] < value:
-                i += 1
-                if i == len(thresholds):
-                    return colors[-1]
-            return colors[i]
-        irradiation = solarsimulator_measurement.irradiation
+        cell_array = solarsimulator_measurement.get_cell_array()
+        thresholds = get_cell_color_thresholds(solarsimulator_measurement.irradiation)
+        if not thresholds:
+            return dict((position, ((0, 0, 0), None)) for position in cell_array.positions)
         colors_and_labels = {}
-        cell_measurements = solarsimulator_measurement.cells.all()
-        for cell in cell_measurements:
-            if irradiation == "AM1.5":
-                color = map_value_to_RGB(cell.eta, [0.33, 3.1, 5.3, 6.3, 7.0, 7.7, 8.4, 9.2])
-                label = utils.round(cell.eta, 3)
-            elif irradiation == "OG590":
-                color = map_value_to_RGB(cell.isc, [2.5, 3.6, 4.3, 5.0, 6.7, 9.1, 10, 12])
-                label = utils.round(cell.isc, 3)
-            elif irradiation == "BG7":
-                color = map_value_to_RGB(cell.isc, [1.66, 2.45, 2.65, 2.77, 2.87, 2.93, 3.00, 3.13])
-                label = utils.round(cell.isc, 3)
-            else:
-                color = (0, 0, 0)
-                label = None
-            colors_and_labels[cell.position] = (color, label)
+        for position, value, color_index in zip(cell_array.positions, cell_array.values,
+                                                cell_array.get_color_indices(thresholds)):
+            if not numpy.isnan(value):
+                colors_and_labels[position] = (cell_colors[color_index], utils.round(value, 3))
         return colors_and_labels
 
     def draw_layout(self, canvas):
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module which defines the command ``render_stack_diagrams``.  It generates
+the missing or outdated informal layer stack diagrams and their thumbnails of
+all samples, so that they needn't be generated while the user is waiting for
+the sample data sheet.  It should be called regularly as a cronjob.  For
+example, one line in the crontab may read::
+
+    */10 * * * * /home/juliabase/juliabase/manage.py render_stack_diagrams
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import multiprocessing
+from django.core.management.base import BaseCommand
+from django import db
+from jb_common.signals import storage_changed
+from institute import models
+
+
+def render_stack_diagrams(sample_id):
+    """Generates the outdated stack diagram files of the given sample.  This is
+    called in the worker processes of the pool, therefore it takes the ID
+    rather than the sample details instance.
+
+    :param sample_id: the ID of the sample
+
+    :type sample_id: int
+
+    :return:
+      the number of generated stack diagram files
+
+    :rtype: int
+    """
+    try:
+        sample_details = models.SampleDetails.objects.select_related("sample").get(pk=sample_id)
+    except models.SampleDetails.DoesNotExist:
+        return 0
+    return sum(sample_details.generate_stack_diagram(thumbnail) for thumbnail in (True, False))
+
+
+class Command(BaseCommand):
+    help = "Generates all missing or outdated informal layer stack diagrams.  It should be called regularly " \
+           "as a cronjob."
+    # The diagrams contain translated layer names, so the default language is
+    # used rather than English.
+    leave_locale_alone = True
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(),
+                            help="number of worker processes (default: number of CPUs)")
+
+    def handle(self, *args, **options):
+        sample_ids = [sample_id for sample_id, last_modified in
+                      models.SampleDetails.objects.filter(informal_layers__verified=True).distinct().
+                      values_list("pk", "sample__last_modified")
+                      if any(models.SampleDetails(pk=sample_id).is_stack_diagram_outdated(thumbnail, last_modified)
+                             for thumbnail in (True, False))]
+        if not sample_ids:
+            return
+        # The worker processes must not share the database connections of this
+        # process; they open their own ones after the fork.
+        db.connections.close_all()
+        pool = multiprocessing.Pool(options["jobs"])
+        try:
+            generated_files = pool.map(render_stack_diagrams, sample_ids)
+        finally:
+            pool.close()
+            pool.join()
+        if any(generated_files):
+            storage_changed.send(models.SampleDetails)
@@ -130,15 +130,123 @@ irradiation_choices = (("AM1.5", "AM1.5"),
                        ("OG590", "OG590"),
                        ("BG7", "BG7"))
 
+
+class CellArray(object):
+    """Compact representation of the cells of a solarsimulator measurement.  It
+    is built with one query, and everything which depends on the values of all
+    cells – the best cell, statistics, the colours in the layout – is
+    calculated from it with NumPy.  Get it with
+    `SolarsimulatorMeasurement.get_cell_array`.
+
+    :ivar cells: the cell measurements
+    :ivar positions: the positions of the cells
+    :ivar eta: the efficiencies of the cells in %; ``NaN`` if unknown
+    :ivar isc: the short-circuit current densities of the cells in mA/cm²;
+      ``NaN`` if unknown
+    :ivar values: the characteristic values of the cells, i.e. η for AM1.5
+      measurements and Isc otherwise; ``NaN`` if unknown
+
+    :type cells: list of `SolarsimulatorCellMeasurement`
+    :type positions: list of unicode
+    :type eta: numpy.ndarray
+    :type isc: numpy.ndarray
+    :type values: numpy.ndarray
+    """
+
+    def __init__(self, measurement):
+        """
+        :param measurement: the solarsimulator measurement
+
+        :type measurement: `SolarsimulatorMeasurement`
+        """
+        self.cells = list(measurement.cells.all())
+        self.positions = [cell.position for cell in self.cells]
+        self.eta = numpy.array([numpy.nan if cell.eta is None else cell.eta for cell in self.cells], dtype=float)
+        self.isc = numpy.array([numpy.nan if cell.isc is None else cell.isc for cell in self.cells], dtype=float)
+        quantity = measurement.characteristic_quantities.get(measurement.irradiation)
+        self.values = getattr(self, quantity) if quantity else numpy.full(len(self.cells), numpy.nan)
+
+    def get_best_cell(self):
+        """Returns the cell with the highest characteristic value.
+
+        :return:
+          the best cell; ``None`` if no cell has a value
+
+        :rtype: `SolarsimulatorCellMeasurement` or NoneType
+        """
+        if numpy.isnan(self.values).all():
+            return None
+        return self.cells[numpy.nanargmax(self.values)]
+
+    def get_statistics(self, quantity):
+        """Returns statistics of a quantity over all cells.  Cells without value
+        are ignored.
+
+        :param quantity: the quantity; may be ``"eta"``, ``"isc"``, or
+            ``"values"`` for the characteristic values
+
+        :type quantity: str
+
+        :return:
+          the number of cells with value, and the maximal, the mean, and the
+          median value, with the keys ``"count"``, ``"max"``, ``"mean"``, and
+          ``"median"``; the values are ``None`` if there is no cell with value
+
+        :rtype: dict mapping str to int or float or NoneType
+        """
+        values = getattr(self, quantity)
+        values = values[~numpy.isnan(values)]
+        if not len(values):
+            return {"count": 0, "max": None, "mean": None, "median": None}
+        return {"count": len(values), "max": float(values.max()), "mean": float(values.mean()),
+                "median": float(numpy.median(values))}
+
+    def get_color_indices(self, thresholds):
+        """Bins the characteristic values of the cells.
+
+        :param thresholds: the ascending thresholds between the bins
+
+        :type thresholds: list of float
+
+        :return:
+          the index of the bin of each cell, i.e. the number of thresholds
+          which are smaller than the value of the cell; for cells without
+          value, the result is undefined
+
+        :rtype: numpy.ndarray
+        """
+        return numpy.searchsorted(thresholds, self.values)
+
+
 class SolarsimulatorMeasurement(PhysicalProcess):
     irradiation = models.CharField(_("irradiation"), max_length=10, choices=irradiation_choices)
     temperature = model_fields.DecimalQuantityField(_("temperature"), max_digits=3, decimal_places=1, unit="℃", default=25.0)
 
+    characteristic_quantities = {"AM1.5": "eta", "OG590": "isc", "BG7": "isc"}
+    """Maps the irradiation to the cell quantity which characterises the cells,
+    e.g. for finding the best cell.
+    """
+
     class Meta(PhysicalProcess.Meta):
         verbose_name = _("solarsimulator measurement")
         verbose_name_plural = _("solarsimulator measurements")
         permissions = generate_permissions({"add", "view_every", "edit_permissions"}, "SolarsimulatorMeasurement")
 
+    def get_cell_array(self):
+        """Returns the cells of this measurement as a `CellArray`.  It is
+        built only once per instance.
+
+        :return:
+          the cells of this measurement
+
+        :rtype: `CellArray`
+        """
+        try:
+            return self._cell_array
+        except AttributeError:
+            self._cell_array = CellArray(self)
+            return self._cell_array
+
     def get_context_for_user(self, user, old_context):
         context = old_context.copy()
         sample = self.samples.get()
@@ -146,9 +254,9 @@ class SolarsimulatorMeasurement(PhysicalProcess):
             layout = institute.layouts.get_layout(sample, self)
             context["shapes"] = layout.get_map_shapes() if layout else {}
         context["thumbnail_layout"] = django.core.urlresolvers.reverse(
-            "institute.views.samples.layout.show_layout", kwargs={"sample_id": sample.id, "process_id": self.id})
+            "layout_thumbnail", kwargs={"sample_id": sample.id, "process_id": self.id})
         if "cells" not in context:
-            context["cells"] = self.cells.all()
+            context["cells"] = self.get_cell_array().cells
         if "image_urls" not in context:
             context["image_urls"] = {}
             for cell in context["cells"]:
@@ -156,11 +264,8 @@ class SolarsimulatorMeasurement(PhysicalProcess):
                 _thumbnail, _figure = plot_locations["thumbnail_url"], plot_locations["plot_url"]
                 context["image_urls"][cell.position] = (_thumbnail, _figure)
         if "default_cell" not in context:
-            if self.irradiation == "AM1.5":
-                default_cell = sorted([(cell.eta, cell.position) for cell in context["cells"]], reverse=True)[0][1]
-            else:
-                default_cell = sorted([(cell.isc, cell.position) for cell in context["cells"]], reverse=True)[0][1]
-            context["default_cell"] = (default_cell,) + context["image_urls"][default_cell]
+            best_cell = self.get_cell_array().get_best_cell() or context["cells"][0]
+            context["default_cell"] = (best_cell.position,) + context["image_urls"][best_cell.position]
         return super(SolarsimulatorMeasurement, self).get_context_for_user(user, context)
 
     def get_data(self):
@@ -175,7 +280,7 @@ class SolarsimulatorMeasurement(PhysicalProcess):
     def get_data_for_table_export(self):
         # See `Process.get_data_for_table_export` for the documentation.
         data_node = super(SolarsimulatorMeasurement, self).get_data_for_table_export()
-        best_eta = self.cells.aggregate(models.Max("eta"))["eta__max"]
+        best_eta = self.get_cell_array().get_statistics("eta")["max"]
         data_node.items.append(DataItem(_("η of best cell") + "/%", jb_common.utils.base.round(best_eta, 3)))
         return data_node
 
@@ -209,6 +314,15 @@ class SolarsimulatorMeasurement(PhysicalProcess):
             return None
         return "{filename}_{position}".format(filename=related_cell.data_file, position=related_cell.position)
 
+    def get_plot_ids(self):
+        return list(self.cells.values_list("position", flat=True))
+
+    def get_plot_parameters(self, plot_id):
+        try:
+            return self.cells.get(position=plot_id).area
+        except SolarsimulatorCellMeasurement.DoesNotExist:
+            return None
+
     @classmethod
     def get_search_tree_node(cls):
         """Class method for generating the search tree node for this model
@@ -29,7 +29,7 @@ from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 from django.utils.encoding import python_2_unicode_compatible
 
-import os.path
+import os
 from django.utils.translation import ugettext_lazy as _, ugettext, pgettext_lazy
 from django.conf import settings
 from django.db import models
@@ -42,6 +42,7 @@ from jb_common import search, model_fields
 import jb_common.utils.base
 from samples.data_tree import DataNode, DataItem
 import samples.models
+from institute import informal_stacks
 
 
 @python_2_unicode_compatible
@@ -112,6 +113,55 @@ class SampleDetails(models.Model):
         """
         return self.informal_layers.filter(verified=True).exists()
 
+    def is_stack_diagram_outdated(self, thumbnail, sample_timestamp=None):
+        """Returns whether the stack diagram file is missing or older than the
+        last modification of the sample.
+
+        :param thumbnail: whether the PNG thumbnail rather than the PDF is meant
+        :param sample_timestamp: the last modification of the sample; if not
+            given, it is taken from ``self.sample``
+
+        :type thumbnail: bool
+        :type sample_timestamp: datetime.datetime
+
+        :return:
+          whether the stack diagram file must be generated
+
+        :rtype: bool
+        """
+        filepath = self.get_stack_diagram_locations()["thumbnail_file" if thumbnail else "diagram_file"]
+        return jb_common.utils.base.is_update_necessary(filepath, timestamps=[sample_timestamp or self.sample.last_modified])
+
+    def generate_stack_diagram(self, thumbnail):
+        """Generates the stack diagram file if it is outdated.  The file is
+        written atomically because it may be requested concurrently.  The
+        thumbnail is rendered directly, without the PDF.  You should check
+        `has_producible_stack_diagram` before.
+
+        :param thumbnail: whether the PNG thumbnail rather than the PDF should be
+            generated
+
+        :type thumbnail: bool
+
+        :return:
+          whether the file was generated
+
+        :rtype: bool
+        """
+        if not self.is_stack_diagram_outdated(thumbnail):
+            return False
+        filepath = self.get_stack_diagram_locations()["thumbnail_file" if thumbnail else "diagram_file"]
+        jb_common.utils.base.mkdirs(filepath)
+        temporary_filepath = "{0}.{1}.tmp".format(filepath, os.getpid())
+        layers = [informal_stacks.Layer(layer) for layer in self.informal_layers.all()]
+        if thumbnail:
+            informal_stacks.generate_thumbnail(temporary_filepath, layers)
+        else:
+            informal_stacks.generate_diagram(temporary_filepath, layers, six.text_type(self.sample),
+                                             ugettext("Layer stack of {0}").format(self.sample))
+        os.rename(temporary_filepath, filepath)
+        return True
+
     def get_context_for_user(self, user, old_context):
         """Create the context dict for these sample details, or fill missing
         fields, or adapt existing fields to the given user.  Note that adaption
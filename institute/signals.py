@@ -39,6 +39,7 @@ from jb_common.signals import maintain
 import jb_common.utils.base as utils
 from samples.models import Result, PhysicalProcess, Sample, SampleAlias
 from institute import models as institute_app
+from institute import layouts
 
 
 @receiver(signals.pre_save)
@@ -182,6 +183,46 @@ def update_informal_layers(sender, instance, created, **kwargs):
                     layer.save(with_relations=False)
 
 
+@receiver(signals.post_save, sender=institute_app.Structuring)
+@receiver(signals.pre_delete, sender=institute_app.Structuring)
+def expire_structuring_timelines(sender, instance, **kwargs):
+    """Expires the cached structuring timelines of the samples of a structuring
+    which is saved or deleted, see
+    :py:func:`institute.layouts.get_structuring_timelines`.
+    """
+    if not kwargs.get("raw"):
+        layouts.expire_structuring_timelines(instance.samples.values_list("id", flat=True))
+
+
+@receiver(signals.m2m_changed, sender=Sample.processes.through)
+def expire_structuring_timelines_of_samples(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Expires the cached structuring timelines of samples which are added to
+    or removed from a structuring, see
+    :py:func:`institute.layouts.get_structuring_timelines`.
+    """
+    if action not in ["pre_clear", "post_add", "post_remove"]:
+        return
+    if reverse:
+        # `instance` is a process
+        if isinstance(instance, institute_app.Structuring):
+            sample_ids = set(instance.samples.values_list("id", flat=True))
+            if action != "pre_clear":
+                sample_ids.update(pk_set)
+            layouts.expire_structuring_timelines(sample_ids)
+    else:
+        # `instance` is a sample
+        layouts.expire_structuring_timelines([instance.id])
+
+
+@receiver(maintain)
+def update_cell_color_thresholds(sender, **kwargs):
+    """Derives the colour thresholds of the cell layouts of solarsimulator
+    measurements from all measured cells, see
+    :py:func:`institute.layouts.update_cell_color_thresholds`.
+    """
+    layouts.update_cell_color_thresholds()
+
+
 @receiver(maintain)
 def clear_structuring_processes(sender, **kwargs):
     """Function to delete duplicated structuring processes.
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+from importlib import import_module
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.conf import settings
+from django.contrib.auth.models import User, Permission
+from jb_common.models import LoginSession
+from jb_common.auth import LDAPConnection
+
+
+class StandInLDAPConnection(LDAPConnection):
+    """LDAP connection which doesn't contact any server.  Instead, the AD
+    datasets of all accounts are given to the constructor.  If they are
+    ``None``, the AD is considered unreachable.
+    """
+
+    def __init__(self, ad_data):
+        super(StandInLDAPConnection, self).__init__()
+        self.stand_in_ad_data = ad_data
+
+    def fetch_all_ad_data(self, page_size=500):
+        if self.stand_in_ad_data is None:
+            return False
+        self.cached_ad_data = self.stand_in_ad_data
+        self.ad_data_complete = True
+        return True
+
+
+@override_settings(LDAP_GROUPS_TO_PERMISSIONS={"Sample managers": {"adopt_samples", "rename_samples"},
+                                               "Topic managers": {"add_topic"}})
+class SynchronizeAllWithADTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        self.present_user = User.objects.create(username="ad.present")
+        self.vanished_user = User.objects.create(username="ad.vanished")
+        for user in (self.present_user, self.vanished_user):
+            user.set_unusable_password()
+            user.save()
+        self.permissions = dict((codename, Permission.objects.get(codename=codename))
+                                for codename in ["adopt_samples", "rename_samples", "add_topic", "view_every_sample"])
+        self.present_user.user_permissions.add(self.permissions["adopt_samples"], self.permissions["add_topic"],
+                                               self.permissions["view_every_sample"])
+        self.vanished_user.user_permissions.add(self.permissions["view_every_sample"])
+        self.session_store = import_module(settings.SESSION_ENGINE).SessionStore()
+        self.session_store.create()
+        LoginSession.objects.create(session_key=self.session_store.session_key, user=self.vanished_user)
+        self.ad_data = {"ad.present": {"givenName": [b"Present"], "sn": [b"User"], "mail": [b"present@example.com"],
+                                       "memberOf": [b"CN=Sample managers,OU=Groups,DC=example,DC=com"]}}
+
+    def synchronize(self, ad_data):
+        users = User.objects.filter(pk__in=[self.present_user.pk, self.vanished_user.pk]). \
+                select_related("jb_user_details")
+        return StandInLDAPConnection(ad_data).synchronize_all_with_ad(users)
+
+    def get_permission_codenames(self, user):
+        return set(user.user_permissions.values_list("codename", flat=True))
+
+    def test_synchronization(self):
+        """Checks that users found in the AD get their data and the managed
+        permissions of their AD groups, whereas users not found anymore are
+        deactivated and logged out.
+        """
+        self.assertTrue(self.synchronize(self.ad_data))
+        present_user = User.objects.get(pk=self.present_user.pk)
+        self.assertTrue(present_user.is_active)
+        self.assertEqual((present_user.first_name, present_user.last_name, present_user.email),
+                         ("Present", "User", "present@example.com"))
+        self.assertEqual(self.get_permission_codenames(present_user),
+                         {"adopt_samples", "rename_samples", "view_every_sample"})
+        vanished_user = User.objects.get(pk=self.vanished_user.pk)
+        self.assertFalse(vanished_user.is_active)
+        self.assertEqual(self.get_permission_codenames(vanished_user), set())
+        self.assertFalse(LoginSession.objects.filter(user=vanished_user).exists())
+        self.assertFalse(self.session_store.exists(self.session_store.session_key))
+
+    def test_unreachable_ad(self):
+        """Checks that nothing is changed if the AD cannot be read.
+        """
+        self.assertFalse(self.synchronize(None))
+        for user in (self.present_user, self.vanished_user):
+            self.assertTrue(User.objects.get(pk=user.pk).is_active)
+        self.assertEqual(self.get_permission_codenames(self.present_user),
+                         {"adopt_samples", "add_topic", "view_every_sample"})
+        self.assertEqual(self.get_permission_codenames(self.vanished_user), {"view_every_sample"})
+        self.assertTrue(LoginSession.objects.filter(user=self.vanished_user).exists())
+        self.assertTrue(self.session_store.exists(self.session_store.session_key))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import, unicode_literals
+
+from django.test import TestCase
+from django.contrib.auth.models import User, Permission
+from jb_common.models import Department, Topic
+from samples import permissions
+from samples.models import Sample
+
+
+class FullyViewableSamplesTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        department = Department.objects.get(name="INM")
+        self.users = []
+        for username, user_department in (("inm.user", department), ("no.department", None)):
+            for view_every_sample in (False, True):
+                user = User.objects.create(username="{0}.{1}".format(username, int(view_every_sample)))
+                user.jb_user_details.department = user_department
+                user.jb_user_details.save()
+                if view_every_sample:
+                    user.user_permissions.add(Permission.objects.get(codename="view_every_sample"))
+                self.users.append(user)
+        responsible_without_department = User.objects.create(username="responsible.no.department")
+        responsible_with_department = User.objects.create(username="responsible.inm")
+        responsible_with_department.jb_user_details.department = department
+        responsible_with_department.jb_user_details.save()
+        topic = Topic.objects.create(name="Permission test topic", department=department, manager=self.users[0])
+        confidential_topic = Topic.objects.create(name="Confidential permission test topic", department=department,
+                                                  manager=self.users[0], confidential=True)
+        topic.members.add(self.users[0])
+        for i, (responsible_person, sample_topic) in enumerate(
+                (responsible_person, sample_topic)
+                for responsible_person in (responsible_without_department, responsible_with_department, self.users[2])
+                for sample_topic in (None, topic, confidential_topic)):
+            Sample.objects.create(name="permission-test-{0}".format(i), current_location="lab",
+                                  currently_responsible_person=responsible_person, topic=sample_topic)
+
+    def test_filter_matches_assertion(self):
+        """Checks that the database filter for fully viewable samples agrees
+        with `assert_can_fully_view_sample`, in particular for users without
+        department.
+        """
+        samples = Sample.objects.all()
+        for user in self.users:
+            user = User.objects.get(pk=user.pk)
+            expected = set()
+            for sample in samples:
+                try:
+                    permissions.assert_can_fully_view_sample(user, sample)
+                except permissions.PermissionError:
+                    pass
+                else:
+                    expected.add(sample.pk)
+            self.assertEqual(set(permissions.filter_viewable_samples(user, samples).values_list("pk", flat=True)),
+                             expected, user.username)
@@ -39,6 +39,7 @@ from __future__ import absolute_import, unicode_literals
 from django.conf.urls import url
 from django.views.generic import TemplateView
 from samples.utils.urls import PatternGenerator
+from samples.utils.views import bulk_submittable
 from institute.views.samples import sample, claim, stack, layout, json_client, substrate, structuring
 
 
@@ -51,7 +52,8 @@ urlpatterns = [
     url(r"^stacks/(?P<sample_id>\d+)$", stack.show_stack, {"thumbnail": False}, "stack_diagram"),
     url(r"^stacks/thumbnails/(?P<sample_id>\d+)$", stack.show_stack, {"thumbnail": True},
         "stack_diagram_thumbnail"),
-    url(r"layouts/(?P<sample_id>\d+)/(?P<process_id>\d+)$", layout.show_layout),
+    url(r"^layouts/(?P<sample_id>\d+)/(?P<process_id>\d+)$", layout.show_layout, {"thumbnail": True}, "layout_thumbnail"),
+    url(r"^layouts/(?P<sample_id>\d+)/(?P<process_id>\d+)\.pdf$", layout.show_layout, {"thumbnail": False}, "layout"),
     url(r"^printer_label/(?P<sample_id>\d+)$", sample.printer_label),
     url(r"^trac/", TemplateView.as_view(template_name="bug_tracker.html")),
 
@@ -68,8 +70,8 @@ urlpatterns = [
     # I don't add the following two with the pattern generator in order to
     # prevent an “add” link on the main menu page; they are used only by the
     # remote client.
-    url(r"^substrates/add/$", substrate.EditView.as_view(), {"substrate_id": None}),
-    url(r"^structurings/add/$", structuring.EditView.as_view(), {"structuring_id": None}),
+    url(r"^substrates/add/$", bulk_submittable(substrate.EditView.as_view()), {"substrate_id": None}),
+    url(r"^structurings/add/$", bulk_submittable(structuring.EditView.as_view()), {"structuring_id": None}),
 ]
 
 
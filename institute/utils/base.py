@@ -22,12 +22,10 @@
 
 
 from __future__ import absolute_import, unicode_literals, division
-from django.utils.six.moves import cStringIO as StringIO
 
 import datetime, re
-import numpy
 from samples import models
-from samples.utils.plots import PlotError
+from samples.utils.plots import PlotError, find_line, parse_table, select_columns, read_table_cached
 from institute.views.samples import json_client
 
 
@@ -95,27 +93,24 @@ def read_solarsimulator_plot_file(filename, position):
     :return:
       all voltages in Volt, then all currents in Ampere
 
-    :rtype: list of float, list of float
+    :rtype: ``numpy.ndarray``, ``numpy.ndarray``
 
     :raises PlotError: if something wents wrong with interpreting the file (I/O,
         unparseble data)
     """
-    try:
-        datafile_content = StringIO(open(filename).read())
-    except IOError:
-        raise PlotError("Data file could not be read.")
-    for line in datafile_content:
-        if line.startswith("# Positions:"):
-            positions = line.partition(":")[2].split()
-            break
-    else:
-        positions = []
+    def read_table(content):
+        positions_line = find_line(content, "# Positions:")
+        if positions_line:
+            positions = content[slice(*positions_line)].decode("cp1252").partition(":")[2].split()
+        else:
+            positions = []
+        return parse_table(content[:], comments="#"), positions
+    table, positions = read_table_cached(filename, ["solarsimulator"], read_table, with_metadata=True)
     try:
         column = positions.index(position) + 1
     except ValueError:
         raise PlotError("Cell position not found in the datafile.")
-    datafile_content.seek(0)
     try:
-        return numpy.loadtxt(datafile_content, usecols=(0, column), unpack=True)
-    except ValueError:
+        return select_columns(table, (0, column))
+    except PlotError:
         raise PlotError("Data file format was invalid.")
@@ -60,10 +60,8 @@ def get_substrates(sample):
 
     :rtype: list of `institute.models.Substrate`
     """
-    substrates = list(institute.models.Substrate.objects.filter(samples=sample))
-    if sample.split_origin:
-        substrates = get_substrates(sample.split_origin.parent) + substrates
-    return substrates
+    sample_ids = [sample.id] + list(sample.ancestor_links.values_list("ancestor_id", flat=True))
+    return list(institute.models.Substrate.objects.filter(samples__in=sample_ids).distinct().order_by("timestamp"))
 
 
 def get_substrate(sample):
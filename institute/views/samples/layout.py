@@ -21,36 +21,138 @@
 # this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-# FixMe: Layout files should be taken from cache if appropriate.
+"""Views for showing the structuring layout of a sample, e.g. the cell layout
+of a solarsimulator measurement.
+"""
 
 from __future__ import unicode_literals, absolute_import, division
+import django.utils.six as six
 
-import os.path, subprocess
-from django.conf import settings
+import hashlib, os.path
 from django.contrib.auth.decorators import login_required
 from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.template import defaultfilters
+from django.views.decorators.http import condition
 import jb_common.utils.base
+from jb_common.utils.base import adjust_timezone_information
+from jb_common.signals import storage_changed
+from samples import permissions
 import samples.utils.views as utils
 from institute import models
 from institute import layouts
 
 
+def embed_layout(request, process_id, sample_id):
+    """Put the layout object in the request object that is used by
+    `layout_timestamp`, `layout_etag`, and `show_layout`.  This also checks
+    the permissions, so that the conditional view processing can't reveal
+    anything.
+
+    :param request: the current HTTP Request object
+    :param process_id: the database ID of the process
+    :param sample_id: the database ID of the sample
+
+    :type request: HttpRequest
+    :type process_id: unicode
+    :type sample_id: unicode
+
+    :raises Http404: if the sample or the process doesn't exist, or if there is
+        no layout for them
+    :raises PermissionError: if the user must not view the process
+    """
+    if not hasattr(request, "_layout"):
+        sample = get_object_or_404(models.Sample, pk=utils.convert_id_to_int(sample_id))
+        process = get_object_or_404(models.Process, pk=utils.convert_id_to_int(process_id)).actual_instance
+        permissions.assert_can_view_physical_process(request.user, process)
+        if not process.samples.filter(pk=sample.pk).exists():
+            raise Http404("The sample was not processed by this process.")
+        layout = layouts.get_layout(sample, process)
+        if not layout:
+            raise Http404("No layout available.")
+        request._layout = layout
+
+
+def layout_timestamp(request, process_id, sample_id, thumbnail):
+    """Calculate the timestamp of a layout.  This is the last modification of
+    either the process or the structuring the layout is taken from.
+
+    :param request: the current HTTP Request object
+    :param process_id: the database ID of the process
+    :param sample_id: the database ID of the sample
+    :param thumbnail: whether the thumbnail is requested
+
+    :type request: HttpRequest
+    :type process_id: unicode
+    :type sample_id: unicode
+    :type thumbnail: bool
+
+    :return:
+      the timestamp of the last modification of the layout
+
+    :rtype: datetime.datetime
+    """
+    embed_layout(request, process_id, sample_id)
+    return adjust_timezone_information(max(request._layout.process.last_modified,
+                                           request._layout.structuring.last_modified))
+
+
+def layout_etag(request, process_id, sample_id, thumbnail):
+    """Calculate an ETag for the layout.  It is derived from the cache key of
+    the layout and the primary key of the current user.  See
+    :py:func:`samples.views.sample.sample_etag` for the reason why the user is
+    included.
+
+    :param request: the current HTTP Request object
+    :param process_id: the database ID of the process
+    :param sample_id: the database ID of the sample
+    :param thumbnail: whether the thumbnail is requested
+
+    :type request: HttpRequest
+    :type process_id: unicode
+    :type sample_id: unicode
+    :type thumbnail: bool
+
+    :return:
+      the ETag of the layout
+
+    :rtype: str
+    """
+    embed_layout(request, process_id, sample_id)
+    hash_ = hashlib.sha1()
+    hash_.update(request._layout.get_cache_key().encode("utf-8"))
+    hash_.update(str(request.user.pk).encode("utf-8"))
+    hash_.update(b"png" if thumbnail else b"pdf")
+    return hash_.hexdigest()
+
+
 @login_required
-def show_layout(request, process_id, sample_id):
-    sample = get_object_or_404(models.Sample, pk=utils.convert_id_to_int(sample_id))
-    process = get_object_or_404(models.Process, pk=utils.convert_id_to_int(process_id)).actual_instance
-
-    pdf_filename = "/tmp/layouts_{0}_{1}.pdf".format(process.id, sample.id)
-    jb_common.utils.base.mkdirs(pdf_filename)
-    layout = layouts.get_layout(sample, process)
-    if not layout:
-        raise Http404("error")
-    layout.generate_pdf(pdf_filename)
-
-    png_filename = os.path.join(settings.CACHE_ROOT, "layouts", "{0}-{1}.png".format(process.id, sample.id))
-    jb_common.utils.base.mkdirs(png_filename)
-    resolution = settings.THUMBNAIL_WIDTH / (layout.width / 72)
-    subprocess.check_call(["gs", "-q", "-dNOPAUSE", "-dBATCH", "-sDEVICE=pngalpha", "-r{0}".format(resolution), "-dEPSCrop",
-                             "-sOutputFile=" + png_filename, pdf_filename])
-    return jb_common.utils.base.static_file_response(png_filename)
+@condition(layout_etag, layout_timestamp)
+def show_layout(request, process_id, sample_id, thumbnail):
+    """Shows the layout of a sample as it was at the time of the given process.
+    The layout files are taken from the cache in ``CACHE_ROOT/layouts`` if
+    possible.
+
+    :param request: the current HTTP Request object
+    :param process_id: the database ID of the process
+    :param sample_id: the database ID of the sample
+    :param thumbnail: whether we serve a PNG thumbnail instead of a PDF
+
+    :type request: HttpRequest
+    :type process_id: unicode
+    :type sample_id: unicode
+    :type thumbnail: bool
+
+    :return:
+      the HTTP response object with the image
+
+    :rtype: HttpResponse
+    """
+    embed_layout(request, process_id, sample_id)
+    layout = request._layout
+    filepath = layout.get_filepath(thumbnail)
+    if not os.path.exists(filepath):
+        layout.generate_file(thumbnail)
+        storage_changed.send(models.Process)
+    return jb_common.utils.base.static_file_response(
+        filepath, None if thumbnail else "{0}_layout.pdf".format(defaultfilters.slugify(six.text_type(layout.sample))))
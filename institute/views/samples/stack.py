@@ -27,17 +27,15 @@
 from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 
-import subprocess
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.template import defaultfilters
-from django.utils.translation import ugettext as _
 import jb_common.utils.base
 from jb_common.signals import storage_changed
 from samples import permissions
 import samples.utils.views as utils
-from institute import models, informal_stacks
+from institute import models
 
 
 @login_required
@@ -64,18 +62,9 @@ def show_stack(request, sample_id, thumbnail):
     permissions.get_sample_clearance(request.user, sample)
     if not sample_details.has_producible_stack_diagram():
         raise Http404("No stack diagram available.")
+    if sample_details.generate_stack_diagram(thumbnail):
+        storage_changed.send(models.SampleDetails)
     locations = sample_details.get_stack_diagram_locations()
     filepath = locations["thumbnail_file" if thumbnail else "diagram_file"]
-    if jb_common.utils.base.is_update_necessary(filepath, timestamps=[sample.last_modified]):
-        jb_common.utils.base.mkdirs(filepath)
-        if not thumbnail or jb_common.utils.base.is_update_necessary(locations["diagram_file"], timestamps=[sample.last_modified]):
-            jb_common.utils.base.mkdirs(locations["diagram_file"])
-            informal_stacks.generate_diagram(
-                locations["diagram_file"], [informal_stacks.Layer(layer) for layer in sample_details.informal_layers.all()],
-                six.text_type(sample), _("Layer stack of {0}").format(sample))
-        if thumbnail:
-            subprocess.call(["gs", "-q", "-dNOPAUSE", "-dBATCH", "-sDEVICE=pngalpha", "-r100", "-dEPSCrop",
-                             "-sOutputFile=" + locations["thumbnail_file"], locations["diagram_file"]])
-        storage_changed.send(models.SampleDetails)
     return jb_common.utils.base.static_file_response(
         filepath, None if thumbnail else "{0}_stack.pdf".format(defaultfilters.slugify(six.text_type(sample))))
@@ -27,8 +27,10 @@ set somewhere else because they are not stored in the AD.
 
 Every night the maintenance routine checks which active users cannot be found
 anymore in the AD, sets them to inactive and removes all their groups, topics,
-and permissions.  See the :py:meth:`~LDAPConnection.synchronize_with_ad`
-function.
+and permissions.  For this, all accounts are fetched from the AD at once, see
+the :py:meth:`~LDAPConnection.synchronize_all_with_ad` method.  The sessions of
+the deactivated users are purged with the help of
+:py:class:`jb_common.models.LoginSession`.
 
 A seldom but possible problem is if someone tries to login, he is known in the
 AD, but it also known in JuliaBase as “inactive”.  This can mean one of two
@@ -47,13 +49,15 @@ Portions of this module are inspired by
 
 from __future__ import absolute_import, unicode_literals
 
-import datetime
+from collections import defaultdict
+from importlib import import_module
 from django.contrib.auth.models import User, Permission
-from django.contrib.sessions.models import Session
 from django.conf import settings
 from django.core.mail import mail_admins
+from django.db.models import signals
 import ldap
-from jb_common.models import Department
+from ldap.controls import SimplePagedResultsControl
+from jb_common.models import Department, LoginSession
 from jb_common.signals import maintain
 from django.dispatch import receiver
 
@@ -94,6 +98,39 @@ then change the former collegue's login name.
             return None
 
 
+def purge_sessions(users):
+    """Deletes all sessions of the given users, so that they are logged out
+    immediately.  The sessions are looked up in the index
+    :py:class:`jb_common.models.LoginSession`, so that not every session needs
+    to be decoded.
+
+    :param users: the users whose sessions should be deleted
+
+    :type users: iterable of django.contrib.auth.models.User
+    """
+    session_store = import_module(settings.SESSION_ENGINE).SessionStore()
+    login_sessions = LoginSession.objects.filter(user__in=users)
+    for session_key in login_sessions.values_list("session_key", flat=True):
+        session_store.delete(session_key)
+    login_sessions.delete()
+
+
+def deactivate_user(user):
+    """Sets the user to inactive, clears all their groups, topic memberships,
+    and permissions, and purges their sessions.
+
+    :param user: the user to be deactivated
+
+    :type user: django.contrib.auth.models.User
+    """
+    user.is_active = user.is_staff = user.is_superuser = False
+    user.save()
+    user.groups.clear()
+    user.topics.clear()
+    user.user_permissions.clear()
+    purge_sessions([user])
+
+
 class LDAPConnection(object):
     """Class with represents an LDAP connection.  It creates and stores the
     connection instance itself and configures it.
@@ -104,13 +141,20 @@ class LDAPConnection(object):
     of the login or the nightly maintenance process.
     """
 
+    ad_attributes = {b"mail", b"givenName", b"sn", b"department", b"memberOf"}.union(
+        settings.LDAP_ADDITIONAL_ATTRIBUTES)
+    """Attributes fetched from the AD for every user."""
+
     def __init__(self):
         self.cached_ad_data = {}
-        self.permissions_of_ad_groups = dict(
-            (ad_groupname, set(Permission.objects.filter(codename__in=permission_codenames)))
+        self.ad_data_complete = False
+        self.permission_ids_of_ad_groups = dict(
+            (ad_groupname, set(Permission.objects.filter(codename__in=permission_codenames).values_list("id", flat=True)))
             for ad_groupname, permission_codenames in settings.LDAP_GROUPS_TO_PERMISSIONS.items())
         managed_permissions_codenames = set().union(*settings.LDAP_GROUPS_TO_PERMISSIONS.values())
-        self.managed_permissions = set(Permission.objects.filter(codename__in=managed_permissions_codenames))
+        self.managed_permission_ids = set(Permission.objects.filter(codename__in=managed_permissions_codenames).
+                                          values_list("id", flat=True))
+        self.departments = {}
 
     def is_valid(self, username, password):
         """Returns whether the username/password combination is known in the AD, and
@@ -146,6 +190,54 @@ class LDAPConnection(object):
             mail_admins("JuliaBase LDAP error", message=latest_error.message["desc"])
             return False
 
+    def fetch_all_ad_data(self, page_size=500):
+        """Fetches the datasets of all accounts in the Active Directory with
+        one paged search and caches them.  Afterwards, :py:meth:`get_ad_data`
+        doesn't contact the AD anymore, and users not found are considered to
+        be not in the AD.  Like for single users, the servers in
+        ``LDAP_URLS`` are tried one after the other.
+
+        :param page_size: the maximal number of accounts fetched with one
+            request to the server
+
+        :type page_size: int
+
+        :return:
+          whether the datasets could be fetched; if not, the admins have been
+          notified by email
+
+        :rtype: bool
+        """
+        for ad_ldap_url in settings.LDAP_URLS:
+            connection = ldap.initialize(ad_ldap_url)
+            connection.set_option(ldap.OPT_REFERRALS, 0)
+            page_control = SimplePagedResultsControl(True, size=page_size, cookie="")
+            ad_data = {}
+            try:
+                while True:
+                    message_id = connection.search_ext(
+                        settings.LDAP_SEARCH_DN, ldap.SCOPE_SUBTREE,
+                        "(&(sAMAccountName=*){0})".format(settings.LDAP_ACCOUNT_FILTER),
+                        list(self.ad_attributes | {b"sAMAccountName"}), serverctrls=[page_control])
+                    __, results, __, server_controls = connection.result3(message_id)
+                    for dn, attributes in results:
+                        # Referrals come with a DN of ``None``.
+                        if dn:
+                            ad_data[attributes["sAMAccountName"][0].decode("utf-8").lower()] = attributes
+                    page_control.cookie = next((control.cookie for control in server_controls
+                                                if control.controlType == SimplePagedResultsControl.controlType), None)
+                    if not page_control.cookie:
+                        break
+            except ldap.LDAPError as e:
+                latest_error = e
+                continue
+            self.cached_ad_data = ad_data
+            self.ad_data_complete = True
+            return True
+        else:
+            mail_admins("JuliaBase LDAP error", message=latest_error.message["desc"])
+            return False
+
     def get_ad_data(self, username):
         """Returns the dataset of the given user from the Active Directory.
 
@@ -162,6 +254,8 @@ class LDAPConnection(object):
         try:
             ad_data = self.cached_ad_data[username]
         except KeyError:
+            if self.ad_data_complete:
+                return None
             found = False
             for ad_ldap_url in settings.LDAP_URLS:
                 connection = ldap.initialize(ad_ldap_url)
@@ -170,8 +264,7 @@ class LDAPConnection(object):
                     found, attributes = connection.search_ext_s(
                         settings.LDAP_SEARCH_DN, ldap.SCOPE_SUBTREE,
                         "(&(sAMAccountName={0}){1})".format(username, settings.LDAP_ACCOUNT_FILTER),
-                        list({b"mail", b"givenName", b"sn", b"department", b"memberOf"}.union(
-                            settings.LDAP_ADDITIONAL_ATTRIBUTES)))[0][:2]
+                        list(self.ad_attributes))[0][:2]
                 except ldap.LDAPError as e:
                     if settings.LDAP_URLS.index(ad_ldap_url) + 1 == len(settings.LDAP_URLS):
                         mail_admins("JuliaBase LDAP error", message=e.message["desc"])
@@ -230,6 +323,80 @@ class LDAPConnection(object):
                     break
         return group_common_names
 
+    def get_department(self, name):
+        """Returns the JuliaBase department with the given name.  The
+        departments are cached in the instance.
+
+        :param name: the name of the department
+
+        :type name: unicode
+
+        :return:
+          the department
+
+        :rtype: `jb_common.models.Department`
+        """
+        try:
+            return self.departments[name]
+        except KeyError:
+            department = self.departments[name] = Department.objects.get(name=name)
+            return department
+
+    def update_user_data(self, user, attributes):
+        """Copies name, email address, and department from the AD dataset of a
+        user to the user instance and their JuliaBase user details.  Nothing is
+        saved.
+
+        :param user: the user whose data should be updated
+        :param attributes: the dataset of the user in the AD
+
+        :type user: django.contrib.auth.models.User
+        :type attributes: dict mapping str to list of str
+
+        :return:
+          whether the user instance was changed, whether the user details were
+          changed
+
+        :rtype: bool, bool
+        """
+        old_user_data = (user.first_name, user.last_name, user.email)
+        old_department_id = user.jb_user_details.department_id
+        if "givenName" in attributes:
+            user.first_name = attributes["givenName"][0].decode("utf-8")
+        if "sn" in attributes:
+            user.last_name = attributes["sn"][0].decode("utf-8")
+        if "mail" in attributes:
+            user.email = attributes["mail"][0].decode("utf-8")
+        jb_department_name = settings.LDAP_ADDITIONAL_USERS.get(user.username)
+        if not jb_department_name and "department" in attributes:
+            jb_department_name = settings.LDAP_DEPARTMENTS.get(attributes["department"][0].decode("utf-8"))
+        if jb_department_name:
+            user.jb_user_details.department = self.get_department(jb_department_name)
+        return (user.first_name, user.last_name, user.email) != old_user_data, \
+            user.jb_user_details.department_id != old_department_id
+
+    def get_permission_ids(self, attributes, old_permission_ids):
+        """Returns the IDs of the permissions a user should have according to
+        the groups they are a member of in the AD.  Permissions which are not
+        managed by the AD are left untouched.
+
+        :param attributes: the dataset of the user in the AD
+        :param old_permission_ids: the IDs of the current permissions of the
+            user
+
+        :type attributes: dict mapping str to list of str
+        :type old_permission_ids: set of int
+
+        :return:
+          the IDs of the new permissions of the user
+
+        :rtype: set of int
+        """
+        permission_ids = old_permission_ids - self.managed_permission_ids
+        for group in self.get_group_names(attributes):
+            permission_ids |= self.permission_ids_of_ad_groups.get(group, set())
+        return permission_ids
+
     def synchronize_with_ad(self, user):
         """Update Django's dataset about a user according to the data found
         in the Active Directory.  This includes user permissions, which are
@@ -255,35 +422,78 @@ class LDAPConnection(object):
         user.set_unusable_password()
         if self.is_eligible_ldap_member(user.username):
             attributes = self.get_ad_data(user.username)
-            if "givenName" in attributes:
-                user.first_name = attributes["givenName"][0].decode("utf-8")
-            if "sn" in attributes:
-                user.last_name = attributes["sn"][0].decode("utf-8")
-            if "department" in attributes:
-                jb_department_name = settings.LDAP_DEPARTMENTS[attributes["department"][0].decode("utf-8")]
-                try:
-                    user.jb_user_details.department = settings.LDAP_ADDITIONAL_USERS[user.username]
-                except KeyError:
-                    user.jb_user_details.department = Department.objects.get(name=jb_department_name)
-            user.email = attributes["mail"][0]
+            self.update_user_data(user, attributes)
             user.jb_user_details.save()
             user.save()
 
-            old_permissions = set(user.user_permissions.all())
-            permissions = old_permissions - self.managed_permissions
-            for group in self.get_group_names(attributes):
-                permissions |= self.permissions_of_ad_groups.get(group, set())
-            if permissions != old_permissions:
-                user.user_permissions = permissions
+            old_permission_ids = set(user.user_permissions.values_list("id", flat=True))
+            permission_ids = self.get_permission_ids(attributes, old_permission_ids)
+            if permission_ids != old_permission_ids:
+                user.user_permissions = permission_ids
         else:
-            user.is_active = user.is_staff = user.is_superuser = False
-            user.save()
-            user.groups.clear()
-            user.topics.clear()
-            user.user_permissions.clear()
-            for session in Session.objects.filter(expire_date__gte=datetime.datetime.now()).iterator():
-                if session.get_decoded().get("_auth_user_id") == user.id:
-                    session.delete()
+            deactivate_user(user)
+
+    def synchronize_all_with_ad(self, users):
+        """Bulk version of :py:meth:`synchronize_with_ad`.  All accounts are
+        fetched from the AD with :py:meth:`fetch_all_ad_data` and compared with
+        the given users in memory.  Only users and user details which have
+        actually changed are saved, and the permissions of all users are read
+        and written with a few bulk queries.  If the AD cannot be read, nothing
+        is changed, so that a server outage doesn't deactivate everyone.
+
+        Since the bulk writes bypass the many-to-many manager, the
+        ``m2m_changed`` signal is sent explicitly for every user whose
+        permissions have changed.
+
+        :param users: the users whose data should be updated; they should be
+            fetched with their ``jb_user_details``
+
+        :type users: iterable of django.contrib.auth.models.User
+
+        :return:
+          whether the synchronisation took place
+
+        :rtype: bool
+        """
+        if not self.fetch_all_ad_data():
+            return False
+        users = list(users)
+        through_model = User.user_permissions.through
+        old_permission_ids = defaultdict(set)
+        for user_id, permission_id in through_model.objects.filter(user__in=users). \
+                values_list("user_id", "permission_id").iterator():
+            old_permission_ids[user_id].add(permission_id)
+        added_permission_ids, removed_permission_ids = {}, {}
+        for user in users:
+            if self.is_eligible_ldap_member(user.username):
+                attributes = self.get_ad_data(user.username)
+                user_changed, user_details_changed = self.update_user_data(user, attributes)
+                if user_details_changed:
+                    user.jb_user_details.save()
+                if user_changed:
+                    user.save()
+                permission_ids = self.get_permission_ids(attributes, old_permission_ids[user.id])
+                if permission_ids - old_permission_ids[user.id]:
+                    added_permission_ids[user] = permission_ids - old_permission_ids[user.id]
+                if old_permission_ids[user.id] - permission_ids:
+                    removed_permission_ids[user] = old_permission_ids[user.id] - permission_ids
+            else:
+                deactivate_user(user)
+        through_model.objects.bulk_create(through_model(user_id=user.id, permission_id=permission_id)
+                                          for user, permission_ids in added_permission_ids.items()
+                                          for permission_id in permission_ids)
+        user_ids_by_removed_permission_id = defaultdict(set)
+        for user, permission_ids in removed_permission_ids.items():
+            for permission_id in permission_ids:
+                user_ids_by_removed_permission_id[permission_id].add(user.id)
+        for permission_id, user_ids in user_ids_by_removed_permission_id.items():
+            through_model.objects.filter(permission_id=permission_id, user_id__in=user_ids).delete()
+        for action, changed_permission_ids in (("post_add", added_permission_ids),
+                                               ("post_remove", removed_permission_ids)):
+            for user, permission_ids in changed_permission_ids.items():
+                signals.m2m_changed.send(sender=through_model, instance=user, action=action, reverse=False,
+                                         model=Permission, pk_set=permission_ids, using=through_model.objects.db)
+        return True
 
 
 @receiver(maintain)
@@ -293,7 +503,6 @@ def synchronize_users_with_ad(sender, **kwargs):
     found anymore or has switched the institute is set to “inactive”.
     Moreover, name, email, and permissions are updated.
     """
-    ldap_connection = LDAPConnection()
-    for user in User.objects.filter(is_active=True):
-        if not user.has_usable_password():
-            ldap_connection.synchronize_with_ad(user)
+    users = [user for user in User.objects.filter(is_active=True).select_related("jb_user_details")
+             if not user.has_usable_password()]
+    LDAPConnection().synchronize_all_with_ad(users)
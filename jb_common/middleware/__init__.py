@@ -27,9 +27,11 @@ from django.utils.cache import patch_vary_headers, add_never_cache_headers
 from django.utils import translation
 from django.template import loader, RequestContext
 from django.contrib.auth import logout
+from django.db import transaction
 import django.core.urlresolvers
 from jb_common.models import UserDetails, ErrorPage
-from jb_common.utils.base import is_json_requested, JSONRequestException
+from jb_common.utils.base import is_json_requested, JSONRequestException, start_collecting_after_commit_callbacks, \
+    pop_after_commit_callbacks, start_collecting_cache_statistics, pop_cache_statistics
 from django.conf import settings
 from django.utils.translation import ugettext as _
 import django.http
@@ -184,3 +186,52 @@ class JSONClientMiddleware(object):
         elif isinstance(exception, JSONRequestException):
             return HttpResponseUnprocessableEntity(json.dumps((exception.error_number, exception.error_message)),
                                                    content_type="application/json")
+
+
+class CacheStatisticsMiddleware(object):
+    """Middleware which records the cache accesses of every request, see
+    :py:func:`jb_common.utils.base.pop_cache_statistics`, and adds them to the
+    response in a ``Server-Timing`` header.  This way, the number of cache
+    hits and misses and the latency of the batched cache lookups of a
+    particular page can be inspected with the developer tools of the browser.
+
+    This class should come first in ``MIDDLEWARE_CLASSES`` in the ``settings``
+    module, so that the cache accesses of all other middleware are recorded,
+    too.
+    """
+
+    def process_request(self, request):
+        start_collecting_cache_statistics()
+
+    def process_response(self, request, response):
+        statistics = pop_cache_statistics()
+        if statistics and (statistics["hits"] or statistics["misses"]):
+            response["Server-Timing"] = "cache-prefetch;dur={prefetch_time:.1f}, cache-prefetches;desc={prefetches}, " \
+                "cache-hits;desc={hits}, cache-misses;desc={misses}".format(**statistics)
+        return response
+
+
+class AfterCommitMiddleware(object):
+    """Middleware which calls the callbacks registered with
+    :py:func:`jb_common.utils.base.run_after_commit` after the view has
+    returned successfully.  The callbacks are called together in a transaction
+    of their own.  If the view raised an exception, they are discarded.
+
+    This class must come last in ``MIDDLEWARE_CLASSES`` in the ``settings``
+    module.  Otherwise, middleware which turns exceptions into responses may
+    hide the exception from it.
+    """
+
+    def process_request(self, request):
+        start_collecting_after_commit_callbacks()
+
+    def process_exception(self, request, exception):
+        pop_after_commit_callbacks()
+
+    def process_response(self, request, response):
+        callbacks = pop_after_commit_callbacks()
+        if callbacks:
+            with transaction.atomic():
+                for callback in callbacks:
+                    callback()
+        return response
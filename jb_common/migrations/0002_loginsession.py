@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+from django.db import models, migrations
+from django.conf import settings
+
+
+def fill_login_sessions(apps, schema_editor):
+    from django.contrib.sessions.backends.db import SessionStore
+    Session = apps.get_model("sessions", "Session")
+    User = apps.get_model("auth", "User")
+    LoginSession = apps.get_model("jb_common", "LoginSession")
+    user_ids = set(User.objects.values_list("id", flat=True))
+    session_store = SessionStore()
+    login_sessions = []
+    for session in Session.objects.filter(expire_date__gte=datetime.datetime.now()).iterator():
+        try:
+            user_id = int(session_store.decode(session.session_data).get("_auth_user_id"))
+        except (TypeError, ValueError):
+            continue
+        if user_id in user_ids:
+            login_sessions.append(LoginSession(session_key=session.session_key, user_id=user_id))
+    LoginSession.objects.bulk_create(login_sessions, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sessions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('jb_common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginSession',
+            fields=[
+                ('session_key', models.CharField(max_length=40, serialize=False, verbose_name='session key', primary_key=True)),
+                ('timestamp', models.DateTimeField(auto_now_add=True, verbose_name='timestamp')),
+                ('user', models.ForeignKey(related_name='login_sessions', verbose_name='user', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'login session',
+                'verbose_name_plural': 'login sessions',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.RunPython(fill_login_sessions, migrations.RunPython.noop),
+    ]
@@ -262,4 +262,21 @@ class ErrorPage(models.Model):
         verbose_name_plural = _("error pages")
 
 
+class LoginSession(models.Model):
+    """Index of the sessions of logged-in users.  Django stores the user only
+    in the encoded session data, so without this index, one would have to
+    decode all sessions in order to find the ones of a certain user, e.g. for
+    purging them when the user is set to inactive.  Entries are added at login,
+    see :py:func:`jb_common.signals.add_login_session`, and the entries of
+    expired sessions are removed nightly.
+    """
+    session_key = models.CharField(_("session key"), max_length=40, primary_key=True)
+    user = models.ForeignKey(django.contrib.auth.models.User, verbose_name=_("user"), related_name="login_sessions")
+    timestamp = models.DateTimeField(_("timestamp"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("login session")
+        verbose_name_plural = _("login sessions")
+
+
 _ = ugettext
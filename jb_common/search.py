@@ -478,7 +478,7 @@ def get_all_searchable_models():
     return all_searchable_models
 
 
-def get_search_results(search_tree, max_results, base_query=None):
+def get_search_results(search_tree, max_results, base_query=None, after=None):
     """Returns all found model instances for the given search.  It is a
     wrapper around the ``get_query_set`` method of the top-level node in the
     search tree, and it serves three purposes:
@@ -490,30 +490,40 @@ def get_search_results(search_tree, max_results, base_query=None):
         3. If the top-level node is abstract, it finds the actual instance for
            each found object.
 
+    The found objects are taken in the order of their primary keys, so that
+    the following results can be fetched by passing the greatest primary key
+    of the current results as ``after``.  This way, no ``COUNT`` query and no
+    ``OFFSET`` is needed, which is slow with large tables.  The returned list
+    itself is in the default order of the model.
+
     :param search_tree: the complete search tree of the search
     :param max_results: the maximal number of results to be returned
     :param base_query: the query set to be used as the starting point of the
         query; it is used to restrict the found items to what the user is
         allowed to see
+    :param after: if given, only objects with a greater primary key than this
+        are returned
 
     :type search_tree: `SearchTreeNode`
     :type max_results: int
     :type base_query: QuerySet
+    :type after: int
 
     :return:
       the found objects, whether more than ``max_results`` were found
 
     :rtype: list of model instances, bool
     """
-    # FixMe: The order_by() is necessary until
-    # https://code.djangoproject.com/ticket/24254 is fixed.
-    results = search_tree.get_query_set(base_query).order_by().distinct()
-    too_many_results = results.count() > max_results
-    if too_many_results:
-        results = results[:max_results]
-    results = search_tree.model_class.objects.filter(pk__in=results)
+    results = search_tree.get_query_set(base_query)
+    if after is not None:
+        results = results.filter(pk__gt=after)
+    result_ids = list(results.order_by("pk").values_list("pk", flat=True).distinct()[:max_results + 1])
+    too_many_results = len(result_ids) > max_results
+    results = search_tree.model_class.objects.filter(pk__in=result_ids[:max_results])
     if isinstance(search_tree, AbstractSearchTreeNode):
-        results = [result.actual_instance for result in results]
+        results = utils.get_actual_instances(results)
+    else:
+        results = list(results)
     return results, too_many_results
 
 
@@ -40,10 +40,14 @@
 from __future__ import absolute_import, unicode_literals
 
 import datetime
+from importlib import import_module
 from django.db.models import signals
 from django.dispatch import receiver
 import django.dispatch
+from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in, user_logged_out
 from jb_common import models
 
 
@@ -91,3 +95,39 @@ def expire_error_pages(sender, **kwargs):
     six_weeks_ago = now - datetime.timedelta(weeks=6)
     for error_page in models.ErrorPage.objects.filter(timestamp__lt=six_weeks_ago):
         error_page.delete()
+
+
+@receiver(user_logged_in)
+def add_login_session(sender, request, user, **kwargs):
+    """Adds the session of a user who has just logged in to the index of login
+    sessions, see :py:class:`jb_common.models.LoginSession`.
+    """
+    session_key = request.session.session_key
+    if session_key:
+        models.LoginSession.objects.update_or_create(session_key=session_key, defaults={"user": user})
+
+
+@receiver(user_logged_out)
+def remove_login_session(sender, request, user, **kwargs):
+    """Removes the session of a user who logs out from the index of login
+    sessions, see :py:class:`jb_common.models.LoginSession`.
+    """
+    models.LoginSession.objects.filter(session_key=request.session.session_key).delete()
+
+
+@receiver(maintain)
+def expire_login_sessions(sender, **kwargs):
+    """Removes all entries from the index of login sessions whose sessions
+    don't exist anymore.  For the database session backends, this is done with
+    one query.  Otherwise, every session is looked up in the session store.
+    """
+    if settings.SESSION_ENGINE in ["django.contrib.sessions.backends.db", "django.contrib.sessions.backends.cached_db"]:
+        from django.contrib.sessions.models import Session
+        current_session_keys = Session.objects.filter(expire_date__gte=timezone.now()).values("session_key")
+        models.LoginSession.objects.exclude(session_key__in=current_session_keys).delete()
+    else:
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore()
+        outdated_session_keys = [session_key for session_key in
+                                 models.LoginSession.objects.values_list("session_key", flat=True).iterator()
+                                 if not session_store.exists(session_key)]
+        models.LoginSession.objects.filter(session_key__in=outdated_session_keys).delete()
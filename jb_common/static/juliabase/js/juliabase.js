@@ -41,6 +41,27 @@ juliabase.request = function(url, success, data, type) {
     $.ajax(parameters);
 };
 
+// Loads all plot thumbnails of the page which are marked with a
+// "data-plot-thumbnail" attribute.  One request to the view at "url" makes
+// sure that they are rendered and returns their URLs.  Since the URLs contain
+// the version of the thumbnail, the browser caches the images for good.
+// Images missing in the response fall back to their "data-src" attribute.
+// Without JavaScript, the process templates show the images in a <noscript>
+// element instead.
+juliabase.loadPlotThumbnails = function(url) {
+    var images = $("img[data-plot-thumbnail]:not([src])");
+    if (images.length == 0) return;
+    var plots = images.map(function() { return $(this).attr("data-plot-thumbnail"); }).get();
+    var setSources = function(thumbnails) {
+        images.each(function() {
+            var image = $(this);
+            image.attr("src", thumbnails[image.attr("data-plot-thumbnail")] || image.attr("data-src"));
+        });
+    };
+    $.ajax({url: url, dataType: "json", data: {plots: plots}, traditional: true, success: setSources,
+            error: function() { setSources({}); }});
+};
+
 function getCookie(name) {
     var cookieValue = null;
     if (document.cookie && document.cookie != '') {
@@ -22,14 +22,14 @@ from __future__ import absolute_import, division, unicode_literals
 import django.utils.six as six
 from django.utils.six.moves import urllib_parse
 
-import codecs, re, os, os.path, time, json, datetime, copy, mimetypes, string
-from contextlib import contextmanager
+import codecs, re, os, os.path, time, json, datetime, copy, mimetypes, string, threading
 from functools import wraps
 from smtplib import SMTPException
 from functools import update_wrapper
 import dateutil.tz
 import django.http
 import django.contrib.auth.models
+from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
 from django.core.serializers.json import DjangoJSONEncoder
 from django.apps.registry import apps
@@ -541,6 +541,35 @@ def register_abstract_model(abstract_model):
     abstract_models.add(abstract_model)
 
 
+def get_actual_instances(instances):
+    """Resolves the polymorphy of many instances of a
+    `jb_common.models.PolymorphicModel` at once.  In contrast to accessing
+    ``actual_instance`` of each instance, this needs only one database query
+    per actual model class rather than one per instance.
+
+    :param instances: the instances to be resolved
+
+    :type instances: iterable of `jb_common.models.PolymorphicModel`
+
+    :return:
+      the actual instances, in the order of ``instances``; instances whose
+      actual instance doesn't exist anymore are left out
+
+    :rtype: list of ``models.Model``
+    """
+    instances = list(instances)
+    object_ids_by_content_type_id = {}
+    for instance in instances:
+        object_ids_by_content_type_id.setdefault(instance.content_type_id, set()).add(instance.actual_object_id)
+    actual_instances = {}
+    for content_type_id, object_ids in object_ids_by_content_type_id.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        for object_id, actual_instance in model._default_manager.in_bulk(object_ids).items():
+            actual_instances[content_type_id, object_id] = actual_instance
+    return [actual_instances[instance.content_type_id, instance.actual_object_id] for instance in instances
+            if (instance.content_type_id, instance.actual_object_id) in actual_instances]
+
+
 def is_update_necessary(destination, source_files=[], timestamps=[], additional_inaccuracy=0):
     """Returns whether the destination file needs to be re-created from the
     sources.  It bases of the timestamps of last file modification.  If the
@@ -632,31 +661,147 @@ def mkdirs(path):
         pass
 
 
-@contextmanager
-def cache_key_locked(key):
-    """Locks the ``key`` in the cache.  If ``key`` already exists, it waits for
-    max. 6 seconds.  If it's still not released, the whole cache is cleared.
-    In all cases, ``key`` is hold in the context.  After the context is left
-    (even via an exception), the key is deleted, i.e. the lock is removed.  Use
-    it like this::
+def get_cache_generation(key):
+    """Returns the current generation of a group of cache items, e.g. of all
+    cached renderings of a sample.  The generation should be part of the
+    cache keys of the items in the group.  Then, the whole group is expired at
+    once by `increment_cache_generation`, without keeping track of the
+    individual keys.  Stale items are not deleted but they are never hit
+    again, and the cache evicts them eventually.
+
+    If the generation counter is not found in the cache (e.g. because it was
+    evicted), it is initialised with the current time in milliseconds, so that
+    it cannot collide with a generation used before.
+
+    :param key: the cache key of the generation counter
+
+    :type key: str
 
-        with cache_key_locked("my_lock_name"):
-            ...
+    :return:
+      the current generation
+
+    :rtype: int
+    """
+    return get_cache_generations([key])[key]
+
+
+def get_cache_generations(keys):
+    """Batch version of `get_cache_generation`.  It needs only one round trip
+    to the cache if all generation counters exist.
+
+    :param keys: the cache keys of the generation counters
+
+    :type keys: list of str
+
+    :return:
+      the current generations
+
+    :rtype: dict mapping str to int
+    """
+    generations = cache.get_many(keys)
+    for key in set(keys) - set(generations):
+        generation = int(time.time() * 1000)
+        if not cache.add(key, generation, None):
+            generation = cache.get(key, generation)
+        generations[key] = generation
+    return generations
+
+
+def increment_cache_generation(key):
+    """Expires all cache items of the group of the given generation counter.
+    See `get_cache_generation` for details.  This is atomic and never blocks.
+
+    :param key: the cache key of the generation counter
+
+    :type key: str
     """
-    cycles = 20
-    while cycles:
-        if cache.add(key, 1):
-            break
-        cycles -= 1
-        time.sleep(0.3)
-    else:
-        cache.clear()
-        successful = cache.add(key, 1)
-        assert successful
     try:
-        yield
-    finally:
-        cache.delete(key)
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), None)
+
+
+def increment_cache_generations(keys):
+    """Batch version of `increment_cache_generation`.  Every counter is
+    incremented only once, even if it occurs more than once in `keys`.
+
+    :param keys: the cache keys of the generation counters
+
+    :type keys: iterable of str
+    """
+    for key in set(keys):
+        increment_cache_generation(key)
+
+
+_after_commit = threading.local()
+
+def run_after_commit(callback, key=None):
+    """Calls `callback` after the transaction of the current request was
+    committed successfully.  If the request fails, it is not called at all.
+    Django 1.8 doesn't have commit hooks.  Therefore, the callbacks are
+    collected per thread, and
+    :py:class:`jb_common.middleware.AfterCommitMiddleware` calls them after the
+    view – and with ``ATOMIC_REQUESTS``, its transaction – has finished.
+    Outside of requests, e.g. in management commands, `callback` is called
+    immediately.
+
+    :param callback: the function to be called; it is called without
+        parameters
+    :param key: If given, the callback can be retrieved with
+        `get_pending_after_commit_callback` until it is called.  This way,
+        work can be accumulated in one callback during the request.  If a
+        callback with the same key is already pending, `callback` is ignored.
+
+    :type callback: callable
+    :type key: str
+    """
+    callbacks = getattr(_after_commit, "callbacks", None)
+    if callbacks is None:
+        callback()
+    elif key is None:
+        callbacks.append(callback)
+    elif key not in _after_commit.keyed_callbacks:
+        callbacks.append(callback)
+        _after_commit.keyed_callbacks[key] = callback
+
+
+def get_pending_after_commit_callback(key):
+    """Returns the callback which was registered with `run_after_commit` under
+    the given key and which has not been called yet.
+
+    :param key: the key of the callback
+
+    :type key: str
+
+    :return:
+      the pending callback, or ``None`` if there is none
+
+    :rtype: callable or NoneType
+    """
+    keyed_callbacks = getattr(_after_commit, "keyed_callbacks", None)
+    return keyed_callbacks.get(key) if keyed_callbacks else None
+
+
+def start_collecting_after_commit_callbacks():
+    """Makes `run_after_commit` collect its callbacks rather than calling them
+    immediately.  This is called at the beginning of each request.
+    """
+    _after_commit.callbacks = []
+    _after_commit.keyed_callbacks = {}
+
+
+def pop_after_commit_callbacks():
+    """Returns the callbacks collected by `run_after_commit` and stops
+    collecting them.
+
+    :return:
+      the collected callbacks, in the order of their registration
+
+    :rtype: list of callable
+    """
+    callbacks = getattr(_after_commit, "callbacks", None) or []
+    _after_commit.callbacks = _after_commit.keyed_callbacks = None
+    return callbacks
 
 
 class MyNone:
@@ -668,9 +813,15 @@ class MyNone:
 my_none = MyNone()
 
 
-def _incr_cache_item(key, increment):
-    """Internal routine for incrementing a cache value, or creating it if
-    non-existing.
+def increment_cache_counter(key, increment=1):
+    """Increments a counter in the cache, or creates it if non-existing.  This
+    is used for statistics like `cache_hit_rate`.
+
+    :param key: the cache key of the counter
+    :param increment: the value to be added to the counter
+
+    :type key: str
+    :type increment: int
     """
     try:
         cache.incr(key, increment)
@@ -678,6 +829,55 @@ def _incr_cache_item(key, increment):
         cache.add(key, increment)
 
 
+_cache_statistics = threading.local()
+
+def start_collecting_cache_statistics():
+    """Makes `get_from_cache` and `get_many_from_cache` record the cache
+    accesses of the current request, in addition to the global counters.  This
+    is called at the beginning of each request by
+    :py:class:`jb_common.middleware.CacheStatisticsMiddleware`.
+    """
+    _cache_statistics.statistics = {"hits": 0, "misses": 0, "prefetches": 0, "prefetch_time": 0}
+
+
+def pop_cache_statistics():
+    """Returns the cache accesses recorded since
+    `start_collecting_cache_statistics` and stops recording them.
+
+    :return:
+      the number of cache hits, cache misses, and batched lookups, and the
+      time spent in the batched lookups in milliseconds; ``None`` if nothing
+      was being recorded
+
+    :rtype: dict mapping str to int or float, or NoneType
+    """
+    statistics = getattr(_cache_statistics, "statistics", None)
+    _cache_statistics.statistics = None
+    return statistics
+
+
+def _record_cache_statistics(hits, misses, prefetch_time=None):
+    """Adds cache accesses to the statistics of the current request, if they
+    are being recorded.
+
+    :param hits: the number of cache hits
+    :param misses: the number of cache misses
+    :param prefetch_time: the time needed for a batched lookup in
+        milliseconds; ``None`` for a single lookup
+
+    :type hits: int
+    :type misses: int
+    :type prefetch_time: float or NoneType
+    """
+    statistics = getattr(_cache_statistics, "statistics", None)
+    if statistics is not None:
+        statistics["hits"] += hits
+        statistics["misses"] += misses
+        if prefetch_time is not None:
+            statistics["prefetches"] += 1
+            statistics["prefetch_time"] += prefetch_time
+
+
 def get_from_cache(key, default=None, hits=1, misses=1):
     """Gets an item from the cache and records statistics for
     `cache_hit_rate`.  The semantics of this routine are the same as for
@@ -691,13 +891,61 @@ def get_from_cache(key, default=None, hits=1, misses=1):
     """
     result = cache.get(key, my_none)
     if result is my_none:
-        _incr_cache_item("samples-cache-misses", misses)
+        increment_cache_counter("samples-cache-misses", misses)
+        _record_cache_statistics(0, 1)
         return default
     else:
-        _incr_cache_item("samples-cache-hits", hits)
+        increment_cache_counter("samples-cache-hits", hits)
+        _record_cache_statistics(1, 0)
         return result
 
 
+def get_many_from_cache(keys, hits=1, misses=1):
+    """Batch version of `get_from_cache`.  The semantics of this routine are
+    the same as for Django's `cache.get_many`.  `hits` and `misses` are per
+    item.  Additionally, the time needed for fetching the items is recorded
+    for `cache_prefetch_latency` and for the statistics of the current
+    request, see `pop_cache_statistics`.
+
+    :param keys: the cache keys to look up
+
+    :type keys: list of str
+
+    :return:
+      the found cache items
+
+    :rtype: dict mapping str to ``object``
+    """
+    if not keys:
+        return {}
+    start = time.time()
+    result = cache.get_many(keys)
+    microseconds = int(round((time.time() - start) * 1000000))
+    number_of_misses = len(set(keys) - set(result))
+    increment_cache_counter("samples-cache-hits", hits * len(result))
+    increment_cache_counter("samples-cache-misses", misses * number_of_misses)
+    increment_cache_counter("samples-cache-prefetches", 1)
+    increment_cache_counter("samples-cache-prefetch-time", microseconds)
+    _record_cache_statistics(len(result), number_of_misses, microseconds / 1000)
+    return result
+
+
+def cache_prefetch_latency():
+    """Returns the average time needed for one `get_many_from_cache` call.
+
+    :return:
+      the average latency in milliseconds, or ``None`` if no prefetches have
+      been recorded
+
+    :rtype: float or NoneType
+    """
+    prefetches = cache.get("samples-cache-prefetches", 0)
+    if prefetches == 0:
+        return None
+    else:
+        return cache.get("samples-cache-prefetch-time", 0) / prefetches / 1000
+
+
 def cache_hit_rate():
     """Returns the current cache hit rate.  This value is between 0 and 1.  It
     returns ``None`` is no such value could be calculated.
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module which defines the command ``update_kicker_plot``.  It re-generates
+the plot of the kicker numbers if new matches were played since it was
+generated last time.  It should be called frequently as a cronjob.  For
+example, one line in the crontab may read::
+
+    */5 * * * * /home/juliabase/juliabase/manage.py update_kicker_plot
+
+With the option ``--replay``, all kicker numbers are re-calculated from scratch
+before.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+import kicker.views
+
+
+class Command(BaseCommand):
+    help = "Re-generates the kicker plot if the kicker numbers have changed.  It should be called frequently " \
+           "as a cronjob."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--replay", action="store_true",
+                            help="re-calculate all kicker numbers from the matches before")
+
+    def handle(self, *args, **options):
+        if options["replay"]:
+            with transaction.atomic():
+                kicker.views.replay()
+        if kicker.views.is_plot_update_necessary():
+            kicker.views.update_plot()
@@ -20,21 +20,23 @@
 
 from __future__ import division, absolute_import, unicode_literals
 
-import datetime, os, math
+import datetime, os, math, time, collections, functools, operator, itertools
+import numpy
 from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.figure import Figure
 import matplotlib.dates
 from django import forms
 from django.forms.util import ValidationError
 from django.conf import settings
-from django.db.models import Q
+from django.db.models import Q, Max, Count
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 import django.contrib.auth.models
 from django.http import Http404
 from django.utils.translation import ugettext as _
-from jb_common.utils.base import respond_in_json, JSONRequestException, get_really_full_name, successful_response, mkdirs, int_or_zero
+from jb_common.utils.base import respond_in_json, JSONRequestException, get_really_full_name, successful_response, mkdirs, int_or_zero, \
+    run_after_commit
 from jb_common.signals import storage_changed
 import samples.utils.views as utils
 from kicker import models
@@ -44,11 +46,76 @@ class NoKickerNumber(Exception):
     pass
 
 
-def get_current_kicker_number(player):
-    try:
-        return models.KickerNumber.objects.filter(player=player).latest("timestamp").number
-    except models.KickerNumber.DoesNotExist:
-        raise NoKickerNumber
+# Lightweight representation of a match for the rating computations.  The
+# players are given by their IDs.
+MatchRecord = collections.namedtuple("MatchRecord", ("player_a_1", "player_a_2", "player_b_1", "player_b_2",
+                                                     "goals_a", "goals_b", "seconds", "timestamp"))
+
+
+def get_match_records(matches):
+    """Fetches matches as `MatchRecord` tuples.
+
+    :param matches: the matches to fetch
+
+    :type matches: QuerySet
+
+    :return:
+      the matches, in the order of `matches`
+
+    :rtype: list of `MatchRecord`
+    """
+    return [MatchRecord(*match) for match in matches.values_list(*MatchRecord._fields)]
+
+
+def get_latest_values(queryset, key_field, value_field):
+    """Returns the most recent value of a time series for each key.  This needs
+    two queries, independent of the number of keys.
+
+    :param queryset: the rows of the time series; they must have a
+        ``timestamp`` field
+    :param key_field: the name of the field which distinguishes the series,
+        e.g. ``"player"``
+    :param value_field: the name of the field containing the values
+
+    :type queryset: QuerySet
+    :type key_field: str
+    :type value_field: str
+
+    :return:
+      the most recent value for each key, together with the number of rows for
+      that key
+
+    :rtype: dict mapping int to (float, int)
+    """
+    latest_timestamps = {}
+    counts = {}
+    for key, timestamp, count in queryset.order_by().values_list(key_field). \
+        annotate(latest=Max("timestamp"), count=Count("id")):
+        latest_timestamps[key] = timestamp
+        counts[key] = count
+    if not latest_timestamps:
+        return {}
+    query = functools.reduce(operator.or_, (Q(**{key_field: key, "timestamp": timestamp})
+                                            for key, timestamp in latest_timestamps.items()))
+    return dict((key, (value, counts[key]))
+                for key, value in queryset.filter(query).order_by("id").values_list(key_field, value_field))
+
+
+def get_current_kicker_numbers(player_ids):
+    """Returns the current kicker numbers of the given players.  Players
+    without kicker number are missing in the result.
+
+    :param player_ids: the IDs of the players
+
+    :type player_ids: iterable of int
+
+    :return:
+      the current kicker numbers, together with the number of kicker numbers of
+      each player so far
+
+    :rtype: dict mapping int to (float, int)
+    """
+    return get_latest_values(models.KickerNumber.objects.filter(player__in=set(player_ids)), "player", "number")
 
 
 def average_goal_frequency(two_player_game):
@@ -67,121 +134,141 @@ def get_elo_delta(goals_a, goals_b, number_player_a_1, number_player_a_2, number
     return delta
 
 
-def get_current_kicker_number_or_estimate(player):
-    try:
-        return get_current_kicker_number(player)
-    except NoKickerNumber:
-        preliminary_kicker_number = 1500
-        matches = list(models.Match.objects.filter(Q(player_a_1=player) | Q(player_a_2=player) | Q(player_b_1=player) |
-                                                   Q(player_b_2=player)).filter(finished=True).distinct())
-        # FixMe: This part is very inefficient.  One should collect the matches
-        # *before* one enters the while loop.  This way, one avoids unnecessary
-        # doubling of many operations.  On the other hand, one needs a new data
-        # structure that holds the matches.  Fortunately, this is only rarely
-        # needed.
-        cycles_left = 50
-        while cycles_left:
-            cycles_left -= 1
-            old_kicker_number = preliminary_kicker_number
-            number_of_matches = 0
-            for match in matches:
-                try:
-                    number_player_a_1 = get_current_kicker_number(match.player_a_1) if match.player_a_1 != player \
-                        else preliminary_kicker_number
-                    number_player_a_2 = get_current_kicker_number(match.player_a_2) if match.player_a_2 != player \
-                        else preliminary_kicker_number
-                    number_player_b_1 = get_current_kicker_number(match.player_b_1) if match.player_b_1 != player \
-                        else preliminary_kicker_number
-                    number_player_b_2 = get_current_kicker_number(match.player_b_2) if match.player_b_2 != player \
-                        else preliminary_kicker_number
-                except NoKickerNumber:
-                    continue
-                delta = get_elo_delta(match.goals_a, match.goals_b,
-                                      number_player_a_1, number_player_a_2, number_player_b_1, number_player_b_2,
-                                      match.seconds, two_player_game=match.player_a_1 == match.player_a_2)
-                delta_player = 40 * delta
-                if player in [match.player_b_1, match.player_b_2]:
-                    delta_player = -delta_player
-                preliminary_kicker_number += delta_player
-                number_of_matches += 1
-            if number_of_matches < 7:
-                raise NoKickerNumber
-            if abs(old_kicker_number - preliminary_kicker_number) < 1:
-                break
-        return preliminary_kicker_number
-
-
-def get_k(player=None):
-    return 24 if not player or models.KickerNumber.objects.filter(player=player).count() > 30 else 30
-
-
-def get_old_stock_value(player):
-    try:
-        return models.StockValue.objects.filter(gambler=player).latest("timestamp")
-    except models.StockValue.DoesNotExist:
-        return 100
+def estimate_kicker_number(player_id, matches, current_numbers):
+    """Estimates the kicker number of a player who doesn't have one yet from
+    their matches against players who have one.
+
+    :param player_id: the ID of the player
+    :param matches: the finished matches; they may contain matches without the
+        player, too
+    :param current_numbers: the current kicker numbers of all players who have
+        one
+
+    :type player_id: int
+    :type matches: list of `MatchRecord`
+    :type current_numbers: dict mapping int to float
+
+    :return:
+      the estimated kicker number
+
+    :rtype: float
+
+    :raises NoKickerNumber: if there are too few matches for a reliable
+        estimate
+    """
+    own_matches = [match for match in matches if player_id in match[:4]]
+    preliminary_kicker_number = 1500
+    cycles_left = 50
+    while cycles_left:
+        cycles_left -= 1
+        old_kicker_number = preliminary_kicker_number
+        number_of_matches = 0
+        for match in own_matches:
+            try:
+                numbers = [preliminary_kicker_number if player == player_id else current_numbers[player]
+                           for player in match[:4]]
+            except KeyError:
+                continue
+            delta = get_elo_delta(match.goals_a, match.goals_b, numbers[0], numbers[1], numbers[2], numbers[3],
+                                  match.seconds, two_player_game=match.player_a_1 == match.player_a_2)
+            delta_player = 40 * delta
+            if player_id in (match.player_b_1, match.player_b_2):
+                delta_player = -delta_player
+            preliminary_kicker_number += delta_player
+            number_of_matches += 1
+        if number_of_matches < 7:
+            raise NoKickerNumber
+        if abs(old_kicker_number - preliminary_kicker_number) < 1:
+            break
+    return preliminary_kicker_number
+
+
+def get_current_kicker_numbers_or_estimates(player_ids):
+    """Returns the current kicker numbers of the given players.  For players
+    without kicker number, it is estimated from their matches, see
+    `estimate_kicker_number`.  Players for whom this isn't possible either are
+    missing in the result.
+
+    :param player_ids: the IDs of the players
+
+    :type player_ids: iterable of int
+
+    :return:
+      the current (or estimated) kicker numbers, together with the number of
+      kicker numbers of each player so far
+
+    :rtype: dict mapping int to (float, int)
+    """
+    player_ids = set(player_ids)
+    result = get_current_kicker_numbers(player_ids)
+    missing_player_ids = player_ids - set(result)
+    if missing_player_ids:
+        matches = get_match_records(models.Match.objects.filter(
+            Q(player_a_1__in=missing_player_ids) | Q(player_a_2__in=missing_player_ids) |
+            Q(player_b_1__in=missing_player_ids) | Q(player_b_2__in=missing_player_ids)).filter(finished=True))
+        current_numbers = dict((player_id, number) for player_id, (number, __) in get_current_kicker_numbers(
+            itertools.chain.from_iterable(match[:4] for match in matches)).items())
+        for player_id in missing_player_ids:
+            try:
+                result[player_id] = (estimate_kicker_number(player_id, matches, current_numbers), 0)
+            except NoKickerNumber:
+                pass
+    return result
+
+
+def get_k(number_of_kicker_numbers=None):
+    return 24 if number_of_kicker_numbers is None or number_of_kicker_numbers > 30 else 30
 
 
 class MatchResult(object):
+    """The outcome of a match for the kicker numbers and the stock values.  All
+    kicker numbers needed are fetched with a constant number of queries, and
+    the new kicker numbers and stock values are written in bulk.
+    """
 
     def __init__(self, match):
-        self.player_a_1, self.player_a_2, self.player_b_1, self.player_b_2 = \
-            match.player_a_1, match.player_a_2, match.player_b_1, match.player_b_2
+        self.player_ids = (match.player_a_1_id, match.player_a_2_id, match.player_b_1_id, match.player_b_2_id)
         self.timestamp = match.timestamp
-        self.two_player_game = match.player_a_1 == match.player_a_2
+        self.two_player_game = match.player_a_1_id == match.player_a_2_id
+        current_numbers = get_current_kicker_numbers_or_estimates(self.player_ids)
         try:
-            self.number_player_a_1 = get_current_kicker_number_or_estimate(self.player_a_1)
-            self.number_player_a_2 = get_current_kicker_number_or_estimate(self.player_a_2)
-            self.number_player_b_1 = get_current_kicker_number_or_estimate(self.player_b_1)
-            self.number_player_b_2 = get_current_kicker_number_or_estimate(self.player_b_2)
-        except NoKickerNumber:
+            numbers, counts = zip(*(current_numbers[player_id] for player_id in self.player_ids))
+        except KeyError:
             self.result_available = False
             self.expected_goal_difference = self.estimated_win_team_1 = None
         else:
             self.result_available = True
-            delta = get_elo_delta(
-                match.goals_a, match.goals_b,
-                self.number_player_a_1, self.number_player_a_2, self.number_player_b_1, self.number_player_b_2,
-                match.seconds, self.two_player_game)
-            self.delta_a_1 = get_k(match.player_a_1) * delta
-            self.delta_a_2 = get_k(match.player_a_2) * delta
-            self.delta_b_1 = -get_k(match.player_b_1) * delta
-            self.delta_b_2 = -get_k(match.player_b_2) * delta
-            self.new_number_a_1 = self.number_player_a_1 + self.delta_a_1
-            self.new_number_a_2 = self.number_player_a_2 + self.delta_a_2
-            self.new_number_b_1 = self.number_player_b_1 + self.delta_b_1
-            self.new_number_b_2 = self.number_player_b_2 + self.delta_b_2
-            B = 10 ** ((self.number_player_b_1 + self.number_player_b_2 - self.number_player_a_1 - self.number_player_a_2)
-                     / 800)
+            delta = get_elo_delta(match.goals_a, match.goals_b, numbers[0], numbers[1], numbers[2], numbers[3],
+                                  match.seconds, self.two_player_game)
+            self.deltas = [sign * get_k(count) * delta for sign, count in zip((1, 1, -1, -1), counts)]
+            self.new_numbers = [number + delta for number, delta in zip(numbers, self.deltas)]
+            B = 10 ** ((numbers[2] + numbers[3] - numbers[0] - numbers[1]) / 800)
             self.expected_goal_difference = (1 / (1 + B) - 1 / 2) * \
                 2 * average_goal_frequency(self.two_player_game) * average_match_duration(self.two_player_game)
             self.estimated_win_team_1 = get_k() * delta
 
     def add_kicker_numbers(self):
         if self.result_available:
-            models.KickerNumber.objects.create(player=self.player_a_1, number=self.new_number_a_1, timestamp=self.timestamp)
-            models.KickerNumber.objects.create(player=self.player_a_2, number=self.new_number_a_2, timestamp=self.timestamp)
-            models.KickerNumber.objects.create(player=self.player_b_1, number=self.new_number_b_1, timestamp=self.timestamp)
-            models.KickerNumber.objects.create(player=self.player_b_2, number=self.new_number_b_2, timestamp=self.timestamp)
+            models.KickerNumber.objects.bulk_create(
+                models.KickerNumber(player_id=player_id, number=number, timestamp=self.timestamp)
+                for player_id, number in zip(self.player_ids, self.new_numbers))
+            run_after_commit(schedule_plot_update, key="kicker-plot-update")
 
     def add_stock_values(self):
         if self.result_available:
-            for shares in self.player_a_1.sold_shares.all():
-                models.StockValue.objects.create(
-                    gambler=shares.owner,
-                    value=get_old_stock_value(shares.owner) + shares.number / 100 * self.delta_a_1, timestamp=self.timestamp)
-            for shares in self.player_a_2.sold_shares.all():
-                models.StockValue.objects.create(
-                    gambler=shares.owner,
-                    value=get_old_stock_value(shares.owner) + shares.number / 100 * self.delta_a_2, timestamp=self.timestamp)
-            for shares in self.player_b_1.sold_shares.all():
-                models.StockValue.objects.create(
-                    gambler=shares.owner,
-                    value=get_old_stock_value(shares.owner) + shares.number / 100 * self.delta_b_1, timestamp=self.timestamp)
-            for shares in self.player_b_2.sold_shares.all():
-                models.StockValue.objects.create(
-                    gambler=shares.owner,
-                    value=get_old_stock_value(shares.owner) + shares.number / 100 * self.delta_b_2, timestamp=self.timestamp)
+            stock_deltas = {}
+            for owner_id, bought_person_id, number in models.Shares.objects.filter(
+                    bought_person__in=set(self.player_ids)).values_list("owner", "bought_person", "number"):
+                for player_id, delta in zip(self.player_ids, self.deltas):
+                    if player_id == bought_person_id:
+                        stock_deltas[owner_id] = stock_deltas.get(owner_id, 0) + number / 100 * delta
+            if stock_deltas:
+                old_values = get_latest_values(models.StockValue.objects.filter(gambler__in=stock_deltas),
+                                               "gambler", "value")
+                models.StockValue.objects.bulk_create(
+                    models.StockValue(gambler_id=gambler_id, value=old_values.get(gambler_id, (100, 0))[0] + delta,
+                                      timestamp=self.timestamp)
+                    for gambler_id, delta in stock_deltas.items())
 
 
 @login_required
@@ -292,15 +379,17 @@ def set_start_kicker_number(request, username):
     if models.KickerNumber.objects.filter(player=player).exists():
         raise JSONRequestException(3006, "There are already kicker numbers stored for this user.")
     models.KickerNumber.objects.create(player=player, number=start_kicker_number, timestamp=timestamp)
+    run_after_commit(schedule_plot_update, key="kicker-plot-update")
     return respond_in_json(True)
 
 
 def get_eligible_players():
     two_weeks_ago = datetime.datetime.now() - datetime.timedelta(weeks=2)
-    ids = list(models.KickerNumber.objects.filter(timestamp__gt=two_weeks_ago).values_list("player", flat=True))
-    eligible_players = list(django.contrib.auth.models.User.objects.in_bulk(ids).values())
-    result = [(get_current_kicker_number_or_estimate(player), player) for player in eligible_players]
-    result.sort(reverse=True)
+    ids = set(models.KickerNumber.objects.filter(timestamp__gt=two_weeks_ago).values_list("player", flat=True))
+    eligible_players = django.contrib.auth.models.User.objects.in_bulk(ids)
+    result = [(number, eligible_players[player_id])
+              for player_id, (number, __) in get_current_kicker_numbers_or_estimates(ids).items()]
+    result.sort(key=lambda entry: entry[0], reverse=True)
     return [(entry[1], int(round(entry[0]))) for entry in result]
 
 
@@ -317,22 +406,64 @@ def plot_commands(axes, plot_data):
     axes.grid(True)
 
 
+def get_plot_path():
+    return os.path.join(settings.STATIC_ROOT, "kicker/")
+
+
+def _get_plot_outdated_path():
+    return os.path.join(settings.CACHE_ROOT, "kicker_plot_outdated")
+
+
+def schedule_plot_update():
+    """Marks the kicker plot as outdated, so that the next call of the
+    ``update_kicker_plot`` management command re-generates it.  Call this
+    after the transaction which changed the kicker numbers was committed.
+    """
+    path = _get_plot_outdated_path()
+    mkdirs(path)
+    with open(path, "a"):
+        os.utime(path, None)
+
+
+def is_plot_update_necessary():
+    """Returns whether the kicker plot must be re-generated.  This is the case
+    if it doesn't exist yet, if new kicker numbers were added since it was
+    generated, or if it is older than one day, because the plot shows a
+    sliding time window.
+
+    :return:
+      whether `update_plot` should be called
+
+    :rtype: bool
+    """
+    try:
+        plot_timestamp = os.path.getmtime(os.path.join(get_plot_path(), "kicker.png"))
+    except OSError:
+        return True
+    try:
+        if os.path.getmtime(_get_plot_outdated_path()) >= plot_timestamp:
+            return True
+    except OSError:
+        pass
+    return time.time() - plot_timestamp > 24 * 3600
+
+
 def update_plot():
-    path = os.path.join(settings.STATIC_ROOT, "kicker/")
-#    if os.path.exists(os.path.join(path, "kicker.pdf")) and os.path.exists(os.path.join(path, "kicker.png")):
-#        return
+    path = get_plot_path()
     eligible_players = [entry[0] for entry in get_eligible_players()]
     hundred_days_ago = datetime.datetime.now() - datetime.timedelta(days=100)
+    kicker_numbers = {}
+    for player_id, number, timestamp in models.KickerNumber.objects.filter(
+            player__in=eligible_players, timestamp__gt=hundred_days_ago).values_list("player", "number", "timestamp"):
+        kicker_numbers.setdefault(player_id, []).append((timestamp, number))
     plot_data = []
     for player in eligible_players:
         x_values, y_values = [], []
-        latest_day = None
-        kicker_numbers = list(models.KickerNumber.objects.filter(player=player, timestamp__gt=hundred_days_ago))
-        for i, kicker_number in enumerate(kicker_numbers):
-            if i == len(kicker_numbers) - 1 or \
-                    kicker_numbers[i + 1].timestamp.toordinal() != kicker_number.timestamp.toordinal():
-                x_values.append(kicker_number.timestamp)
-                y_values.append(kicker_number.number)
+        numbers = kicker_numbers.get(player.id, [])
+        for i, (timestamp, number) in enumerate(numbers):
+            if i == len(numbers) - 1 or numbers[i + 1][0].toordinal() != timestamp.toordinal():
+                x_values.append(timestamp)
+                y_values.append(number)
         plot_data.append((x_values, y_values, player.kicker_user_details.nickname or player.username))
     figure = Figure(frameon=False, figsize=(8, 12))
     canvas = FigureCanvasAgg(figure)
@@ -357,7 +488,8 @@ def update_plot():
 @login_required
 @require_http_methods(["GET"])
 def summary(request):
-    update_plot()
+    if not os.path.exists(os.path.join(get_plot_path(), "kicker.png")):
+        update_plot()
     eligible_players = get_eligible_players()
     return render(request, "kicker/summary.html", {"title": _("Kicker summary"), "kicker_numbers": eligible_players,
                                                    "latest_matches": models.Match.objects.reverse()[:20]})
@@ -419,46 +551,109 @@ def get_player(request):
 
 start_number = 1300
 
-def get_start_numbers():
-    players = {}
+def get_start_numbers(matches):
+    """Calculates the start numbers of the players of the first matches.  The
+    start numbers are the fixpoint of the kicker numbers of these matches.  The
+    fixpoint iteration is vectorised: In each cycle, the Elo deltas of all
+    matches are calculated at once from the current numbers, and every player
+    moves by the average of their deltas.
+
+    :param matches: all finished matches, in chronological order
+
+    :type matches: list of `MatchRecord`
+
+    :return:
+      the start numbers of the players, or ``None`` if there are too few
+      matches or the iteration doesn't converge
+
+    :rtype: dict mapping int to float or NoneType
+    """
+    players = set()
     # FixMe: Exclude all matches for which is not 0 < S < 1 because they thwart
     # convergence.  They should be only a few.
-    for i, match in enumerate(models.Match.objects.all()[:50]):
-        players[match.player_a_1] = players[match.player_a_2] = \
-            players[match.player_b_1] = players[match.player_b_2] = start_number
+    for i, match in enumerate(matches[:50]):
+        players.update(match[:4])
         if i / len(players) > 7:
             break
-    if i / len(players) <= 7 and i < 49:
-        return
-    matches = list(models.Match.objects.all()[:i + 1])
+    else:
+        if not matches or i / len(players) <= 7 and i < 49:
+            return
+    player_ids = sorted(players)
+    matches = matches[:i + 1]
+    indices = numpy.searchsorted(player_ids, [match[:4] for match in matches])
+    goals_difference = numpy.array([match.goals_a - match.goals_b for match in matches], dtype=float)
+    seconds = numpy.array([match.seconds for match in matches])
+    two_player_game = indices[:, 0] == indices[:, 1]
+    goal_frequency = numpy.where(two_player_game, average_goal_frequency(True), average_goal_frequency(False))
+    match_duration = numpy.where(two_player_game, average_match_duration(True), average_match_duration(False))
+    S = 1 / 2 + 1 / 2 * goals_difference / (seconds * goal_frequency)
+    duration_factor = numpy.sqrt(seconds / match_duration)
+    signs = numpy.array([1, 1, -1, -1])
+    number_of_matches = numpy.bincount(indices.ravel(), minlength=len(player_ids))
+    numbers = numpy.full(len(player_ids), start_number, dtype=float)
     cycles_left = 1000
     while cycles_left:
         cycles_left -= 1
-        old_players = players.copy()
-        for match in matches:
-            delta = get_elo_delta(match.goals_a, match.goals_b,
-                                  players[match.player_a_1], players[match.player_a_2], players[match.player_b_1],
-                                  players[match.player_b_2],
-                                  match.seconds, two_player_game=match.player_a_1 == match.player_a_2)
-            delta_player = 40 * delta
-            players[match.player_a_1] += delta_player
-            players[match.player_a_2] += delta_player
-            players[match.player_b_1] -= delta_player
-            players[match.player_b_2] -= delta_player
-        if all(abs(players[player] - old_players[player]) < 1 for player in players):
+        team_numbers = numbers[indices]
+        E = 1 / (1 + 10 ** ((team_numbers[:, 2] + team_numbers[:, 3] - team_numbers[:, 0] - team_numbers[:, 1]) / 800))
+        delta = duration_factor * (S - E)
+        changes = 40 * numpy.bincount(indices.ravel(), weights=numpy.outer(delta, signs).ravel(),
+                                      minlength=len(player_ids)) / number_of_matches
+        numbers += changes
+        # Like the sequential iteration, stop when the sum of a player's deltas
+        # in one cycle is smaller than 1.
+        if numpy.all(numpy.abs(changes * number_of_matches) < 1):
             break
     else:
         return
-    return players
+    return dict(zip(player_ids, numbers.tolist()))
 
 
 def replay():
+    """Re-calculates all kicker numbers from scratch.  The whole calculation
+    takes place in memory, and the kicker numbers are written with one bulk
+    insert.  Stock values are not touched.
+    """
+    matches = get_match_records(models.Match.objects.filter(finished=True))
     models.KickerNumber.objects.all().delete()
-    players = get_start_numbers()
+    players = get_start_numbers(matches)
     if not players:
         return
-    zero_timestamp = models.Match.objects.all()[0].timestamp - datetime.timedelta(seconds=1)
-    for player, start_number in players.items():
-        models.KickerNumber.objects.create(player=player, number=start_number, timestamp=zero_timestamp)
-    for match in models.Match.objects.iterator():
-        MatchResult(match).add_kicker_numbers()
+    zero_timestamp = matches[0].timestamp - datetime.timedelta(seconds=1)
+    kicker_numbers = [models.KickerNumber(player_id=player_id, number=number, timestamp=zero_timestamp)
+                      for player_id, number in players.items()]
+    counts = dict.fromkeys(players, 1)
+    matches_by_player = {}
+    for match in matches:
+        for player_id in set(match[:4]):
+            matches_by_player.setdefault(player_id, []).append(match)
+    # Maps players whose estimate failed to the number of rated players at that
+    # time.  The estimate can only succeed after further players have got a
+    # kicker number.
+    failed_estimates = {}
+    for match in matches:
+        try:
+            numbers = []
+            for player_id in match[:4]:
+                if player_id in players:
+                    numbers.append(players[player_id])
+                elif failed_estimates.get(player_id) == len(players):
+                    raise NoKickerNumber
+                else:
+                    try:
+                        numbers.append(estimate_kicker_number(player_id, matches_by_player[player_id], players))
+                    except NoKickerNumber:
+                        failed_estimates[player_id] = len(players)
+                        raise
+        except NoKickerNumber:
+            continue
+        delta = get_elo_delta(match.goals_a, match.goals_b, numbers[0], numbers[1], numbers[2], numbers[3],
+                              match.seconds, two_player_game=match.player_a_1 == match.player_a_2)
+        new_numbers = [number + sign * get_k(counts.get(player_id, 0)) * delta
+                       for player_id, number, sign in zip(match[:4], numbers, (1, 1, -1, -1))]
+        for player_id, number in zip(match[:4], new_numbers):
+            players[player_id] = number
+            counts[player_id] = counts.get(player_id, 0) + 1
+            kicker_numbers.append(models.KickerNumber(player_id=player_id, number=number, timestamp=match.timestamp))
+    models.KickerNumber.objects.bulk_create(kicker_numbers, batch_size=1000)
+    schedule_plot_update()
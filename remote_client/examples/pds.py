@@ -41,31 +41,35 @@ def read_pds_file(filepath):
 setup_logging("console")
 login("juliabase", "12345")
 
-for filepath in sorted(glob.glob("pds_raw_data/*.dat")):
+filepaths = sorted(glob.glob("pds_raw_data/*.dat"))
+get_samples(read_pds_file(filepath)["sample"] for filepath in filepaths)
+
+for filepath in filepaths:
     pds_header_data = read_pds_file(filepath)
-    try:
-        sample_id = get_sample(pds_header_data["sample"])
-    except SampleNotFound as exception:
-        sample = exception.sample
-        sample.currently_responsible_person = pds_header_data["operator"]
-        sample.current_location = "PDS lab"
-        sample.topic = "Legacy"
-        sample_id = sample.submit()
+    with BulkSubmission():
+        try:
+            sample_id = get_sample(pds_header_data["sample"])
+        except SampleNotFound as exception:
+            sample = exception.sample
+            sample.currently_responsible_person = pds_header_data["operator"]
+            sample.current_location = "PDS lab"
+            sample.topic = "Legacy"
+            sample_id = sample.submit()
 
-        substrate = Substrate()
-        substrate.timestamp = pds_header_data["timestamp"] - datetime.timedelta(minutes=1)
-        substrate.timestamp_inaccuracy = 3
-        substrate.sample_ids = [sample_id]
-        substrate.material = "corning"
-        substrate.operator = "n.burkhardt"
-        substrate.submit()
-    pds_measurement = PDSMeasurement()
-    pds_measurement.operator = pds_header_data["operator"]
-    pds_measurement.timestamp = pds_header_data["timestamp"]
-    pds_measurement.number = pds_header_data["number"]
-    pds_measurement.apparatus = "pds" + pds_header_data["apparatus"]
-    pds_measurement.raw_datafile = os.path.basename(filepath)
-    pds_measurement.sample_id = sample_id
-    pds_measurement.submit()
+            substrate = Substrate()
+            substrate.timestamp = pds_header_data["timestamp"] - datetime.timedelta(minutes=1)
+            substrate.timestamp_inaccuracy = 3
+            substrate.sample_ids = [sample_id]
+            substrate.material = "corning"
+            substrate.operator = "n.burkhardt"
+            substrate.submit()
+        pds_measurement = PDSMeasurement()
+        pds_measurement.operator = pds_header_data["operator"]
+        pds_measurement.timestamp = pds_header_data["timestamp"]
+        pds_measurement.number = pds_header_data["number"]
+        pds_measurement.apparatus = "pds" + pds_header_data["apparatus"]
+        pds_measurement.raw_datafile = os.path.basename(filepath)
+        pds_measurement.sample_id = sample_id
+        pds_measurement.submit()
 
 logout()
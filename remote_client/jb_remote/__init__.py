@@ -19,6 +19,7 @@
 
 from __future__ import absolute_import, unicode_literals, division
 
-from .common import login, logout, connection, primary_keys, JuliaBaseError, setup_logging, format_timestamp, parse_timestamp
-from .samples import TemporaryMySamples, Sample, Result
+from .common import login, logout, connection, primary_keys, JuliaBaseError, setup_logging, format_timestamp, parse_timestamp, \
+    BulkSubmission, submit_many, submit_concurrently
+from .samples import TemporaryMySamples, Sample, Result, get_sample_ids
 from . import settings
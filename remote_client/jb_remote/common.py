@@ -40,9 +40,10 @@
 
 from __future__ import absolute_import, unicode_literals, division
 from . import six
-from .six.moves import urllib, http_cookiejar, _thread
+from .six.moves import urllib, http_cookiejar, http_client, _thread
 
-import mimetypes, json, logging, os, datetime, time, random, re
+import mimetypes, json, logging, os, datetime, time, random, re, socket, threading, io, errno
+from multiprocessing.pool import ThreadPool
 from io import IOBase
 if six.PY3:
     file = IOBase
@@ -111,6 +112,8 @@ def clean_header(value):
 
 
 def comma_separated_ids(ids):
+    if isinstance(ids, PendingResult):
+        return str(ids)
     return ",".join(str(id_) for id_ in ids)
 
 
@@ -312,49 +315,238 @@ class JuliaBaseError(Exception):
         return "({0}) {1}".format(self.error_code, self.error_message)
 
 
+@python_2_unicode_compatible
+class PendingResult(object):
+    """Placeholder for the result of a POST request which is collected by
+    `BulkSubmission` rather than being sent immediately.  It may be used in the
+    POST data of subsequent requests of the same bulk; the server replaces it
+    with the actual result.
+
+    :ivar index: the index of the request in the bulk
+
+    :type index: int
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def __str__(self):
+        return "\x00result:{0}\x00".format(self.index)
+
+
+class HTTPResponse(object):
+    """Completely read response of an HTTP request.  It provides the subset of
+    the interface of urllib's responses that is needed by the cookie jar and by
+    `JuliaBaseConnection`.
+
+    :ivar status: the HTTP status code
+    :ivar reason: the HTTP reason phrase
+    :ivar headers: the response headers
+    :ivar body: the response body
+
+    :type status: int
+    :type reason: str
+    :type headers: ``http.client.HTTPMessage``
+    :type body: bytes
+    """
+
+    def __init__(self, status, reason, headers, body):
+        self.status, self.reason, self.headers, self.body = status, reason, headers, body
+
+    def info(self):
+        return self.headers
+
+    def read(self):
+        return self.body
+
+
+class HTTPConnectionPool(object):
+    """Pool of persistent HTTP connections.  The connections are kept alive
+    between requests, so that TCP and TLS handshakes are done only once per
+    connection.  The pool is thread-safe: Every thread takes an idle connection
+    out of the pool for one request, or opens a new one if there is none, and
+    puts it back afterwards.  Thus, there are never more connections than
+    threads making requests.
+    """
+
+    def __init__(self, timeout=120):
+        """Class constructor.
+
+        :param timeout: timeout in seconds for socket operations
+
+        :type timeout: float
+        """
+        self.timeout = timeout
+        self.idle_connections = {}
+        self.lock = threading.Lock()
+
+    def _new_connection(self, scheme, netloc):
+        connection_class = http_client.HTTPSConnection if scheme == "https" else http_client.HTTPConnection
+        return connection_class(netloc, timeout=self.timeout)
+
+    def _get_connection(self, scheme, netloc):
+        """Returns an idle connection from the pool, or a new one.
+
+        :return:
+          the connection, whether it was taken from the pool
+
+        :rtype: ``http.client.HTTPConnection``, bool
+        """
+        with self.lock:
+            connections = self.idle_connections.get((scheme, netloc))
+            if connections:
+                return connections.pop(), True
+        return self._new_connection(scheme, netloc), False
+
+    def request(self, method, url, body=None, headers={}):
+        """Sends an HTTP request over a pooled connection and reads the
+        response completely.
+
+        :param method: the HTTP method, e.g. ``"GET"``
+        :param url: the absolute URL
+        :param body: the request body
+        :param headers: the request headers
+
+        :type method: str
+        :type url: str
+        :type body: bytes or NoneType
+        :type headers: dict mapping str to str
+
+        :return:
+          the response
+
+        :rtype: `HTTPResponse`
+
+        :raises socket.error: if a network error occured
+        :raises http.client.HTTPException: if the server's response was
+          invalid
+        """
+        components = urllib.parse.urlsplit(url)
+        path = components.path or "/"
+        if components.query:
+            path += "?" + components.query
+        connection, reused = self._get_connection(components.scheme, components.netloc)
+        try:
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+            except socket.timeout:
+                raise
+            except (socket.error, http_client.BadStatusLine):
+                if not reused:
+                    raise
+                # The server has closed the kept-alive connection meanwhile,
+                # so it hasn't processed the request.  Thus, sending it once
+                # more is safe even for POST requests.
+                connection.close()
+                connection = self._new_connection(components.scheme, components.netloc)
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+            body = response.read()
+        except:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            with self.lock:
+                self.idle_connections.setdefault((components.scheme, components.netloc), []).append(connection)
+        return HTTPResponse(response.status, response.reason, response.msg, body)
+
+    def close(self):
+        """Closes all idle connections.
+        """
+        with self.lock:
+            for connections in self.idle_connections.values():
+                for connection in connections:
+                    connection.close()
+            self.idle_connections.clear()
+
+
 class JuliaBaseConnection(object):
     """Class for the routines that connect to the database at HTTP level.
     This is a singleton class, and its only instance resides at top-level in
     this module.
+
+    The connection is thread-safe, so that many requests can be made
+    concurrently, see `submit_concurrently`.  The HTTP connections to the
+    server are kept alive and re-used.  Every request is logged together with
+    the time it took.
     """
     cookie_jar = http_cookiejar.CookieJar()
-    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookie_jar))
-    http_headers = [("User-agent", "JuliaBase-Remote/1.0c"),
-                    ("X-requested-with", "XMLHttpRequest"),
-                    ("Accept", "application/json,text/html;q=0.9,application/xhtml+xml;q=0.9,text/*;q=0.8,*/*;q=0.7")]
-    opener.addheaders = http_headers
+    http_headers = {"User-agent": "JuliaBase-Remote/1.0c",
+                    "X-requested-with": "XMLHttpRequest",
+                    "Accept": "application/json,text/html;q=0.9,application/xhtml+xml;q=0.9,text/*;q=0.8,*/*;q=0.7"}
 
     def __init__(self):
         self.username = None
         self.root_url = None
+        self.csrf_token = None
+        self.pool = HTTPConnectionPool()
+        self.bulk = threading.local()
+
+    def _request_with_cookies(self, method, url, body, headers):
+        """Sends an HTTP request, taking care of cookies and redirects.
+        Redirects are followed like urllib does it.
+        """
+        max_redirects = 10
+        while True:
+            request = urllib.request.Request(url, headers=headers)
+            self.cookie_jar.add_cookie_header(request)
+            response = self.pool.request(method, url, body, dict(request.header_items()))
+            self.cookie_jar.extract_cookies(response, request)
+            location = response.info().get("Location")
+            if response.status not in [301, 302, 303, 307] or not location or not max_redirects:
+                return response
+            max_redirects -= 1
+            url = urllib.parse.urljoin(url, location)
+            if response.status != 307:
+                method, body = "GET", None
+                headers = dict((key, value) for key, value in headers.items() if key != "Content-Type")
 
     def _do_http_request(self, url, data=None):
         logging.debug("{0} {1!r}".format(url, data))
+        headers = self.http_headers.copy()
+        if self.csrf_token:
+            headers["X-CSRFToken"] = self.csrf_token
         if data is None:
-            request = urllib.request.Request(url)
+            method, body = "GET", None
         else:
+            method = "POST"
             content_type, body = encode_multipart_formdata(data)
-            headers = {"Content-Type": content_type, "Referer": url}
-            request = urllib.request.Request(url, body, headers)
+            if isinstance(body, six.text_type):
+                body = body.encode("utf-8")
+            headers.update({"Content-Type": content_type, "Referer": url})
         max_cycles = 10
-        while max_cycles > 0:
+        while True:
             max_cycles -= 1
+            start_time = time.time()
             try:
-                return self.opener.open(request)
-            except urllib.error.HTTPError as error:
-                if error.code in [404, 422] and error.info()["Content-Type"].startswith("application/json"):
-                    error_code, error_message = json.loads(error.read().decode("utf-8"))
-                    raise JuliaBaseError(error_code, error_message)
-                server_error_message = error.read().decode("utf-8")
-                error.msg = "{}\n\n{}".format(error.msg, server_error_message)
-                if six.PY2:
-                    error.msg = error.msg.encode("utf-8")
-                raise error
-            except urllib.error.URLError:
-                if max_cycles == 0:
-                    logging.error("Request failed.")
-                    raise
-            time.sleep(3 * random.random())
+                response = self._request_with_cookies(method, url, body, headers)
+            except (socket.error, http_client.HTTPException) as error:
+                # A POST request may have been processed by the server
+                # although the response didn't arrive, e.g. after a timeout.
+                # Sending it again could add things twice.  Only if the
+                # server could not be reached at all, it is safe.
+                not_sent = isinstance(error, socket.gaierror) or getattr(error, "errno", None) == errno.ECONNREFUSED
+                if max_cycles == 0 or method == "POST" and not not_sent:
+                    logging.error("{0} {1} failed: {2!r}".format(method, url, error))
+                    raise urllib.error.URLError(error)
+                logging.warning("{0} {1} failed: {2!r}".format(method, url, error))
+                time.sleep(3 * random.random())
+                continue
+            logging.info("{0} {1} {2} {3:.3f}s".format(method, url, response.status, time.time() - start_time))
+            break
+        if response.status >= 400:
+            if response.status in [404, 422] and (response.info().get("Content-Type") or "").startswith("application/json"):
+                error_code, error_message = json.loads(response.read().decode("utf-8"))
+                raise JuliaBaseError(error_code, error_message)
+            server_error_message = response.read().decode("utf-8")
+            message = "{}\n\n{}".format(response.reason, server_error_message)
+            if six.PY2:
+                message = message.encode("utf-8")
+            raise urllib.error.HTTPError(url, response.status, message, response.info(), io.BytesIO(response.read()))
+        return response
 
     def open(self, relative_url, data=None, response_is_json=True):
         """Do an HTTP request with the JuliaBase server.  If ``data`` is not
@@ -400,11 +592,17 @@ class JuliaBaseConnection(object):
                         cleaned_list = [clean_header(item) for item in value if value is not None]
                         if cleaned_list:
                             cleaned_data[key] = cleaned_list
+            bulk_requests = getattr(self.bulk, "requests", None)
+            if bulk_requests is not None:
+                if any(isinstance(value, file) for value in cleaned_data.values()):
+                    raise ValueError("Files can't be submitted in a bulk.")
+                bulk_requests.append((relative_url, cleaned_data))
+                return PendingResult(len(bulk_requests) - 1)
             response = self._do_http_request(self.root_url + relative_url, cleaned_data)
         else:
             response = self._do_http_request(self.root_url + relative_url)
         if response_is_json:
-            assert response.info()["Content-Type"].startswith("application/json")
+            assert (response.info().get("Content-Type") or "").startswith("application/json")
             return json.loads(response.read().decode("utf-8"))
         else:
             return response.read()
@@ -413,7 +611,7 @@ class JuliaBaseConnection(object):
         csrf_cookies = {cookie for cookie in self.cookie_jar if cookie.name == "csrftoken"}
         if csrf_cookies:
             assert len(csrf_cookies) == 1
-            self.opener.addheaders = self.http_headers + [("X-CSRFToken", csrf_cookies.pop().value)]
+            self.csrf_token = csrf_cookies.pop().value
 
     def login(self, root_url, username, password):
         self.root_url = root_url
@@ -428,7 +626,8 @@ class JuliaBaseConnection(object):
 
     def logout(self):
         self.open("logout_remote_client")
-        self.username = self.root_url = None
+        self.username = self.root_url = self.csrf_token = None
+        self.pool.close()
 
 connection = JuliaBaseConnection()
 
@@ -461,6 +660,119 @@ def logout():
     logging.info("Successfully logged-out.")
 
 
+class BulkSubmission(object):
+    """Context manager for submitting many objects to JuliaBase with one
+    request.  Within the context, POST requests are collected rather than sent.
+    At the end of the context, they are sent to the server at once, which
+    processes them in one transaction.  Thus, either all of them succeed, or
+    nothing is changed in the database.  GET requests are done immediately as
+    usual.  Files can't be uploaded in a bulk.  Only the add and edit views of
+    the server can be used in a bulk, and at most 1000 requests.
+
+    This context manager should be used like this::
+
+        with BulkSubmission() as bulk:
+            sample_id = sample.submit()
+            substrate.sample_ids = [sample_id]
+            substrate.submit()
+        sample_id = bulk.resolve(sample_id)
+
+    Within the context, the return values of POST requests are `PendingResult`
+    placeholders.  They can be used in subsequent submissions of the same bulk,
+    like the sample ID above.  After the context, `resolve` gives the actual
+    values.
+    """
+
+    def __enter__(self):
+        self.requests = connection.bulk.requests = []
+        self.results = None
+        return self
+
+    def __exit__(self, type_, value, tb):
+        connection.bulk.requests = None
+        if type_ is None and self.requests:
+            self.results = connection.open("bulk_submit", {"requests": json.dumps(self.requests)})
+            logging.info("Submitted {0} requests in a bulk.".format(len(self.requests)))
+
+    def resolve(self, value):
+        """Replaces `PendingResult` placeholders by the actual values.
+
+        :param value: the value which may be or contain a placeholder
+
+        :type value: ``object``
+
+        :return:
+          the value with all placeholders replaced, also in lists
+
+        :rtype: ``object``
+        """
+        if isinstance(value, PendingResult):
+            return self.results[value.index]
+        elif isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        return value
+
+
+def submit_many(objects):
+    """Submits many objects to JuliaBase with one request, see
+    `BulkSubmission`.  After the submission, attributes of the objects
+    containing placeholders are set to the actual values, e.g. the ``id`` of
+    newly added processes.
+
+    :param objects: the objects to be submitted, e.g. instances of
+        :py:class:`~jb_remote_inm.PDSMeasurement`
+
+    :type objects: iterable of objects with a ``submit()`` method
+
+    :return:
+      the return values of the ``submit()`` calls, in the order of `objects`
+
+    :rtype: list
+
+    :raises JuliaBaseError: if one of the submissions failed; then, nothing has
+        been changed in the database
+    """
+    objects = list(objects)
+    with BulkSubmission() as bulk:
+        return_values = [object_.submit() for object_ in objects]
+    for object_ in objects:
+        for name, value in list(vars(object_).items()):
+            resolved_value = bulk.resolve(value)
+            if resolved_value is not value:
+                setattr(object_, name, resolved_value)
+    return [bulk.resolve(value) for value in return_values]
+
+
+def submit_concurrently(objects, max_parallel=4):
+    """Submits many objects to JuliaBase concurrently.  This calls the
+    ``submit()`` methods of the objects in a pool of threads.  Since every
+    request spends most of its time waiting for the server, this is much faster
+    than submitting them one after the other.  The order of the submissions is
+    undefined, so the objects must not depend on each other.
+
+    :param objects: the objects to be submitted, e.g. instances of
+        :py:class:`~jb_remote_inm.PDSMeasurement`
+    :param max_parallel: maximal number of concurrent submissions
+
+    :type objects: iterable of objects with a ``submit()`` method
+    :type max_parallel: int
+
+    :return:
+      the return values of the ``submit()`` calls, in the order of `objects`
+
+    :rtype: list
+
+    :raises JuliaBaseError: if one of the submissions failed; the others have
+        been completed nevertheless
+    """
+    pool = ThreadPool(max_parallel)
+    try:
+        return pool.map(lambda object_: object_.submit(), objects, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
 class PrimaryKeys(object):
     """Dictionary-like class for storing primary keys.  I use this class only
     to delay the costly loading of the primary keys until they are really
@@ -479,10 +791,12 @@ class PrimaryKeys(object):
     def __init__(self):
         self.primary_keys = None
         self.components = {"topics=*", "users=*"}
+        self.lock = threading.Lock()
 
     def __getitem__(self, key):
-        if self.primary_keys is None:
-            self.primary_keys = connection.open("primary_keys?" + "&".join(self.components))
+        with self.lock:
+            if self.primary_keys is None:
+                self.primary_keys = connection.open("primary_keys?" + "&".join(self.components))
         return self.primary_keys[key]
 
 primary_keys = PrimaryKeys()
@@ -22,7 +22,8 @@ from six.moves import cPickle as pickle
 from six.moves.email_mime_multipart import MIMEMultipart
 from six.moves.email_mime_text import MIMEText
 
-import os, sys, re, subprocess, time, smtplib, email, logging
+import os, sys, re, time, smtplib, email, logging, hashlib, sqlite3
+from multiprocessing.pool import ThreadPool
 
 from . import settings
 
@@ -99,7 +100,123 @@ class PIDLock(object):
             logging.info("Removed lock {0}".format(self.lockfile_path))
 
 
-def find_changed_files(root, diff_file, pattern=""):
+def _new_hash():
+    """Returns a new hash object for the digests of the files in the change
+    index.  BLAKE2 is considerably faster than MD5 and SHA-1 on 64-bit
+    machines, but it is not available on older Pythons.
+    """
+    try:
+        return hashlib.blake2b(digest_size=20)
+    except AttributeError:
+        return hashlib.sha1()
+
+
+def _hash_file(filepath):
+    """Calculates the digest of a file.  This is called in the threads of the
+    hashing pool.  Since hashlib releases the GIL for large buffers, the threads
+    really work in parallel.
+
+    :param filepath: absolute path to the file
+
+    :type filepath: str
+
+    :return:
+      the path to the file, the digest of the file, or ``None`` if the file
+      could not be read
+
+    :rtype: str, bytes or NoneType
+    """
+    hash_ = _new_hash()
+    try:
+        with open(filepath, "rb") as file_:
+            for chunk in iter(lambda: file_.read(1024 * 1024), b""):
+                hash_.update(chunk)
+    except (IOError, OSError):
+        return filepath, None
+    return filepath, hash_.digest()
+
+
+def _subtree_range(relative_dirpath):
+    """Returns the bounds of all paths below the given directory, for a
+    ``BETWEEN``-like SQL condition.  This avoids escaping for ``LIKE``.
+    """
+    return relative_dirpath + os.sep, relative_dirpath + chr(ord(os.sep) + 1)
+
+
+def _open_change_index(diff_file):
+    """Opens the SQLite database with the modification status of all files.
+    It is created if it doesn't exist yet.  A pickle file of older versions of
+    `find_changed_files` is converted, so that its files are not reported as
+    changed once more.
+
+    :param diff_file: path to the database file
+
+    :type diff_file: str
+
+    :return:
+      the database connection
+
+    :rtype: ``sqlite3.Connection``
+    """
+    schema = """CREATE TABLE IF NOT EXISTS files (directory TEXT, name TEXT, mtime REAL, digest BLOB,
+                                                  PRIMARY KEY (directory, name));
+                CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, parent TEXT, mtime REAL);
+                CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+                CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);"""
+    connection = sqlite3.connect(diff_file)
+    connection.text_factory = str
+    try:
+        connection.executescript(schema)
+    except sqlite3.DatabaseError:
+        connection.close()
+        statuses, pattern = pickle.load(open(diff_file, "rb"))
+        if os.path.exists(diff_file + ".tmp"):
+            os.remove(diff_file + ".tmp")
+        connection = sqlite3.connect(diff_file + ".tmp")
+        connection.text_factory = str
+        connection.executescript(schema)
+        connection.executemany("INSERT INTO files VALUES (?, ?, ?, NULL)",
+                               (os.path.split(relative_filepath) + (status[0],)
+                                for relative_filepath, status in statuses.items()))
+        connection.execute("INSERT INTO settings VALUES ('pattern', ?)", (pattern,))
+        connection.commit()
+        connection.close()
+        os.rename(diff_file + ".tmp", diff_file)
+        connection = sqlite3.connect(diff_file)
+        connection.text_factory = str
+    return connection
+
+
+def _remove_directories_from_index(connection, relative_dirpaths):
+    """Removes directories, including their subdirectories, from the change
+    index.
+
+    :param connection: the change index
+    :param relative_dirpaths: the directories to be removed, relative to the
+        root
+
+    :type connection: ``sqlite3.Connection``
+    :type relative_dirpaths: iterable of str
+
+    :return:
+      the relative paths of all files which were contained in the removed
+      directories
+
+    :rtype: list of str
+    """
+    removed = []
+    for relative_dirpath in relative_dirpaths:
+        lower, upper = _subtree_range(relative_dirpath)
+        condition = "(directory = ? OR directory >= ? AND directory < ?)"
+        removed.extend(os.path.join(directory, name) for directory, name in connection.execute(
+            "SELECT directory, name FROM files WHERE " + condition, (relative_dirpath, lower, upper)))
+        connection.execute("DELETE FROM files WHERE " + condition, (relative_dirpath, lower, upper))
+        connection.execute("DELETE FROM directories WHERE path = ? OR path >= ? AND path < ?",
+                           (relative_dirpath, lower, upper))
+    return removed
+
+
+def find_changed_files(root, diff_file, pattern="", prune_unchanged_directories=False, threads=4):
     """Returns the files changed or removed since the last run of this
     function.  The files are given as a list of absolute paths.  Changed files
     are files which have been added or modified.  If a file was moved, the new
@@ -111,16 +228,30 @@ def find_changed_files(root, diff_file, pattern=""):
     modification status of the last run only refers to file paths relative to
     ``root``.
 
+    The modification status is stored in an SQLite database, which is updated
+    incrementally.  Besides the files, it contains the mtimes of the
+    directories.  Directories whose mtime hasn't changed are not listed again,
+    because their entries are known.  Only files whose mtime has changed are
+    read in order to compare their digests.  This happens in a thread pool.
+
     :param root: absolute root path of the files to be scanned
-    :param diff_file: path to a writable pickle file which contains the
+    :param diff_file: path to a writable SQLite file which contains the
         modification status of all files of the last run; it is created if it
         doesn't exist yet
     :param pattern: Regular expression for filenames (without path) that should
         be scanned.  By default, all files are scanned.
+    :param prune_unchanged_directories: Whether files in directories whose
+        mtime hasn't changed are not checked at all.  This is much faster, in
+        particular on network shares.  But it misses files that are modified in
+        place, because this doesn't change the mtime of the directory.  So use
+        it only for measurement files which are written once.
+    :param threads: number of threads which calculate the file digests
 
     :type root: str
     :type diff_file: str
     :type pattern: unicode
+    :type prune_unchanged_directories: bool
+    :type threads: int
 
     :return:
       files changed, files removed
@@ -128,49 +259,101 @@ def find_changed_files(root, diff_file, pattern=""):
     :rtype: list of str, list of str
     """
     compiled_pattern = re.compile(pattern, re.IGNORECASE)
-    if os.path.exists(diff_file):
-        statuses, last_pattern = pickle.load(open(diff_file, "rb"))
-        if last_pattern != pattern:
-            for relative_filepath in [relative_filepath for relative_filepath in statuses
-                                      if not compiled_pattern.match(os.path.basename(relative_filepath))]:
-                del statuses[relative_filepath]
-    else:
-        statuses, last_pattern = {}, None
-    touched = []
-    found = set()
-    for dirname, __, filenames in os.walk(root):
+    connection = _open_change_index(diff_file)
+    settings_ = dict(connection.execute("SELECT key, value FROM settings"))
+    if settings_.get("pattern") != pattern:
+        connection.executemany("DELETE FROM files WHERE directory = ? AND name = ?",
+                               [(directory, name) for directory, name in connection.execute(
+                                   "SELECT directory, name FROM files") if not compiled_pattern.match(name)])
+        # Force re-listing of all directories in order to find files which match
+        # only the new pattern.
+        connection.execute("UPDATE directories SET mtime = NULL")
+        connection.execute("INSERT OR REPLACE INTO settings VALUES ('pattern', ?)", (pattern,))
+    digest_algorithm = _new_hash().name
+    if settings_.get("digest_algorithm") != digest_algorithm:
+        connection.execute("UPDATE files SET digest = NULL")
+        connection.execute("INSERT OR REPLACE INTO settings VALUES ('digest_algorithm', ?)", (digest_algorithm,))
+    # Directories modified just now are listed again next time, because further
+    # changes within the mtime resolution could go unnoticed otherwise.
+    recent_threshold = time.time() - 10
+    touched = {}
+    removed = []
+    # Directories with files which could not be read are listed again next
+    # time, so that these files are not forgotten.
+    failed_directories = set()
+    directories_to_visit = [""]
+    while directories_to_visit:
+        relative_dirpath = directories_to_visit.pop()
+        dirpath = os.path.join(root, relative_dirpath)
+        try:
+            directory_mtime = os.path.getmtime(dirpath)
+        except OSError:
+            continue
+        row = connection.execute("SELECT mtime FROM directories WHERE path = ?", (relative_dirpath,)).fetchone()
+        known_files = dict((name, mtime) for name, mtime in connection.execute(
+            "SELECT name, mtime FROM files WHERE directory = ?", (relative_dirpath,)))
+        known_subdirectories = set(path for path, in connection.execute(
+            "SELECT path FROM directories WHERE parent = ?", (relative_dirpath,)))
+        if row and row[0] is not None and row[0] == directory_mtime:
+            directories_to_visit.extend(known_subdirectories)
+            if prune_unchanged_directories:
+                continue
+            filenames = list(known_files)
+        else:
+            try:
+                names = os.listdir(dirpath)
+            except OSError:
+                continue
+            filenames, subdirectories = [], set()
+            for name in names:
+                if os.path.isdir(os.path.join(dirpath, name)):
+                    subdirectories.add(os.path.join(relative_dirpath, name))
+                elif compiled_pattern.match(name):
+                    filenames.append(name)
+            removed_filenames = set(known_files) - set(filenames)
+            connection.executemany("DELETE FROM files WHERE directory = ? AND name = ?",
+                                   ((relative_dirpath, name) for name in removed_filenames))
+            removed.extend(os.path.join(relative_dirpath, name) for name in removed_filenames)
+            removed.extend(_remove_directories_from_index(connection, known_subdirectories - subdirectories))
+            connection.executemany("INSERT OR IGNORE INTO directories VALUES (?, ?, NULL)",
+                                   ((path, relative_dirpath) for path in subdirectories - known_subdirectories))
+            connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?)",
+                               (relative_dirpath, os.path.dirname(relative_dirpath) if relative_dirpath else None,
+                                directory_mtime if directory_mtime < recent_threshold else None))
+            directories_to_visit.extend(subdirectories)
         for filename in filenames:
-            if compiled_pattern.match(filename):
-                filepath = os.path.join(dirname, filename)
-                relative_filepath = os.path.relpath(filepath, root)
-                found.add(relative_filepath)
+            filepath = os.path.join(dirpath, filename)
+            try:
                 mtime = os.path.getmtime(filepath)
-                status = statuses.setdefault(relative_filepath, [None, None])
-                if mtime != status[0]:
-                    status[0] = mtime
-                    touched.append(filepath)
-    removed = set(statuses) - found
-    for relative_filepath in removed:
-        del statuses[relative_filepath]
-    removed = [os.path.join(root, relative_filepath) for relative_filepath in removed]
+            except OSError:
+                failed_directories.add(relative_dirpath)
+                continue
+            if mtime != known_files.get(filename):
+                touched[filepath] = (relative_dirpath, filename, mtime)
     changed = []
-    timestamps = {}
     if touched:
-        xargs_process = subprocess.Popen(["xargs", "-0", "md5sum"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        xargs_output = xargs_process.communicate(b"\0".join(touched))[0]
-        if xargs_process.returncode != 0:
-            raise subprocess.CalledProcessError(xargs_process.returncode, "xargs")
-        for line in xargs_output.splitlines():
-            md5sum, __, filepath = line.partition(b"  ")
-            status = statuses[os.path.relpath(filepath, root)]
-            if md5sum != status[1]:
-                status[1] = md5sum
-                changed.append(filepath)
-                timestamps[filepath] = status[0]
-    changed.sort(key=lambda filepath: timestamps[filepath])
-    if touched or removed or last_pattern != pattern:
-        pickle.dump((statuses, pattern), open(diff_file, "wb"), pickle.HIGHEST_PROTOCOL)
-    return changed, removed
+        pool = ThreadPool(threads)
+        try:
+            for filepath, digest in pool.imap_unordered(_hash_file, touched, chunksize=16):
+                relative_dirpath, filename, mtime = touched[filepath]
+                if digest is None:
+                    failed_directories.add(relative_dirpath)
+                    continue
+                row = connection.execute("SELECT digest FROM files WHERE directory = ? AND name = ?",
+                                         (relative_dirpath, filename)).fetchone()
+                if row is None or row[0] is None or bytes(row[0]) != digest:
+                    changed.append((mtime, filepath))
+                connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                   (relative_dirpath, filename, mtime, sqlite3.Binary(digest)))
+        finally:
+            pool.close()
+            pool.join()
+    connection.executemany("UPDATE directories SET mtime = NULL WHERE path = ?",
+                           ((relative_dirpath,) for relative_dirpath in failed_directories))
+    connection.commit()
+    connection.close()
+    changed.sort()
+    return [filepath for __, filepath in changed], [os.path.join(root, relative_filepath) for relative_filepath in removed]
 
 
 def defer_files(diff_file, filepaths):
@@ -185,7 +368,7 @@ def defer_files(diff_file, filepaths):
 
     If a filepath is not found in the diff file, this is ignored.
 
-    :param diff_file: path to a writable pickle file which contains the
+    :param diff_file: path to a writable SQLite file which contains the
         modification status of all files of the last run; it is created if it
         doesn't exist yet
     :param filepaths: all relative paths that should be removed from the diff
@@ -195,12 +378,16 @@ def defer_files(diff_file, filepaths):
     :type diff_file: str
     :type filepaths: iterable of str
     """
-    statuses, pattern = pickle.load(open(diff_file, "rb"))
+    connection = _open_change_index(diff_file)
     twelve_weeks_ago = time.time() - 12 * 7 * 24 * 3600
     for filepath in filepaths:
-        if filepath in statuses and statuses[filepath][0] > twelve_weeks_ago:
-            del statuses[filepath]
-    pickle.dump((statuses, pattern), open(diff_file, "wb"), pickle.HIGHEST_PROTOCOL)
+        relative_dirpath, filename = os.path.split(filepath)
+        if connection.execute("DELETE FROM files WHERE directory = ? AND name = ? AND mtime > ?",
+                              (relative_dirpath, filename, twelve_weeks_ago)).rowcount:
+            # The directory must be listed again so that the file is found.
+            connection.execute("UPDATE directories SET mtime = NULL WHERE path = ?", (relative_dirpath,))
+    connection.commit()
+    connection.close()
 
 
 def send_error_mail(from_, subject, text, html=None):
@@ -19,8 +19,10 @@
 
 from __future__ import absolute_import, unicode_literals, division
 
-import json
+import json, time, threading
+from .six.moves import urllib
 from .common import connection, primary_keys, comma_separated_ids, double_urlquote, format_timestamp, parse_timestamp, logging
+from . import settings
 
 
 primary_keys.components.add("external_operators=*")
@@ -60,6 +62,62 @@ class TemporaryMySamples(object):
             connection.open("change_my_samples", {"remove": comma_separated_ids(self.changed_sample_ids)})
 
 
+_sample_ids_cache = {}
+_sample_ids_cache_lock = threading.Lock()
+
+def get_sample_ids(sample_names):
+    """Looks up the IDs of many samples at once.  This is much faster than
+    looking up the samples one by one, so crawlers should resolve the names of
+    all samples they need up front.  The results are cached for
+    ``settings.SAMPLE_IDS_CACHE_TIMEOUT`` seconds.  Names which were not
+    found are not cached.
+
+    :param sample_names: the names of the samples; they may also be aliases
+
+    :type sample_names: iterable of unicode
+
+    :return:
+      the IDs of the found samples.  A current sample name is mapped to the ID
+      of the sample.  An alias is mapped to a list of IDs because it may refer
+      to more than one sample.  Names which were not found are missing.
+
+    :rtype: dict mapping unicode to int or list of int
+    """
+    result = {}
+    missing_names = []
+    now = time.time()
+    with _sample_ids_cache_lock:
+        for sample_name in set(sample_names):
+            try:
+                timestamp, sample_id = _sample_ids_cache[sample_name]
+            except KeyError:
+                missing_names.append(sample_name)
+            else:
+                if now - timestamp < settings.SAMPLE_IDS_CACHE_TIMEOUT:
+                    result[sample_name] = sample_id
+                else:
+                    missing_names.append(sample_name)
+    # The names are sent in chunks so that the URLs don't get too long.
+    chunks, chunk, length = [], [], 0
+    for sample_name in missing_names:
+        quoted_name = urllib.parse.quote_plus(sample_name)
+        if chunk and length + len(quoted_name) > 2000:
+            chunks.append(chunk)
+            chunk, length = [], 0
+        chunk.append(quoted_name)
+        length += len(quoted_name) + 1
+    if chunk:
+        chunks.append(chunk)
+    for chunk in chunks:
+        sample_ids = connection.open("primary_keys?samples=" + ",".join(chunk))["samples"]
+        now = time.time()
+        with _sample_ids_cache_lock:
+            for sample_name, sample_id in sample_ids.items():
+                _sample_ids_cache[sample_name] = (now, sample_id)
+        result.update(sample_ids)
+    return result
+
+
 class Sample(object):
     """Class representing samples.
     """
@@ -105,6 +163,8 @@ class Sample(object):
                 "edit_description-important": self.edit_important}
         if self.topic:
             data["topic"] = primary_keys["topics"][self.topic]
+        with _sample_ids_cache_lock:
+            _sample_ids_cache.pop(self.name, None)
         if self.id:
             connection.open("samples/by_id/{0}/edit/".format(self.id), data)
             logging.info("Edited sample {0}.".format(self.name))
@@ -40,6 +40,9 @@ from __future__ import absolute_import, unicode_literals, division
 ROOT_URL = None
 TESTSERVER_ROOT_URL = "https://demo.juliabase.org/"
 
+# In seconds.
+SAMPLE_IDS_CACHE_TIMEOUT = 600
+
 SMTP_SERVER = "mailrelay.example.com:587"
 # If not empty, TLS is used.
 SMTP_LOGIN = "username"
@@ -36,7 +36,6 @@ characters.
 
 from __future__ import absolute_import, unicode_literals
 from jb_remote import six
-from jb_remote.six.moves import urllib
 
 import re, logging, datetime
 from jb_remote import *
@@ -314,6 +313,63 @@ name_pattern = re.compile(r"\d\d[A-Z]-\d{3,4}([-A-Za-z_/][-A-Za-z_/0-9#()]*)?"
                           r"|(\d\d-[A-Z]{2}[A-Z0-9]{0,2}|[A-Z]{2}[A-Z0-9]{2})-[-A-Za-z_/0-9#()]+")
 allowed_character_pattern = re.compile("[-A-Za-z_/0-9#()]")
 
+def normalize_sample_name(sample_name):
+    """Returns the name of the sample in the database.  If the sample name
+    doesn't fit into the naming scheme, a legacy sample name according to
+    ``{short_year}-LGCY-...`` is generated.
+
+    :param sample_name: the name of the sample, e.g. from a data file
+
+    :type sample_name: unicode
+
+    :return:
+      the name of the sample in the database
+
+    :rtype: unicode
+    """
+    if not name_pattern.match(sample_name):
+        # Build a legacy name with the ``{short_year}-LGCY-`` prefix.
+        allowed_sample_name_characters = []
+        for character in sample_name:
+            if allowed_character_pattern.match(character):
+                allowed_sample_name_characters.append(character)
+        sample_name = "{}-LGCY-{}".format(str(datetime.datetime.now().year)[2:], "".join(allowed_sample_name_characters)[:30])
+    return sample_name
+
+
+def get_samples(sample_names):
+    """Looks up many sample names in the database at once.  This is the bulk
+    version of `get_sample`.  Crawlers should call it with the sample names of
+    all files to be processed before processing them.  Then, the subsequent
+    calls of `get_sample` are served from the cache.
+
+    :param sample_names: the names of the samples
+
+    :type sample_names: iterable of unicode
+
+    :return:
+      the IDs of the found samples, and the samples which were not found.  The
+      keys of both dicts are the given names.  The samples not found are newly
+      created `jb_remote.Sample` instances with only the name set, like in
+      `SampleNotFound`.  Aliases count as not found.
+
+    :rtype: dict mapping unicode to int, dict mapping unicode to
+      `jb_remote.Sample`
+    """
+    normalized_names = dict((sample_name, normalize_sample_name(sample_name)) for sample_name in sample_names)
+    sample_ids = get_sample_ids(normalized_names.values())
+    found, not_found = {}, {}
+    for sample_name, normalized_name in normalized_names.items():
+        sample_id = sample_ids.get(normalized_name)
+        if sample_id is not None and not isinstance(sample_id, list):
+            found[sample_name] = sample_id
+        else:
+            new_sample = Sample()
+            new_sample.name = normalized_name
+            not_found[sample_name] = new_sample
+    return found, not_found
+
+
 def get_sample(sample_name):
     """Looks up a sample name in the database, and returns its ID.  (No full
     `Sample` instance is returned to spare ressources.  Mostly, only the ID is
@@ -337,21 +393,11 @@ def get_sample(sample_name):
         newly created sample and substrate for your convenience.  See the
         documentation of this exception class for more information.
     """
-
-    if not name_pattern.match(sample_name):
-        # Build a legacy name with the ``{short_year}-LGCY-`` prefix.
-        allowed_sample_name_characters = []
-        for character in sample_name:
-            if allowed_character_pattern.match(character):
-                allowed_sample_name_characters.append(character)
-        sample_name = "{}-LGCY-{}".format(str(datetime.datetime.now().year)[2:], "".join(allowed_sample_name_characters)[:30])
-    sample_id = connection.open("primary_keys?samples=" + urllib.parse.quote_plus(sample_name))["samples"].get(sample_name)
-    if sample_id is not None and not isinstance(sample_id, list):
-        return sample_id
+    found, not_found = get_samples([sample_name])
+    if sample_name in found:
+        return found[sample_name]
     else:
-        new_sample = Sample()
-        new_sample.name = sample_name
-        raise SampleNotFound(new_sample)
+        raise SampleNotFound(not_found[sample_name])
 
 
 class SolarsimulatorMeasurement(object):
@@ -46,7 +46,7 @@ class DataNode(object):
     :type name: unicode
     :type descriptive_name: unicode
     :type items: list of `DataItem`
-    :type childen: list of `DataNode`
+    :type childen: list of `DataNode` or `LazyChildren`
     """
 
     def __init__(self, instance, descriptive_name=""):
@@ -87,6 +87,13 @@ class DataNode(object):
 
         :type renaming_offset: int
         """
+        if isinstance(self.children, LazyChildren):
+            if renaming_offset >= 1:
+                # Sister nodes are not renamed on this level, so the children
+                # can be processed one by one while they are created.
+                self.children.renaming_offset = renaming_offset - 1
+                return
+            self.children = list(self.children)
         names = [child.name for child in self.children]
         for i, child in enumerate(self.children):
             if renaming_offset < 1:
@@ -98,68 +105,46 @@ class DataNode(object):
                     child.name = self.name + ", " + child.name
             child.find_unambiguous_names(renaming_offset - 1)
 
-    def complete_items_in_children(self, key_sets=None, item_cache=None):
-        """Assures that all decendents of this node that have the same node
-        name also have the same item keys.  This is interesting for kinds of
-        nodes which don't have a strict set of items.  An example are result
-        processes: The user is completely free which items he gives them.  This
-        irritates ``build_column_group_list``: It takes the *first* node of a
-        certain ``name`` (for example ``"Nice result"``) and transforms its
-        items to table columns.
-
-        But what if the second ``"Nice result"`` for the same sample has other
-        items?  This shouldn't happen certainly, but it will.  Here, we add
-        the missing items (with empty strings as value).
-
-        It must be called after `find_unambiguous_names` because the completion
-        of item keys is only necessary within one column group, and the column
-        groups base on the names created by ``find_unambiguous_names``.  In
-        other words, if ``Nice result`` and ``Nice result #2`` don't share the
-        same item keys, this is unimportant.  But if ``Nice result #2`` of two
-        samples in the exported series didn't share the same item keys, this
-        would result in a ``KeyError`` exception in
-        :py:meth:`samples.views.table_export.Column.get_value`.
-
-        This is not optimal for performance reasons.  But it is much easier
-        than to train `build_column_group_list` to handle it.
-
-        :param key_sets: The item keys for all node names.  It is only used in
-            the recursion.  If you call this method, you never give this
-            parameter.
-        :param item_cache: The key names of the items for a given node.  Note
-            that in contrast to `key_sets`, the keys of this are the nodes
-            themselves rather than the disambiguated node names.  It is used
-            for performance's sake.  If you call this method, you never give
-            this parameter.
-
-        :type key_sets: dict mapping unicode to set of (unicode, str)
-        :type item_cache: dict mapping `DataNode` to set of (unicode, str)
-        """
-        if key_sets is None:
-            item_cache = {}
-            def collect_key_sets(node):
-                """Collect all item keys of this node and its decentends.
-                This is the first phase of the process.  It returns a mapping
-                of node names (*not* node kinds) to item key sets.  We set both
-                the ``key_sets`` and the ``item_cache`` here.
-                """
-                item_cache[node] = set((item.key, item.origin) for item in node.items)
-                key_sets = {node.name: item_cache[node]}
-                for child in node.children:
-                    for name, key_set in collect_key_sets(child).items():
-                        key_sets[name] = key_sets.setdefault(name, set()).union(key_set)
-                return key_sets
-            key_sets = collect_key_sets(self)
-        missing_items = key_sets[self.name] - item_cache[self]
-        for key, origin in missing_items:
-            self.items.append(DataItem(key, "", origin))
-        for child in self.children:
-            child.complete_items_in_children(key_sets, item_cache)
-
     def __repr__(self):
         return repr(self.name)
 
 
+class LazyChildren(object):
+    """Child nodes of a `DataNode` which are created only while they are
+    iterated over.  This is used for the row nodes of large exports, e.g. the
+    samples of a sample series, so that only one row tree needs to be held in
+    memory at a time.  Every iteration creates the nodes anew, so it is more
+    expensive than iterating over a list.
+
+    If the node containing the lazy children is not the root of the tree, the
+    children are converted to a list in `DataNode.find_unambiguous_names`.
+    """
+
+    def __init__(self, instances):
+        """Class constructor.
+
+        :param instances: the model instances whose nodes are the children; if
+            this is a QuerySet, it is not cached
+
+        :type instances: QuerySet or list of ``models.Model``
+        """
+        self.instances = instances
+        self.renaming_offset = None
+
+    def __iter__(self):
+        instances = self.instances.iterator() if hasattr(self.instances, "iterator") else self.instances
+        for instance in instances:
+            node = instance.get_data_for_table_export()
+            if self.renaming_offset is not None:
+                node.find_unambiguous_names(self.renaming_offset)
+            yield node
+
+    def __bool__(self):
+        return self.instances.exists() if hasattr(self.instances, "exists") else bool(self.instances)
+    # For Python 2.x
+    __nonzero__ = __bool__
+
+
 class DataItem(object):
     """This class represents a key–value pair, holding the actual data in a
     `DataNode` tree.
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module which defines the command ``render_plots``.  It generates the plots
+of all processes in the plot rendering queue (see
+:py:func:`samples.utils.plots.enqueue_plot_rendering`), so that they needn't be
+generated while the user is waiting for the sample data sheet.  It should be
+called frequently as a cronjob.  For example, one line in the crontab may
+read::
+
+    */2 * * * * /home/juliabase/juliabase/manage.py render_plots
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import time, multiprocessing
+from django.core.management.base import BaseCommand
+from django import db
+from jb_common.signals import storage_changed
+from samples import models
+import samples.utils.plots
+
+
+def render_plots(process_id):
+    """Generates all missing plots of the given process.  This is called in
+    the worker processes of the pool, therefore it takes the ID rather than the
+    process instance.
+
+    :param process_id: the ID of the process
+
+    :type process_id: int
+
+    :return:
+      the number of generated plot files
+
+    :rtype: int
+    """
+    try:
+        process = models.Process.objects.get(pk=process_id).actual_instance
+    except models.Process.DoesNotExist:
+        return 0
+    return samples.utils.plots.prerender_plots(process)
+
+
+class Command(BaseCommand):
+    help = "Generates the plots of all processes in the plot rendering queue.  It should be called frequently " \
+           "as a cronjob."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(),
+                            help="number of worker processes (default: number of CPUs)")
+        parser.add_argument("--min-age", type=float, default=10,
+                            help="seconds a queue entry must be old so that the transaction which created it is "
+                            "surely committed (default: 10)")
+
+    def handle(self, *args, **options):
+        threshold = time.time() - options["min_age"]
+        queue = dict((process_id, queueing_time)
+                     for process_id, queueing_time in samples.utils.plots.get_queued_plot_renderings().items()
+                     if queueing_time < threshold)
+        if not queue:
+            return
+        process_ids = sorted(queue)
+        # The worker processes must not share the database connections of this
+        # process; they open their own ones after the fork.
+        db.connections.close_all()
+        pool = multiprocessing.Pool(options["jobs"])
+        try:
+            generated_plots = pool.map(render_plots, process_ids)
+        finally:
+            pool.close()
+            pool.join()
+        for process_id in process_ids:
+            samples.utils.plots.dequeue_plot_rendering(process_id, queue[process_id])
+        if any(generated_plots):
+            samples.utils.plots.expire_plot_cache()
+            storage_changed.send(models.Process)
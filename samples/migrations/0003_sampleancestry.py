@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def fill_sample_ancestry(apps, schema_editor):
+    Sample = apps.get_model("samples", "Sample")
+    SampleAncestry = apps.get_model("samples", "SampleAncestry")
+    parents = dict((sample_id, (parent_id, split_id)) for sample_id, parent_id, split_id in
+                   Sample.objects.filter(split_origin__isnull=False).
+                   values_list("id", "split_origin__parent_id", "split_origin_id"))
+    links = []
+    for descendant_id in parents:
+        depth = 1
+        sample_id = descendant_id
+        while sample_id in parents:
+            parent_id, split_id = parents[sample_id]
+            links.append(SampleAncestry(ancestor_id=parent_id, descendant_id=descendant_id, depth=depth,
+                                        split_id=split_id))
+            sample_id = parent_id
+            depth += 1
+    SampleAncestry.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0002_userdetails_my_samples_list_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SampleAncestry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('depth', models.PositiveSmallIntegerField(help_text='1 for the parent, 2 for the grandparent etc.', verbose_name='depth')),
+                ('ancestor', models.ForeignKey(related_name='descendant_links', verbose_name='ancestor', to='samples.Sample')),
+                ('descendant', models.ForeignKey(related_name='ancestor_links', verbose_name='descendant', to='samples.Sample')),
+                ('split', models.ForeignKey(related_name='ancestry_links', verbose_name='split', to='samples.SampleSplit', help_text='the split of the ancestor on the path to the descendant')),
+            ],
+            options={
+                'verbose_name': 'sample ancestry',
+                'verbose_name_plural': 'sample ancestries',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='sampleancestry',
+            unique_together=set([('ancestor', 'descendant')]),
+        ),
+        migrations.RunPython(fill_sample_ancestry, migrations.RunPython.noop),
+    ]
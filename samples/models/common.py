@@ -34,7 +34,7 @@ from django.utils.encoding import python_2_unicode_compatible
 
 import hashlib, os.path, datetime, json, collections
 import django.contrib.auth.models
-from django.utils.translation import ugettext_lazy as _, ugettext, ungettext, pgettext_lazy, get_language
+from django.utils.translation import ugettext_lazy as _, ugettext, ungettext, pgettext_lazy
 from django.utils.http import urlquote
 from django.contrib.contenttypes.models import ContentType
 from django.template import defaultfilters, Context, TemplateDoesNotExist
@@ -42,8 +42,8 @@ from django.template.loader import render_to_string
 import django.core.urlresolvers
 from django.conf import settings
 from django.db import models
-from django.core.cache import cache
-from jb_common.utils.base import get_really_full_name, cache_key_locked, format_enumeration, camel_case_to_underscores
+from jb_common.utils.base import get_really_full_name, increment_cache_generation, format_enumeration, \
+    camel_case_to_underscores, get_all_models
 from jb_common.models import Topic, PolymorphicModel, Department
 import samples.permissions
 from jb_common import search
@@ -210,12 +210,7 @@ class Process(PolymorphicModel):
 
         :type with_relations: bool
         """
-        keys_list_key = "process-keys:{0}".format(self.id)
-        with cache_key_locked("process-lock:{0}".format(self.id)):
-            keys = cache.get(keys_list_key)
-            if keys:
-                cache.delete_many(keys)
-            cache.delete(keys_list_key)
+        increment_cache_generation("process-generation:{0}".format(self.id))
         with_relations = kwargs.pop("with_relations", True)
         super(Process, self).save(*args, **kwargs)
         if with_relations:
@@ -281,8 +276,9 @@ class Process(PolymorphicModel):
             return django.core.urlresolvers.reverse("samples.views.main.show_process", args=(str(self.id),))
 
     def calculate_plot_locations(self, plot_id=""):
-        """Get the location of a plot in the local filesystem as well as on
-        the webpage.  Usually, you will not override this method.
+        """Get the location of a plot on the webpage.  Usually, you will not
+        override this method.  The plot files in the local filesystem are
+        located by :py:func:`samples.utils.plots.get_plot_filepath`.
 
         :param plot_id: the unique ID of the image.  This is mostly ``""``
             because most measurement models have only one graphics.
@@ -295,9 +291,7 @@ class Process(PolymorphicModel):
           =========================  =========================================
                  key                           meaning
           =========================  =========================================
-          ``"plot_file"``            full path to the original plot file
           ``"plot_url"``             full relative URL to the plot
-          ``"thumbnail_file"``       full path to the thumbnail file
           ``"thumbnail_url"``        full relative URL to the thumbnail (i.e.,
                                      without domain)
           =========================  =========================================
@@ -314,12 +308,7 @@ class Process(PolymorphicModel):
                                                         kwargs={"process_id": str(self.id), "plot_id": plot_id})
             thumbnail_url = django.core.urlresolvers.reverse("process_plot_thumbnail",
                                                              kwargs={"process_id": str(self.id), "plot_id": plot_id})
-        basename = "{0}-{1}-{2}-{3}-{4}".format(
-            self.content_type.app_label, self.content_type.model, get_language(), self.id, plot_id)
-        return {"plot_file": os.path.join(settings.CACHE_ROOT, "plots", basename + ".pdf"),
-                "plot_url": plot_url,
-                "thumbnail_file": os.path.join(settings.CACHE_ROOT, "plots", basename + ".png"),
-                "thumbnail_url": thumbnail_url}
+        return {"plot_url": plot_url, "thumbnail_url": thumbnail_url}
 
     def draw_plot(self, axes, plot_id, filename, for_thumbnail):
         """Generate a plot using Matplotlib commands.  You may do whatever you
@@ -403,6 +392,41 @@ class Process(PolymorphicModel):
             basename += "_" + plot_id
         return basename
 
+    def get_plot_ids(self):
+        """Get the IDs of all plots of this process.  This is used for
+        generating the plots ahead of time, see
+        :py:func:`samples.utils.plots.prerender_plots`.  The default
+        implementation returns only the default plot ID ``""``, which is right
+        for most measurement models.  Override it if your process has more than
+        one plot.
+
+        :return:
+          all plot IDs of this process
+
+        :rtype: list of unicode
+        """
+        return [""]
+
+    def get_plot_parameters(self, plot_id):
+        """Get everything besides the raw datafiles the plot with the given
+        ``plot_id`` depends on, e.g. a cell area stored in the database.  This
+        is part of the key of the plot cache (see
+        :py:func:`samples.utils.plots.get_plot_filepath`), so it must be
+        JSON-serialisable.  The default implementation returns ``None``,
+        i.e. the plot depends on the raw data only.  Override it if
+        ``draw_plot`` uses data from the database.
+
+        :param plot_id: the ID of the plot; mostly ``""``
+
+        :type plot_id: unicode
+
+        :return:
+          the additional parameters of the plot
+
+        :rtype: object
+        """
+        return None
+
     def get_data(self):
         """Extract the data of this process as a dictionary, ready to be used for
         general data export.  In contrast to `get_data_for_table_export`, I
@@ -702,48 +726,87 @@ class Sample(models.Model):
     def save(self, *args, **kwargs):
         """Saves the instance and clears stalled cache items.
 
-        It also touches all ancestors and children and the associated split
-        processes.
+        It also touches all samples of the same split tree and their split
+        processes, see `touch_relatives`.  If the split origin has changed, the
+        `SampleAncestry` closure table is updated.
 
         :param with_relations: If ``True`` (default), also touch the related
-            samples.  Should be set to ``False`` if called from another
+            sample series.  Should be set to ``False`` if called from another
             ``save`` method in order to avoid endless recursion.
-        :param from_split: When walking through the decendents, this is set to
-            the originating split so that the child sample knows which of its
-            splits should be followed, too.  Thus, only the timestamp of
-            ``from_split`` is actually used.  It must be ``None`` (default)
-            when this method is called from outside this method, or while
-            walking through the ancestors.
 
         :type with_relations: bool
-        :type from_split: `SampleSplit` or NoneType
         """
-        keys_list_key = "sample-keys:{0}".format(self.pk)
-        with cache_key_locked("sample-lock:{0}".format(self.pk)):
-            keys = cache.get(keys_list_key)
-            if keys:
-                cache.delete_many(keys)
-            cache.delete(keys_list_key)
+        increment_cache_generation("sample-generation:{0}".format(self.pk))
         with_relations = kwargs.pop("with_relations", True)
-        from_split = kwargs.pop("from_split", None)
+        adding = self._state.adding
         super(Sample, self).save(*args, **kwargs)
         UserDetails.objects.filter(user__in=self.watchers.all()).update(my_samples_list_timestamp=datetime.datetime.now())
         if with_relations:
             for series in self.series.all():
                 series.save()
-        # Now we touch the decendents ...
-        if from_split:
-            splits = SampleSplit.objects.filter(parent=self, timestamp__gt=from_split.timestamp)
-        else:
-            splits = SampleSplit.objects.filter(parent=self)
-        for split in splits:
-            split.save(with_relations=False)
-            for child in split.pieces.all():
-                child.save(from_split=split, with_relations=False)
-        # ... and the ancestors
-        if not from_split and self.split_origin:
-            self.split_origin.save(with_relations=False)
-            self.split_origin.parent.save(with_relations=False)
+        if not adding or self.split_origin_id:
+            if SampleAncestry.objects.filter(descendant=self, depth=1).values_list("split_id", flat=True).first() != \
+               self.split_origin_id:
+                self.update_ancestry()
+            self.touch_relatives()
+
+    def update_ancestry(self):
+        """Rebuilds the rows of the `SampleAncestry` closure table for this
+        sample and all of its descendants.  This must be called after the
+        split origin of the sample has changed.  `save` does this
+        automatically.
+        """
+        subtree = {self.pk: 0}
+        subtree.update(SampleAncestry.objects.filter(ancestor=self).values_list("descendant_id", "depth"))
+        SampleAncestry.objects.filter(descendant__in=subtree).exclude(ancestor__in=subtree).delete()
+        if self.split_origin_id:
+            split = self.split_origin
+            chain = [(split.parent_id, 1, split.id)]
+            chain.extend((ancestor_id, depth + 1, split_id) for ancestor_id, depth, split_id in
+                         SampleAncestry.objects.filter(descendant=split.parent_id).
+                         values_list("ancestor_id", "depth", "split_id"))
+            SampleAncestry.objects.bulk_create(
+                SampleAncestry(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth + subtree_depth,
+                               split_id=split_id)
+                for descendant_id, subtree_depth in subtree.items() for ancestor_id, depth, split_id in chain)
+
+    def get_ancestry(self):
+        """Returns the ancestors of this sample together with the splits which
+        lead to this sample.  This needs only one database query.
+
+        :return:
+          the ancestors, the parent first, each with the split of the ancestor
+          from which this sample (or one of its ancestors) emerged
+
+        :rtype: list of (`Sample`, `SampleSplit`)
+        """
+        return [(link.ancestor, link.split) for link in SampleAncestry.objects.filter(descendant=self).
+                select_related("ancestor", "split").order_by("depth")]
+
+    def touch_relatives(self):
+        """Marks all other samples of the split tree of this sample, as well as
+        all splits in this tree, as modified, and expires their cached
+        renderings.  The whole tree is affected because every data sheet shows
+        the splits of the ancestors together with their pieces.  This needs a
+        constant number of database queries, using the `SampleAncestry` closure
+        table.
+        """
+        ancestor_ids = list(SampleAncestry.objects.filter(descendant=self).values_list("ancestor_id", flat=True))
+        relative_ids = set(ancestor_ids)
+        relative_ids.update(SampleAncestry.objects.filter(ancestor__in=ancestor_ids + [self.pk]).
+                            values_list("descendant_id", flat=True))
+        relative_ids.discard(self.pk)
+        now = datetime.datetime.now()
+        if relative_ids:
+            Sample.objects.filter(pk__in=relative_ids).update(last_modified=now)
+            UserDetails.objects.filter(user__my_samples__in=relative_ids).update(my_samples_list_timestamp=now)
+            for sample_id in relative_ids:
+                increment_cache_generation("sample-generation:{0}".format(sample_id))
+        split_ids = list(SampleSplit.objects.filter(parent__in=relative_ids | {self.pk}).values_list("id", flat=True))
+        if split_ids:
+            Process.objects.filter(id__in=split_ids).update(last_modified=now)
+            for split_id in split_ids:
+                increment_cache_generation("process-generation:{0}".format(split_id))
 
     def __str__(self):
         """Here, I realise the peculiar naming scheme of provisional sample
@@ -829,19 +892,20 @@ class Sample(models.Model):
 
     def last_process_if_split(self):
         """Test whether the most recent process applied to the sample – except
-        for result processes – was a split.
+        for result processes, including those of classes derived from
+        `Result` – was a split.
 
         :return:
           the split, if it is the most recent process, else ``None``
 
         :rtype: `SampleSplit` or NoneType
         """
-        for process in self.processes.order_by("-timestamp"):
-            process = process.actual_instance
-            if isinstance(process, SampleSplit):
-                return process
-            if not isinstance(process, Result):
-                break
+        result_models = [model for model in get_all_models().values()
+                         if issubclass(model, Result) and not model._meta.abstract]
+        result_content_types = ContentType.objects.get_for_models(*result_models).values()
+        last_process = self.processes.exclude(content_type__in=result_content_types).order_by("-timestamp").first()
+        if last_process and last_process.content_type_id == ContentType.objects.get_for_model(SampleSplit).id:
+            return last_process.actual_instance
         return None
 
     def get_sample_details(self):
@@ -1039,6 +1103,34 @@ class SampleSplit(Process):
         raise NotImplementedError
 
 
+@python_2_unicode_compatible
+class SampleAncestry(models.Model):
+    """Closure table of the split relationships between samples.  There is one
+    row for every sample and each of its direct or indirect ancestors.  This
+    way, all ancestors or all descendants of a sample are found with one
+    indexed query instead of walking through `Sample.split_origin` and the
+    `SampleSplit` pieces.
+
+    The rows are maintained by `Sample.save`; never edit them directly.
+    """
+    ancestor = models.ForeignKey(Sample, related_name="descendant_links", verbose_name=_("ancestor"))
+    descendant = models.ForeignKey(Sample, related_name="ancestor_links", verbose_name=_("descendant"))
+    depth = models.PositiveSmallIntegerField(_("depth"), help_text=_("1 for the parent, 2 for the grandparent etc."))
+    split = models.ForeignKey(SampleSplit, related_name="ancestry_links", verbose_name=_("split"),
+                              help_text=_("the split of the ancestor on the path to the descendant"))
+    """The split of the `ancestor` from which the `descendant` (or one of its
+    ancestors) emerged.  Its timestamp is the point in time until which the
+    processes of the ancestor belong to the history of the descendant."""
+
+    class Meta:
+        unique_together = ("ancestor", "descendant")
+        verbose_name = _("sample ancestry")
+        verbose_name_plural = _("sample ancestries")
+
+    def __str__(self):
+        return _("{ancestor} is ancestor of {descendant}").format(ancestor=self.ancestor, descendant=self.descendant)
+
+
 @python_2_unicode_compatible
 class Clearance(models.Model):
     """Model for clearances for specific samples to specific users.  Apart
@@ -1347,7 +1439,7 @@ class SampleSeries(models.Model):
         :rtype: `samples.data_tree.DataNode`
         """
         data_node = DataNode(self, six.text_type(self))
-        data_node.children.extend(sample.get_data_for_table_export() for sample in self.samples.all())
+        data_node.children = LazyChildren(self.samples.all())
         # I don't think that any sample series properties are interesting for
         # table export; people only want to see the *sample* data.  Thus, I
         # don't set ``cvs_note.items``.
@@ -42,11 +42,13 @@ from __future__ import absolute_import, unicode_literals
 
 import hashlib, re
 from django.db.models import Q
+from django.db.models.query import QuerySet
 from django.contrib.contenttypes.models import ContentType
 from django.utils.translation import ugettext_lazy as _, ugettext
 from django.contrib.auth.models import User, Permission
 from django.conf import settings
 import jb_common.utils.base as utils
+from jb_common.models import Topic
 import samples.models
 
 
@@ -279,7 +281,7 @@ class NoDepartment(object):
     """
     _instance = None
     def __new__(cls, *args, **kwargs):
-        if cls._instance is not None:
+        if cls._instance is None:
             cls._instance = super(NoDepartment, cls).__new__(cls, *args, **kwargs)
         return cls._instance
     def __eq__(self, other):
@@ -329,6 +331,62 @@ def assert_can_fully_view_sample(user, sample):
             raise PermissionError(user, description, new_topic_would_help=True)
 
 
+def get_fully_viewable_samples_filter(user):
+    """Returns a filter for samples which the user can fully view.  It
+    expresses the rules of `assert_can_fully_view_sample` in terms of the
+    database, so that the database can decide about many samples with one
+    query, e.g. ``Sample.objects.filter(get_fully_viewable_samples_filter(user))``.
+    Note that the result may contain duplicates because of the topic
+    memberships; see `filter_viewable_samples` for a more convenient interface.
+
+    :param user: the user whose permission should be checked
+
+    :type user: django.contrib.auth.models.User
+
+    :return:
+      the filter for the fully viewable samples
+
+    :rtype: ``django.db.models.Q``
+    """
+    if user.is_superuser:
+        return Q()
+    department = user.jb_user_details.department
+    # Like in `assert_can_fully_view_sample`, an unset department is never
+    # equal to another unset department.
+    same_department = Q(currently_responsible_person__jb_user_details__department=department) if department \
+                      else Q(pk__in=[])
+    viewable = Q(currently_responsible_person=user, topic__isnull=False) | Q(topic__members=user) | \
+               Q(topic__isnull=True) & same_department
+    if user.has_perm("samples.view_every_sample"):
+        viewable |= Q(topic__confidential=False) & same_department
+    return viewable
+
+
+def filter_viewable_samples(user, samples_):
+    """Returns those of the given samples which the user can fully view, see
+    `assert_can_fully_view_sample`.  In contrast to calling it for every
+    sample, this needs only one database query.
+
+    :param user: the user whose permission should be checked
+    :param samples_: the samples to be checked
+
+    :type user: django.contrib.auth.models.User
+    :type samples_: QuerySet or iterable of `samples.models.Sample`
+
+    :return:
+      the fully viewable samples; if ``samples_`` is a QuerySet, the result is
+      a QuerySet, too, otherwise, it is a list in the order of ``samples_``
+
+    :rtype: QuerySet or list of `samples.models.Sample`
+    """
+    viewable_samples = samples.models.Sample.objects.filter(get_fully_viewable_samples_filter(user))
+    if isinstance(samples_, QuerySet):
+        return samples_.filter(pk__in=viewable_samples.values("pk"))
+    samples_ = list(samples_)
+    viewable_ids = set(viewable_samples.filter(pk__in=[sample.pk for sample in samples_]).values_list("pk", flat=True))
+    return [sample for sample in samples_ if sample.pk in viewable_ids]
+
+
 def assert_can_rename_sample(user, sample):
     """Tests whether the user can rename all samples from his/her department.  It
     is recommended that only a few administrative users should get this
@@ -539,6 +597,59 @@ def assert_can_view_physical_process(user, process):
         raise PermissionError(user, description, new_topic_would_help=True)
 
 
+def get_viewable_physical_processes(user, processes):
+    """Returns those of the given physical processes which the user is allowed
+    to view.  The criteria are the same as in
+    `assert_can_view_physical_process`, however, the number of database
+    queries doesn't grow with the number of processes.  This is used for views
+    that serve many processes in one go, e.g. batches of plot thumbnails.
+
+    :param user: the user whose permission should be checked
+    :param processes: The processes to view.  It it not necessary that they
+        are the actual instances.
+
+    :type user: django.contrib.auth.models.User
+    :type processes: iterable of `samples.models.Process`
+
+    :return:
+      the viewable processes, in the order in which they were given
+
+    :rtype: list of `samples.models.Process`
+    """
+    processes = list(processes)
+    view_all_permissions = {}
+    undecided_process_ids = set()
+    for process in processes:
+        process_class = process.content_type.model_class()
+        if process_class not in view_all_permissions:
+            codename = "view_every_{0}".format(process_class.__name__.lower())
+            if Permission.objects.filter(codename=codename,
+                                         content_type=ContentType.objects.get_for_model(process_class)).exists():
+                view_all_permissions[process_class] = \
+                    user.has_perm("{app_label}.{codename}".format(app_label=process_class._meta.app_label,
+                                                                  codename=codename))
+            else:
+                view_all_permissions[process_class] = user.is_superuser
+        if not view_all_permissions[process_class] and process.operator_id != user.id:
+            undecided_process_ids.add(process.id)
+    viewable_process_ids = {process.id for process in processes} - undecided_process_ids
+    if undecided_process_ids:
+        viewable_process_ids.update(samples.models.Clearance.objects.filter(
+            user=user, processes__in=undecided_process_ids).values_list("processes", flat=True))
+        undecided_process_ids -= viewable_process_ids
+    if undecided_process_ids:
+        sample_ids_by_process_id = {}
+        for process_id, sample_id in samples.models.Sample.processes.through.objects.filter(
+                process__in=undecided_process_ids).values_list("process_id", "sample_id"):
+            sample_ids_by_process_id.setdefault(process_id, set()).add(sample_id)
+        all_sample_ids = set().union(*sample_ids_by_process_id.values())
+        fully_viewable_sample_ids = set(filter_viewable_samples(
+            user, samples.models.Sample.objects.filter(pk__in=all_sample_ids)).values_list("pk", flat=True))
+        viewable_process_ids.update(process_id for process_id, sample_ids in sample_ids_by_process_id.items()
+                                    if sample_ids & fully_viewable_sample_ids)
+    return [process for process in processes if process.id in viewable_process_ids]
+
+
 def assert_can_edit_result_process(user, result_process):
     """Tests whether the user can edit a result process.
 
@@ -769,6 +880,27 @@ def assert_can_edit_topic(user, topic=None):
                 raise PermissionError(user, description)
 
 
+def can_edit_any_topic(user):
+    """Returns whether there is at least one topic which the user can edit.
+    The criteria are the same as in `assert_can_edit_topic`, however, only one
+    database query is needed, independent of the number of topics.
+
+    :param user: the user whose permission should be checked
+
+    :type user: django.contrib.auth.models.User
+
+    :return:
+      whether the user can edit at least one topic
+
+    :rtype: bool
+    """
+    if user.has_perm("jb_common.change_topic"):
+        topics = Topic.objects.all() if user.is_superuser else Topic.objects.filter(Q(members=user) | Q(confidential=False))
+    else:
+        topics = Topic.objects.filter(members=user, manager=user)
+    return topics.exists()
+
+
 def assert_can_edit_users_topics(user):
     """Tests whether the user can change topic memberships of other users,
     set the topic's restriction status, and add new sub topics where the
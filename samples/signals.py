@@ -150,6 +150,18 @@ reasons.  The name of a sample series shouldn't change after all, and cannot be
 changed from within JuliaBase-Samples.
 
 
+Coalesced touches
+.................
+
+Changes of M2M relationships may touch many instances at once, e.g. if 300
+samples are added to a deposition.  Saving each of them would cascade into
+thousands of database queries.  Therefore, the signal routines for M2M
+relationships don't save the affected instances but register them with
+`touch_later`.  All touched samples, processes, and sample series of a request
+are collected and de-duplicated, and they are touched together with a constant
+number of bulk updates after the request's transaction was committed.
+
+
 Multihop touches
 ................
 
@@ -167,14 +179,84 @@ is greater than 1:
 from __future__ import absolute_import, unicode_literals
 
 import datetime, hashlib
-from django.db.models import signals
+from django.db.models import signals, Q
 from django.dispatch import receiver
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, Group
 import django.contrib.contenttypes.management
 from django.contrib.contenttypes.models import ContentType
 from jb_common import models as jb_common_app
 import jb_common.signals
+from jb_common.utils.base import run_after_commit, get_pending_after_commit_callback, increment_cache_generation, \
+    increment_cache_generations
 from samples import models as samples_app
+import samples.utils.plots
+
+
+class TouchCollector(object):
+    """Callable which marks samples, processes, and sample series as modified
+    and expires their cached renderings, all at once.  See `touch_later`.
+    """
+
+    def __init__(self):
+        self.sample_ids, self.process_ids, self.sample_series_ids = set(), set(), set()
+
+    def add(self, sample_ids=(), process_ids=(), sample_series_ids=()):
+        self.sample_ids.update(sample_ids)
+        self.process_ids.update(process_ids)
+        self.sample_series_ids.update(sample_series_ids)
+
+    def __call__(self):
+        """Touches all collected instances.  Samples are touched like by
+        ``Sample.save``, i.e. together with their sample series, all samples of
+        their split trees and their splits, and the “My Samples” lists of their
+        watchers.  Processes are touched without their samples; the caller must
+        add the samples explicitly.
+        """
+        now = datetime.datetime.now()
+        sample_ids = set(self.sample_ids)
+        if sample_ids:
+            ancestor_ids = set(samples_app.SampleAncestry.objects.filter(descendant__in=sample_ids).
+                               values_list("ancestor_id", flat=True))
+            sample_ids.update(ancestor_ids)
+            sample_ids.update(samples_app.SampleAncestry.objects.filter(ancestor__in=sample_ids).
+                              values_list("descendant_id", flat=True))
+            samples_app.Sample.objects.filter(pk__in=sample_ids).update(last_modified=now)
+            samples_app.UserDetails.objects.filter(user__my_samples__in=sample_ids). \
+                update(my_samples_list_timestamp=now)
+        process_ids = set(self.process_ids)
+        if sample_ids:
+            process_ids.update(samples_app.SampleSplit.objects.filter(parent__in=sample_ids).values_list("id", flat=True))
+        if process_ids:
+            samples_app.Process.objects.filter(pk__in=process_ids).update(last_modified=now)
+        if self.sample_ids or self.sample_series_ids:
+            samples_app.SampleSeries.objects.filter(Q(pk__in=self.sample_series_ids) | Q(samples__in=self.sample_ids)). \
+                update(last_modified=now)
+        increment_cache_generations(["sample-generation:{0}".format(sample_id) for sample_id in sample_ids] +
+                                    ["process-generation:{0}".format(process_id) for process_id in process_ids])
+
+
+def touch_later(sample_ids=(), process_ids=(), sample_series_ids=()):
+    """Marks samples, processes, and sample series as modified after the
+    current request has been committed, see `TouchCollector`.  All instances
+    touched during a request are collected, so that every instance is touched
+    only once, with a constant number of database queries.  Outside of
+    requests, the instances are touched immediately.
+
+    :param sample_ids: the IDs of the samples to be touched
+    :param process_ids: the IDs of the processes to be touched
+    :param sample_series_ids: the IDs of the sample series to be touched
+
+    :type sample_ids: iterable of int
+    :type process_ids: iterable of int
+    :type sample_series_ids: iterable of int
+    """
+    collector = get_pending_after_commit_callback("samples-touch")
+    if collector:
+        collector.add(sample_ids, process_ids, sample_series_ids)
+    else:
+        collector = TouchCollector()
+        collector.add(sample_ids, process_ids, sample_series_ids)
+        run_after_commit(collector, "samples-touch")
 
 
 @receiver(signals.m2m_changed, sender=samples_app.Sample.watchers.through)
@@ -283,12 +365,10 @@ def touch_user_samples_and_processes(sender, instance, created, **kwargs):
     if former_identifying_data_hash != instance.samples_user_details.identifying_data_hash:
         instance.samples_user_details.identifying_data_hash = former_identifying_data_hash
         instance.samples_user_details.save()
-        for sample in instance.samples.all():
-            sample.save(with_relations=False)
-        for process in instance.processes.all():
-            process.actual_instance.save()
-        for sample_series in instance.sample_series.all():
-            sample_series.save()
+        process_ids = set(instance.processes.values_list("id", flat=True))
+        sample_ids = set(instance.samples.values_list("id", flat=True))
+        sample_ids.update(samples_app.Sample.objects.filter(processes__in=process_ids).values_list("id", flat=True))
+        touch_later(sample_ids, process_ids, instance.sample_series.values_list("id", flat=True))
 
 
 @receiver(signals.m2m_changed, sender=samples_app.Sample.processes.through)
@@ -297,24 +377,21 @@ def touch_process_samples(sender, instance, action, reverse, model, pk_set, **kw
     For example, if the samples connected with a process are changed, both the
     process and all affected samples are marked as “modified”.
     """
+    if action not in ["pre_clear", "post_add", "post_remove"]:
+        return
     if reverse:
-        # `instance` is a process
-        instance.save()
-        if action == "pre_clear":
-            for sample in instance.samples.all():
-                sample.save()
-        elif action in ["post_add", "post_remove"]:
-            for sample in samples_app.Sample.objects.in_bulk(pk_set).values():
-                sample.save()
+        # `instance` is a process.  It is saved immediately (rather than only
+        # touched) because its ``post_save`` receivers may depend on its
+        # samples, e.g. for informal layers.
+        instance.save(with_relations=False)
+        sample_ids = set(instance.samples.values_list("id", flat=True))
+        if action != "pre_clear":
+            sample_ids.update(pk_set)
+        touch_later(sample_ids=sample_ids)
     else:
         # `instance` is a sample; shouldn't actually occur in JuliaBase's code
-        instance.save()
-        if action == "pre_clear":
-            for process in instance.processes.all():
-                process.save(with_relations=False)
-        elif action in ["post_add", "post_remove"]:
-            for process in samples_app.Process.objects.in_bulk(pk_set).values():
-                process.save(with_relations=False)
+        process_ids = pk_set if action != "pre_clear" else instance.processes.values_list("id", flat=True)
+        touch_later(sample_ids=[instance.id], process_ids=process_ids)
 
 
 @receiver(signals.m2m_changed, sender=samples_app.SampleSeries.samples.through)
@@ -323,24 +400,16 @@ def touch_sample_series_samples(sender, instance, action, reverse, model, pk_set
     For example, if the members of a sample series are changed, all affected
     samples are marked as “modified”.
     """
+    if action not in ["pre_clear", "post_add", "post_remove"]:
+        return
     if reverse:
         # `instance` is a sample; shouldn't actually occur in JuliaBase's code
-        instance.save()
-        if action == "pre_clear":
-            for sample_series in instance.series.all():
-                sample_series.save()
-        elif action in ["post_add", "post_remove"]:
-            for sample_series in samples_app.SampleSeries.objects.in_bulk(pk_set).values():
-                sample_series.save()
+        sample_series_ids = pk_set if action != "pre_clear" else instance.series.values_list("id", flat=True)
+        touch_later(sample_ids=[instance.id], sample_series_ids=sample_series_ids)
     else:
         # `instance` is a sample series
-        instance.save()
-        if action == "pre_clear":
-            for sample in instance.samples.all():
-                sample.save()
-        elif action in ["post_add", "post_remove"]:
-            for sample in samples_app.Sample.objects.in_bulk(pk_set).values():
-                sample.save()
+        sample_ids = pk_set if action != "pre_clear" else instance.samples.values_list("id", flat=True)
+        touch_later(sample_ids=sample_ids, sample_series_ids=[instance.id])
 
 
 @receiver(signals.m2m_changed, sender=samples_app.SampleSeries.results.through)
@@ -349,17 +418,16 @@ def touch_sample_series_results(sender, instance, action, reverse, model, pk_set
     we never touch results here because they don't cache information about
     their relationship to series.
     """
+    if action not in ["pre_clear", "post_add", "post_remove"]:
+        return
     if reverse:
         # `instance` is a result
-        if action == "pre_clear":
-            for sample_series in instance.sample_series.all():
-                sample_series.save(touch_samples=True)
-        elif action in ["post_add", "post_remove"]:
-            for sample_series in samples_app.SampleSeries.objects.in_bulk(pk_set).values():
-                sample_series.save(touch_samples=True)
+        sample_series_ids = set(pk_set if action != "pre_clear" else instance.sample_series.values_list("id", flat=True))
+        touch_later(samples_app.Sample.objects.filter(series__in=sample_series_ids).values_list("id", flat=True),
+                    sample_series_ids=sample_series_ids)
     else:
         # `instance` is a sample series
-        instance.save()
+        touch_later(sample_series_ids=[instance.id])
 
 
 @receiver(signals.pre_save, sender=jb_common_app.Topic)
@@ -448,6 +516,75 @@ def touch_display_settings_by_group_or_permission(sender, instance, action, reve
             instance.samples_user_details.touch_display_settings()
 
 
+@receiver(signals.m2m_changed, sender=Group.permissions.through)
+def touch_display_settings_by_group_permissions(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Touch the sample settings of all users in groups whose permissions have
+    changed, see `touch_display_settings_by_group_or_permission`.
+    """
+    if action in ["pre_clear", "post_add", "post_remove"]:
+        if reverse:
+            # `instance` is a permission
+            groups = instance.group_set.all() if action == "pre_clear" else Group.objects.filter(pk__in=pk_set)
+        else:
+            # `instance` is a group
+            groups = [instance]
+        samples_app.UserDetails.objects.filter(user__groups__in=groups). \
+            update(display_settings_timestamp=datetime.datetime.now())
+
+
+@receiver(signals.post_save, sender=jb_common_app.Topic)
+@receiver(signals.post_delete, sender=jb_common_app.Topic)
+def expire_topic_capabilities(sender, instance, **kwargs):
+    """Expires the cached capabilities of all users shown in the main menu
+    because whether a user can edit topics depends on the managers and the
+    confidentiality of all topics, see :py:func:`samples.views.main.get_capabilities`.
+    """
+    increment_cache_generation("topics-generation")
+
+
+@receiver(signals.post_save)
+def enqueue_plot_rendering(sender, instance, raw, **kwargs):
+    """Puts processes with plots into the queue of the ``render_plots``
+    management command, so that their plots are generated before anyone views
+    them.  Note that the plots may still be generated on demand in
+    :py:func:`samples.views.plots.show_plot` if the command hasn't processed
+    the queue yet.
+    """
+    if not raw and isinstance(instance, samples_app.Process) and samples.utils.plots.has_plots(instance):
+        samples.utils.plots.enqueue_plot_rendering(instance.id)
+
+
+@receiver(signals.pre_save)
+def remember_lab_notebook_month(sender, instance, raw, **kwargs):
+    """Remembers the month in which a physical process was stored before it
+    is saved.  This way, `expire_lab_notebook_snapshots` can expire the lab
+    notebook of the old month, too, if the timestamp of the process is
+    changed.
+    """
+    if not raw and isinstance(instance, samples_app.PhysicalProcess) and instance.pk:
+        old_timestamp = sender.objects.filter(pk=instance.pk).values_list("timestamp", flat=True).first()
+        if old_timestamp:
+            instance._old_lab_notebook_month = (old_timestamp.year, old_timestamp.month)
+
+
+@receiver(signals.post_save)
+@receiver(signals.post_delete)
+def expire_lab_notebook_snapshots(sender, instance, **kwargs):
+    """Expires the cached lab notebook pages and data of the month of a
+    physical process which was saved or deleted, see
+    :py:func:`samples.views.lab_notebook.show`.  This happens after the commit,
+    so that no page with the old data can be cached under the new generation.
+    """
+    if not kwargs.get("raw") and isinstance(instance, samples_app.PhysicalProcess):
+        months = {(instance.timestamp.year, instance.timestamp.month)}
+        old_month = getattr(instance, "_old_lab_notebook_month", None)
+        if old_month:
+            months.add(old_month)
+        keys = ["lab-notebook-generation:{0}:{1}-{2}".format(instance.__class__.__name__, year, month)
+                for year, month in months]
+        run_after_commit(lambda: increment_cache_generations(keys))
+
+
 @receiver(jb_common.signals.maintain)
 def expire_feed_entries(sender, **kwargs):
     """Deletes all feed entries which are older than six weeks.
@@ -455,3 +592,11 @@ def expire_feed_entries(sender, **kwargs):
     now = datetime.datetime.now()
     six_weeks_ago = now - datetime.timedelta(weeks=6)
     samples_app.FeedEntry.objects.filter(timestamp__lt=six_weeks_ago).delete()
+
+
+@receiver(jb_common.signals.maintain)
+def expire_plot_cache(sender, **kwargs):
+    """Removes the least recently used plot files so that the plot cache doesn't
+    exceed ``PLOT_CACHE_MAX_SIZE``.
+    """
+    samples.utils.plots.expire_plot_cache()
@@ -107,6 +107,7 @@ urlpatterns = [
     url(r"^results/thumbnails/(?P<process_id>\d+)$", result.show_thumbnail),
     url(r"^results/(?P<process_id>\d+)$", result.show),
 
+    url(r"^plots/thumbnails/$", plots.show_plot_thumbnails, name="process_plot_thumbnails"),
     url(r"^plots/thumbnails/(?P<process_id>\d+)/(?P<plot_id>.+)", plots.show_plot, {"thumbnail": True},
         "process_plot_thumbnail"),
     url(r"^plots/thumbnails/(?P<process_id>\d+)$", plots.show_plot, {"plot_id": "", "thumbnail": True},
@@ -142,6 +143,7 @@ urlpatterns = [
     url(r"^logout_remote_client$", json_client.logout_remote_client),
     url(r"^add_alias$", json_client.add_alias),
     url(r"^change_my_samples$", json_client.change_my_samples),
+    url(r"^bulk_submit$", json_client.bulk_submit),
 
     url(r"^qr_code$", sample.qr_code),
     url(r"^data_matrix_code$", sample.data_matrix_code),
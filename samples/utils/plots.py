@@ -18,9 +18,22 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+"""Helpers for reading raw data files and for generating the plots of
+processes.  Plots are generated either on demand in
+:py:func:`samples.views.plots.show_plot`, or ahead of time by the ``render_plots``
+management command, which works off the queue filled by
+:py:func:`enqueue_plot_rendering`.
+"""
+
 from __future__ import absolute_import, unicode_literals, division
+import django.utils.six as six
 
-import codecs
+import os, os.path, hashlib, json, time, io, re, mmap, tempfile
+import numpy
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import translation
+import jb_common.utils.base
 
 
 class PlotError(Exception):
@@ -31,6 +44,301 @@ class PlotError(Exception):
     pass
 
 
+def open_datafile(filename):
+    """Maps a raw data file into memory.  This way, the readers below can search
+    for markers in the file and hand the numerical block to NumPy without
+    reading the file line by line.
+
+    :param filename: full path to the data file
+
+    :type filename: str
+
+    :return:
+      the content of the file; for empty files, this is an empty byte string
+      because those cannot be mapped
+
+    :rtype: ``mmap.mmap`` or bytes
+
+    :raises PlotError: if the file could not be read
+    """
+    try:
+        with open(filename, "rb") as datafile:
+            if not os.fstat(datafile.fileno()).st_size:
+                return b""
+            return mmap.mmap(datafile.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):
+        raise PlotError("datafile could not be opened")
+
+
+def find_line(content, prefix, start=0):
+    """Finds the first line which begins with the given prefix.  The comparison
+    is case-insensitive.
+
+    :param content: the content of the data file, as returned by
+        `open_datafile`
+    :param prefix: the beginning of the line to be found
+    :param start: the offset from where the search starts; it must be the
+        beginning of a line
+
+    :type content: ``mmap.mmap`` or bytes
+    :type prefix: unicode
+    :type start: int
+
+    :return:
+      the offsets of the beginning of the found line and of the beginning of
+      the line after it, or ``None`` if no line was found
+
+    :rtype: (int, int) or NoneType
+    """
+    match = re.compile(b"^" + re.escape(prefix.encode("cp1252")), re.IGNORECASE | re.MULTILINE).search(content, start)
+    if match is None:
+        return None
+    return match.start(), skip_lines(content, match.start(), 1)
+
+
+def skip_lines(content, start, number_of_lines):
+    """Returns the offset of the line which is the given number of lines after
+    the line beginning at ``start``.
+
+    :param content: the content of the data file, as returned by
+        `open_datafile`
+    :param start: the offset from where the lines are counted; it must be the
+        beginning of a line
+    :param number_of_lines: the number of lines to be skipped
+
+    :type content: ``mmap.mmap`` or bytes
+    :type start: int
+    :type number_of_lines: int
+
+    :return:
+      the offset of the found line; if the content ends before, the length of
+      the content
+
+    :rtype: int
+    """
+    for __ in range(number_of_lines):
+        start = content.find(b"\n", start)
+        if start == -1:
+            return len(content)
+        start += 1
+    return start
+
+
+def parse_table(data, separator=None, comments=None):
+    """Converts the numerical block of a data file into a two-dimensional
+    array.  Decimal commas are converted to decimal points.  Empty lines are
+    ignored.  Cells that are no numbers are converted to NaN.  If the lines
+    have different numbers of cells, the table is as wide as the shortest
+    line.
+
+    :param data: the numerical block of the data file, encoded in cp1252
+    :param separator: the separator which separates the values from each
+        other; ``None`` means any whitespace
+    :param comments: the character that starts a comment, or ``None`` if the
+        data doesn't contain comments
+
+    :type data: bytes
+    :type separator: str or None
+    :type comments: str or None
+
+    :return:
+      the table, with the rows as the first dimension
+
+    :rtype: ``numpy.ndarray``
+    """
+    text = data.decode("cp1252")
+    if separator != ",":
+        text = text.replace(",", ".")
+    if not text.strip():
+        return numpy.empty((0, 0))
+    try:
+        return numpy.loadtxt(io.StringIO(text), delimiter=separator, comments=comments, ndmin=2)
+    except (ValueError, IndexError):
+        # Slow path for files with non-numeric cells or ragged lines.
+        rows = []
+        for line in text.splitlines():
+            if comments:
+                line = line.partition(comments)[0]
+            if not line.strip():
+                continue
+            row = []
+            for cell in line.strip().split(separator):
+                try:
+                    row.append(float(cell))
+                except ValueError:
+                    row.append(float("nan"))
+            rows.append(row)
+        if not rows:
+            return numpy.empty((0, 0))
+        width = min(len(row) for row in rows)
+        return numpy.array([row[:width] for row in rows], dtype=float)
+
+
+def select_columns(table, columns):
+    """Extracts columns from a table as returned by `parse_table`.
+
+    :param table: the table
+    :param columns: the columns that should be extracted
+
+    :type table: ``numpy.ndarray``
+    :type columns: list of int
+
+    :return:
+      List of all columns.  Every column is represented as an array of
+      floating point values.
+
+    :rtype: list of ``numpy.ndarray``
+
+    :raises PlotError: if the table contains too few columns
+    """
+    if not len(table):
+        return [numpy.empty(0) for __ in columns]
+    try:
+        return [table[:, column] for column in columns]
+    except IndexError:
+        raise PlotError("datafile contained too few columns")
+
+
+def parse_columns(data, columns, separator=None, comments=None):
+    """Converts the numerical block of a data file into arrays, one for each
+    selected column.  See `parse_table` for the details of the conversion.
+
+    :param data: the numerical block of the data file, encoded in cp1252
+    :param columns: the columns that should be read
+    :param separator: the separator which separates the values from each
+        other; ``None`` means any whitespace
+    :param comments: the character that starts a comment, or ``None`` if the
+        data doesn't contain comments
+
+    :type data: bytes
+    :type columns: list of int
+    :type separator: str or None
+    :type comments: str or None
+
+    :return:
+      List of all columns.  Every column is represented as an array of
+      floating point values.
+
+    :rtype: list of ``numpy.ndarray``
+
+    :raises PlotError: if a line contains too few columns
+    """
+    return select_columns(parse_table(data, separator, comments), columns)
+
+
+def read_table_cached(filename, parameters, read_table, with_metadata=False):
+    """Returns the parsed table of a raw data file, reading it only if
+    necessary.  The table is stored as an ``.npy`` file in
+    ``CACHE_ROOT/plots/data`` and thus shared by all processes and threads, and
+    by all plots that base on the same file, e.g. the thumbnail and the PDF,
+    or the different cells of a solarsimulator measurement.  Therefore,
+    ``read_table`` should always return all columns.  The files are expired
+    together with the plot files by `expire_plot_cache`.
+
+    If the plot needs further data from the file, e.g. from its header,
+    ``read_table`` can return it along with the table.  It is stored in a
+    JSON file next to the ``.npy`` file, so that the data file is not read at
+    all on a cache hit.
+
+    Hits and misses are counted for `datafile_cache_hit_rate`.
+
+    :param filename: full path to the data file
+    :param parameters: all further parameters that determine the resulting
+        table, e.g. the start line number; they must be serialisable to JSON
+    :param read_table: function which is called with the content of the file
+        as returned by `open_datafile` and which returns the table, or the
+        table and the metadata if ``with_metadata`` is ``True``
+    :param with_metadata: whether ``read_table`` returns metadata, which must
+        be serialisable to JSON, along with the table
+
+    :type filename: str
+    :type parameters: list
+    :type read_table: function
+    :type with_metadata: bool
+
+    :return:
+      the table, with the rows as the first dimension; if ``with_metadata`` is
+      ``True``, the table and the metadata
+
+    :rtype: ``numpy.ndarray`` or (``numpy.ndarray``, ``object``)
+
+    :raises PlotError: if the file could not be read
+    """
+    try:
+        status = os.stat(filename)
+    except OSError:
+        raise PlotError("datafile could not be opened")
+    key = hashlib.sha1(json.dumps([os.path.abspath(filename), status.st_size, status.st_mtime, parameters]).
+                       encode("utf-8")).hexdigest()
+    table_filepath = os.path.join(settings.CACHE_ROOT, "plots", "data", key[:2], key + ".npy")
+    metadata_filepath = os.path.join(settings.CACHE_ROOT, "plots", "data", key[:2], key + ".json")
+    if _touch_plot_file(table_filepath) and (not with_metadata or _touch_plot_file(metadata_filepath)):
+        try:
+            table = numpy.load(table_filepath)
+            if with_metadata:
+                with open(metadata_filepath) as metadata_file:
+                    metadata = json.load(metadata_file)
+        except (IOError, ValueError):
+            pass
+        else:
+            jb_common.utils.base.increment_cache_counter("samples-datafile-cache-hits")
+            return (table, metadata) if with_metadata else table
+    jb_common.utils.base.increment_cache_counter("samples-datafile-cache-misses")
+    result = read_table(open_datafile(filename))
+    table, metadata = result if with_metadata else (result, None)
+    jb_common.utils.base.mkdirs(table_filepath)
+    if with_metadata:
+        _write_cache_file(metadata_filepath, lambda file_: file_.write(json.dumps(metadata).encode("utf-8")))
+    _write_cache_file(table_filepath, lambda file_: numpy.save(file_, table))
+    return result
+
+
+def _write_cache_file(filepath, write):
+    """Writes a file of the data file cache atomically.  The temporary file is
+    unique also among the threads of this process, so that concurrent writers
+    cannot interleave.  Errors are ignored because the cache file is only an
+    optimisation.
+
+    :param filepath: the path to the cache file
+    :param write: function which is called with the file opened in binary mode
+        and writes the content
+
+    :type filepath: str
+    :type write: function
+    """
+    try:
+        file_descriptor, temporary_filepath = tempfile.mkstemp(
+            prefix=os.path.basename(filepath) + ".", suffix=".tmp", dir=os.path.dirname(filepath))
+    except (IOError, OSError):
+        return
+    try:
+        with os.fdopen(file_descriptor, "wb") as file_:
+            os.chmod(temporary_filepath, 0o644)
+            write(file_)
+        os.rename(temporary_filepath, filepath)
+    except (IOError, OSError):
+        pass
+    finally:
+        jb_common.utils.base.remove_file(temporary_filepath)
+
+
+def datafile_cache_hit_rate():
+    """Returns the current hit rate of `read_table_cached`.  This value is
+    between 0 and 1.
+
+    :return:
+      the hit rate, or ``None`` if neither hits nor misses have been recorded
+
+    :rtype: float or NoneType
+    """
+    hits = cache.get("samples-datafile-cache-hits", 0)
+    misses = cache.get("samples-datafile-cache-misses", 0)
+    if hits + misses == 0:
+        return None
+    else:
+        return hits / (hits + misses)
+
+
 def read_plot_file_beginning_at_line_number(filename, columns, start_line_number, end_line_number=None, separator=None):
     """Read a datafile and returns the content of selected columns beginning at
     start_line_number.  You shouldn't use this function directly. Use the
@@ -51,39 +359,20 @@ def read_plot_file_beginning_at_line_number(filename, columns, start_line_number
     :type separator: str or None
 
     :return:
-      List of all columns.  Every column is represented as a list of floating
+      List of all columns.  Every column is represented as an array of floating
       point values.
 
-    :rtype: list of list of float
+    :rtype: list of ``numpy.ndarray``
 
     :raises PlotError: if something wents wrong with interpreting the file (I/O,
         unparseble data)
     """
-    start_values = False
-    try:
-        datafile = codecs.open(filename, encoding="cp1252")
-    except IOError:
-        raise PlotError("datafile could not be opened")
-    result = [[] for i in range(len(columns))]
-    for line_number, line in enumerate(datafile, start=1):
-        if start_values:
-            if end_line_number and line_number > end_line_number:
-                break
-            if not line.strip():
-                continue
-            cells = line.strip().split(separator)
-            for column, result_array in zip(columns, result):
-                try:
-                    value = float(cells[column].replace(",", "."))
-                except IndexError:
-                    raise PlotError("datafile contained too few columns")
-                except ValueError:
-                    value = float("nan")
-                result_array.append(value)
-        elif line_number == start_line_number - 1:
-            start_values = True
-    datafile.close()
-    return result
+    def read_table(content):
+        start = skip_lines(content, 0, start_line_number - 1)
+        end = skip_lines(content, start, end_line_number - start_line_number + 1) if end_line_number else len(content)
+        return parse_table(content[start:end], separator)
+    parameters = ["line number", start_line_number, end_line_number, separator]
+    return select_columns(read_table_cached(filename, parameters, read_table), columns)
 
 
 def read_plot_file_beginning_after_start_value(filename, columns, start_value, end_value="", separator=None):
@@ -107,36 +396,374 @@ def read_plot_file_beginning_after_start_value(filename, columns, start_value, e
     :type separator: str or None
 
     :return:
-      List of all columns.  Every column is represented as a list of floating
+      List of all columns.  Every column is represented as an array of floating
       point values.
 
-    :rtype: list of list of float
+    :rtype: list of ``numpy.ndarray``
 
     :raises PlotError: if something wents wrong with interpreting the file (I/O,
         unparseble data)
     """
-    start_values = False
+    def read_table(content):
+        start_line = find_line(content, start_value)
+        if start_line is None:
+            return numpy.empty((0, 0))
+        start = start_line[1]
+        end_line = find_line(content, end_value, start) if end_value else None
+        end = end_line[0] if end_line else len(content)
+        return parse_table(content[start:end], separator)
+    parameters = ["start value", start_value, end_value, separator]
+    return select_columns(read_table_cached(filename, parameters, read_table), columns)
+
+
+def has_plots(process):
+    """Returns whether the process class offers plots at all, i.e. whether it
+    overrides :py:meth:`samples.models.Process.draw_plot`.
+
+    :param process: the process instance (or process class) to be tested
+
+    :type process: `samples.models.Process` or ``class``
+
+    :return:
+      whether the process has plots
+
+    :rtype: bool
+    """
+    from samples.models import Process
+    process_class = process if isinstance(process, type) else process.__class__
+    return six.get_unbound_function(process_class.draw_plot) is not six.get_unbound_function(Process.draw_plot)
+
+
+def get_datafile_digest(filename):
+    """Returns the SHA-1 digest of the content of a raw data file.  The digest
+    is memoised in the cache together with size and modification time of the
+    file, so the file is read only if it was changed.
+
+    :param filename: absolute path to the raw data file
+
+    :type filename: str
+
+    :return:
+      the hex digest of the file content
+
+    :rtype: str
+
+    :raises PlotError: if the file could not be read
+    """
+    try:
+        status = os.stat(filename)
+    except OSError:
+        raise PlotError("One of the raw datafiles was not found.")
+    cache_key = "datafile-digest:" + hashlib.sha1(filename.encode("utf-8")).hexdigest()
+    cached_digest = cache.get(cache_key)
+    if cached_digest and cached_digest[:2] == (status.st_size, status.st_mtime):
+        return cached_digest[2]
+    hash_ = hashlib.sha1()
     try:
-        datafile = codecs.open(filename, encoding="cp1252")
+        with open(filename, "rb") as datafile:
+            for chunk in iter(lambda: datafile.read(1024 * 1024), b""):
+                hash_.update(chunk)
     except IOError:
-        raise PlotError("datafile could not be opened")
-    result = [[] for i in range(len(columns))]
-    for line in datafile:
-        if start_values:
-            if end_value and line.lower().startswith(end_value):
-                break
-            if not line.strip():
+        raise PlotError("One of the raw datafiles could not be read.")
+    digest = hash_.hexdigest()
+    cache.set(cache_key, (status.st_size, status.st_mtime, digest))
+    return digest
+
+
+def get_plot_filepath(process, plot_id, thumbnail):
+    """Returns the path to the plot file in the local filesystem.  The plot
+    cache below ``CACHE_ROOT/plots`` is content-addressed: The filename is a
+    hash over everything the plot depends on, namely the content of the raw
+    data files, the process' :py:meth:`~samples.models.Process.get_plot_parameters`,
+    the language, and – for the PDF only, because of its title – the process'
+    name.  Thus, the plot file is never outdated, and identical plots are
+    shared between processes.  If the plot is not drawn from raw data files,
+    the ID and the last modification of the process are used instead.
+
+    :param process: the process the plot of which should be located; it must
+        be the actual instance
+    :param plot_id: the ID of the plot; mostly ``""``
+    :param thumbnail: whether the thumbnail rather than the PDF is meant
+
+    :type process: `samples.models.Process`
+    :type plot_id: unicode
+    :type thumbnail: bool
+
+    :return:
+      the absolute path to the plot file; it may not exist yet
+
+    :rtype: str
+
+    :raises PlotError: if there is no such plot or if one of its raw datafiles
+        doesn't exist
+    """
+    datafile_name = process.get_datafile_name(plot_id)
+    if datafile_name is None:
+        raise PlotError("No such plot available.")
+    datafile_names = (datafile_name if isinstance(datafile_name, list) else [datafile_name]) if datafile_name else []
+    hash_ = hashlib.sha1()
+    hash_.update("{0}\x04{1}\x04{2}\x04{3}\x04{4}".format(
+        process.__class__.__name__, plot_id, "thumbnail" if thumbnail else "pdf", translation.get_language(),
+        settings.THUMBNAIL_WIDTH).encode("utf-8"))
+    for filename in datafile_names:
+        hash_.update("\x04{0}".format(get_datafile_digest(filename)).encode("utf-8"))
+    if not datafile_names:
+        hash_.update("\x04{0}\x04{1}".format(process.id, process.last_modified).encode("utf-8"))
+    hash_.update("\x04{0}".format(json.dumps(process.get_plot_parameters(plot_id), sort_keys=True,
+                                             cls=jb_common.utils.base.JSONEncoder)).encode("utf-8"))
+    if not thumbnail:
+        hash_.update("\x04{0}".format(process).encode("utf-8"))
+    digest = hash_.hexdigest()
+    return os.path.join(settings.CACHE_ROOT, "plots", digest[:2], digest + (".png" if thumbnail else ".pdf"))
+
+
+def is_plot_update_necessary(process, plot_id, thumbnail):
+    """Returns whether the plot file needs to be generated.  If the plot file
+    exists, its last use is recorded for the LRU expiry in
+    :py:func:`expire_plot_cache`.
+
+    :param process: the process the plot of which should be checked; it must
+        be the actual instance
+    :param plot_id: the ID of the plot; mostly ``""``
+    :param thumbnail: whether the thumbnail rather than the PDF is meant
+
+    :type process: `samples.models.Process`
+    :type plot_id: unicode
+    :type thumbnail: bool
+
+    :return:
+      whether the plot file must be generated
+
+    :rtype: bool
+
+    :raises PlotError: if there is no such plot or if one of its raw datafiles
+        doesn't exist
+    """
+    return not _touch_plot_file(get_plot_filepath(process, plot_id, thumbnail))
+
+
+def _touch_plot_file(plot_filepath):
+    """Marks a plot file as used now.  In order to avoid a write access at every
+    view of the plot, the modification time is updated at most once per hour.
+    We don't use the access time because many filesystems are mounted with
+    ``noatime``.
+
+    :return:
+      whether the plot file exists
+
+    :rtype: bool
+    """
+    try:
+        modification_time = os.path.getmtime(plot_filepath)
+    except OSError:
+        return False
+    if time.time() - modification_time > 3600:
+        try:
+            os.utime(plot_filepath, None)
+        except OSError:
+            pass
+    return True
+
+
+def generate_plot(process, plot_id, thumbnail):
+    """Generates the plot file by calling the process' ``draw_plot`` method.
+    The file is written atomically because it may be shared by many processes
+    and requested concurrently.
+
+    :param process: the process the plot of which should be generated; it must
+        be the actual instance
+    :param plot_id: the ID of the plot; mostly ``""``
+    :param thumbnail: whether the thumbnail rather than the PDF should be
+        generated
+
+    :type process: `samples.models.Process`
+    :type plot_id: unicode
+    :type thumbnail: bool
+
+    :return:
+      the absolute path to the generated plot file
+
+    :rtype: str
+
+    :raises PlotError: if the plot could not be generated
+    """
+    # Local because Matplotlib is expensive to import, and this module is
+    # imported by model modules.
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    plot_filepath = get_plot_filepath(process, plot_id, thumbnail)
+    datafile_name = process.get_datafile_name(plot_id)
+    jb_common.utils.base.mkdirs(plot_filepath)
+    # The temporary file must be unique also among the threads of this
+    # process because they may generate the same plot concurrently.
+    file_descriptor, temporary_filepath = tempfile.mkstemp(
+        prefix=os.path.basename(plot_filepath) + ".", suffix=".tmp", dir=os.path.dirname(plot_filepath))
+    try:
+        with os.fdopen(file_descriptor, "wb") as temporary_file:
+            os.chmod(temporary_filepath, 0o644)
+            if thumbnail:
+                figure = Figure(frameon=False, figsize=(4, 3))
+                canvas = FigureCanvasAgg(figure)
+                axes = figure.add_subplot(111)
+                axes.set_position((0.17, 0.16, 0.78, 0.78))
+                axes.grid(True)
+                process.draw_plot(axes, plot_id, datafile_name, for_thumbnail=True)
+                canvas.print_figure(temporary_file, format="png", dpi=settings.THUMBNAIL_WIDTH / 4)
+            else:
+                figure = Figure()
+                canvas = FigureCanvasAgg(figure)
+                axes = figure.add_subplot(111)
+                axes.grid(True)
+                axes.set_title(six.text_type(process))
+                process.draw_plot(axes, plot_id, datafile_name, for_thumbnail=False)
+                # FixMe: Activate this line with Matplotlib 1.1.0.
+#                figure.tight_layout()
+                canvas.print_figure(temporary_file, format="pdf")
+        try:
+            os.rename(temporary_filepath, plot_filepath)
+        except OSError:
+            # On some platforms, renaming doesn't replace an existing file.
+            # Then, another thread has generated the very same plot meanwhile.
+            if not os.path.exists(plot_filepath):
+                raise
+    finally:
+        jb_common.utils.base.remove_file(temporary_filepath)
+    return plot_filepath
+
+
+def prerender_plots(process):
+    """Generates all missing plots of a process, for all languages and both for
+    the thumbnails and the PDFs.  Plots that cannot be generated are silently
+    skipped; they will yield a 404 when requested anyway.
+
+    :param process: the process the plots of which should be generated; it
+        must be the actual instance
+
+    :type process: `samples.models.Process`
+
+    :return:
+      the number of generated plot files
+
+    :rtype: int
+    """
+    generated_plots = 0
+    for language, __ in settings.LANGUAGES:
+        with translation.override(language):
+            for plot_id in process.get_plot_ids():
+                for thumbnail in (True, False):
+                    try:
+                        if is_plot_update_necessary(process, plot_id, thumbnail):
+                            generate_plot(process, plot_id, thumbnail)
+                            generated_plots += 1
+                    except PlotError:
+                        pass
+    return generated_plots
+
+
+def expire_plot_cache(max_size=None):
+    """Removes the least recently used plot files until the plot cache is not
+    larger than `max_size`.  Leftovers of aborted plot generations are removed,
+    too.
+
+    :param max_size: the maximal size of the plot cache in bytes; defaults to
+        the setting ``PLOT_CACHE_MAX_SIZE``
+
+    :type max_size: int
+
+    :return:
+      the number of removed files
+
+    :rtype: int
+    """
+    if max_size is None:
+        max_size = settings.PLOT_CACHE_MAX_SIZE
+    plot_files = []
+    removed_files = 0
+    for root, __, filenames in os.walk(os.path.join(settings.CACHE_ROOT, "plots")):
+        for filename in filenames:
+            filepath = os.path.join(root, filename)
+            try:
+                status = os.stat(filepath)
+            except OSError:
                 continue
-            cells = line.strip().split(separator)
-            for column, result_array in zip(columns, result):
-                try:
-                    value = float(cells[column].replace(",", "."))
-                except IndexError:
-                    raise PlotError("datafile contained too few columns")
-                except ValueError:
-                    value = float("nan")
-                result_array.append(value)
-        elif line.lower().startswith(start_value.lower()):
-            start_values = True
-    datafile.close()
+            if filename.endswith(".tmp"):
+                if time.time() - status.st_mtime > 3600:
+                    removed_files += jb_common.utils.base.remove_file(filepath)
+            else:
+                plot_files.append((status.st_mtime, status.st_size, filepath))
+    total_size = sum(size for __, size, __ in plot_files)
+    for __, size, filepath in sorted(plot_files):
+        if total_size <= max_size:
+            break
+        if jb_common.utils.base.remove_file(filepath):
+            removed_files += 1
+        total_size -= size
+    return removed_files
+
+
+def _get_queue_path(process_id):
+    """Returns the path to the file which represents the queue entry of a
+    process.  The queue is a directory in ``CACHE_ROOT`` with one empty file per
+    process, named after the process ID.  This way, queueing is idempotent,
+    and it doesn't need any locking.
+    """
+    return os.path.join(settings.CACHE_ROOT, "plot_queue", str(process_id))
+
+
+def enqueue_plot_rendering(process_id):
+    """Schedules the plots of a process for being generated by the
+    ``render_plots`` management command.  If the process is already in the
+    queue, its queue entry is refreshed.
+
+    :param process_id: the ID of the process
+
+    :type process_id: int
+    """
+    path = _get_queue_path(process_id)
+    jb_common.utils.base.mkdirs(path)
+    with open(path, "a"):
+        os.utime(path, None)
+
+
+def get_queued_plot_renderings():
+    """Returns all process IDs in the plot rendering queue, together with the
+    time they were queued.  The latter must be passed to
+    :py:func:`dequeue_plot_rendering`.
+
+    :return:
+      the queued process IDs, mapped to their queueing time
+
+    :rtype: dict mapping int to float
+    """
+    queue_path = os.path.dirname(_get_queue_path(0))
+    try:
+        filenames = os.listdir(queue_path)
+    except OSError:
+        return {}
+    result = {}
+    for filename in filenames:
+        try:
+            result[int(filename)] = os.path.getmtime(os.path.join(queue_path, filename))
+        except (ValueError, OSError):
+            pass
     return result
+
+
+def dequeue_plot_rendering(process_id, queueing_time):
+    """Removes a process from the plot rendering queue.  If the process was
+    queued again after `queueing_time`, it stays in the queue, because its
+    plots may have become outdated again in the meantime.
+
+    :param process_id: the ID of the process
+    :param queueing_time: the queueing time as returned by
+        :py:func:`get_queued_plot_renderings`
+
+    :type process_id: int
+    :type queueing_time: float
+    """
+    path = _get_queue_path(process_id)
+    try:
+        if os.path.getmtime(path) <= queueing_time:
+            os.remove(path)
+    except OSError:
+        pass
@@ -24,6 +24,7 @@ import importlib
 from django.conf.urls import url
 from django.core.urlresolvers import get_callable
 from jb_common.utils.base import camel_case_to_underscores
+from samples.utils.views import bulk_submittable
 from samples.views import lab_notebook
 import samples.views.main
 
@@ -100,9 +101,9 @@ class PatternGenerator(object):
             module = importlib.import_module(self.views_prefix + class_name_with_underscores)
             if "add" in views or "edit" in views:
                 try:
-                    edit_view_callable = module.EditView.as_view()
+                    edit_view_callable = bulk_submittable(module.EditView.as_view())
                 except AttributeError:
-                    edit_view_callable = module.edit
+                    edit_view_callable = bulk_submittable(module.edit)
         if "add" in views:
             self.url_patterns.append(url(r"^{}/add/$".format(url_name), edit_view_callable,
                                          {normalized_id_field: None}, "add_" + class_name_with_underscores))
@@ -30,7 +30,7 @@ import copy, re, csv
 from django.conf import settings
 from django.core.cache import cache
 from django.db.models import Q
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.utils.translation import ugettext_lazy as _, ugettext
 from django.contrib.contenttypes.models import ContentType
 from django.template import defaultfilters
@@ -44,8 +44,8 @@ import jb_common.utils.base
 __all__ = ("sample_name_format", "get_renamable_name_formats", "verbose_sample_name_format", "get_sample",
            "does_sample_exist", "normalize_sample_name", "AmbiguityException", "lookup_sample", "convert_id_to_int",
            "successful_response", "remove_samples_from_my_samples", "StructuredSeries", "StructuredTopic",
-           "build_structured_sample_list", "extract_preset_sample", "digest_process", "restricted_samples_query",
-           "enforce_clearance", "UnicodeWriter", "table_export", "median", "average")
+           "build_structured_sample_list", "extract_preset_sample", "digest_process", "digest_processes", "restricted_samples_query",
+           "enforce_clearance", "UnicodeWriter", "table_export", "median", "average", "bulk_submittable")
 
 
 def sample_name_format(name, with_match_object=False):
@@ -542,22 +542,56 @@ def digest_process(process, user, local_context={}):
 
     :rtype: dict mapping str to ``object``
     """
-    process = process.actual_instance
-    cache_key = process.get_cache_key(user.jb_user_details.get_data_hash(), local_context)
-    cached_context = jb_common.utils.base.get_from_cache(cache_key) if cache_key else None
-    if cached_context is None:
-        process_context = process.get_context_for_user(user, local_context)
+    return digest_processes([(process, local_context)], user)[0]
+
+
+def digest_processes(processes, user):
+    """Batch version of `digest_process`.  It fetches all cached process
+    contexts with one cache round trip and writes the missing ones back with
+    another one.
+
+    :param processes: the processes to be digested, each together with its
+      local sample context (see `digest_process`)
+    :param user: current user
+
+    :type processes: list of (`samples.models.Process`, dict mapping str to
+      ``object``)
+    :type user: django.contrib.auth.models.User
+
+    :return:
+      the process contexts of the given processes, in the same order
+
+    :rtype: list of dict mapping str to ``object``
+    """
+    user_settings_hash = user.jb_user_details.get_data_hash()
+    processes = [(process.actual_instance, local_context) for process, local_context in processes]
+    generations = jb_common.utils.base.get_cache_generations(
+        ["process-generation:{0}".format(process.id) for process, __ in processes])
+    cache_keys = []
+    for process, local_context in processes:
+        cache_key = process.get_cache_key(user_settings_hash, local_context)
         if cache_key:
-            keys_list_key = "process-keys:{0}".format(process.id)
-            with jb_common.utils.base.cache_key_locked("process-lock:{0}".format(process.id)):
-                keys = cache.get(keys_list_key, [])
-                keys.append(cache_key)
-                cache.set(keys_list_key, keys, settings.CACHES["default"].get("TIMEOUT", 300) + 10)
-                cache.set(cache_key, process_context)
-    else:
-        cached_context.update(local_context)
-        process_context = process.get_context_for_user(user, cached_context)
-    return process_context
+            cache_key += "-{0}".format(generations["process-generation:{0}".format(process.id)])
+        cache_keys.append(cache_key)
+    cached_contexts = jb_common.utils.base.get_many_from_cache([cache_key for cache_key in cache_keys if cache_key])
+    process_contexts = []
+    new_cache_items = {}
+    for (process, local_context), cache_key in zip(processes, cache_keys):
+        cached_context = cached_contexts.get(cache_key) if cache_key else None
+        if cached_context is None:
+            process_context = process.get_context_for_user(user, local_context)
+            if cache_key:
+                new_cache_items[cache_key] = process_context
+        else:
+            # The same cache key may occur more than once, so every process
+            # gets its own copy of the cached context.
+            cached_context = copy.copy(cached_context)
+            cached_context.update(local_context)
+            process_context = process.get_context_for_user(user, cached_context)
+        process_contexts.append(process_context)
+    if new_cache_items:
+        cache.set_many(new_cache_items)
+    return process_contexts
 
 
 def restricted_samples_query(user):
@@ -699,6 +733,29 @@ class UnicodeWriter(object):
         return self.stream.getvalue()
 
 
+def _generate_csv(rows):
+    """Converts table rows to CSV chunks, one for each row.  This is used for
+    streaming table exports, so that the CSV output never needs to be held in
+    memory completely.
+
+    :param rows: the table rows; each row is a list of table cells
+
+    :type rows: iterable of list of object
+
+    :return:
+      the CSV lines
+
+    :rtype: iterator over str
+    """
+    buffer_ = StringIO()
+    writer = UnicodeWriter(buffer_) if six.PY2 else csv.writer(buffer_, dialect=csv.excel_tab)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer_.getvalue()
+        buffer_.seek(0)
+        buffer_.truncate(0)
+
+
 def table_export(request, data, label_column_heading):
     """Helper function which does almost all work needed for a CSV table
     export view.  This is not a view per se, however, it is called by views,
@@ -706,7 +763,12 @@ def table_export(request, data, label_column_heading):
     `sample.export`.
 
     This function return the data in JSON format if this is requested by the
-    ``Accept`` header field in the HTTP request.
+    ``Accept`` header field in the HTTP request.  Otherwise, the CSV data is
+    streamed to the client row by row.  If the row nodes of the data tree are
+    :py:class:`samples.data_tree.LazyChildren`, only one row tree is held in
+    memory at a time; they are created twice, once for finding the columns,
+    and once for generating the table.  Otherwise, the data tree is consumed
+    while the CSV data is streamed.
 
     :param request: the current HTTP Request object
     :param data: the root node of the data tree
@@ -732,8 +794,14 @@ def table_export(request, data, label_column_heading):
     get_data = request.GET if any(key.startswith("__old_data") for key in request.GET) else None
     requested_mime_type = mimeparse.best_match(["text/csv", "application/json"], request.META.get("HTTP_ACCEPT", "text/csv"))
     data.find_unambiguous_names()
-    data.complete_items_in_children()
-    column_groups, columns = build_column_group_list(data)
+    label_column = []
+    def collect_labels(row_trees):
+        for row_tree in row_trees:
+            label_column.append(row_tree.descriptive_name)
+            yield row_tree
+    labelled_root = copy.copy(data)
+    labelled_root.children = collect_labels(data.children)
+    column_groups, columns = build_column_group_list(labelled_root)
     single_column_group = {column_groups[0].name} if len(column_groups) == 1 else set()
     table = switch_row_forms = None
     selected_column_groups = single_column_group
@@ -750,36 +818,61 @@ def table_export(request, data, label_column_heading):
         selected_column_groups = single_column_group or column_groups_form.cleaned_data["column_groups"]
         if columns_form.is_valid():
             selected_columns = columns_form.cleaned_data["columns"]
-            label_column = [row.descriptive_name for row in data.children]
-            table = generate_table_rows(flatten_tree(data), columns, columns_form.cleaned_data["columns"],
-                                        label_column, label_column_heading)
+            number_of_rows = len(label_column) + 1
+            if previous_columns and previous_column_groups == selected_column_groups and \
+                    previous_columns == selected_columns:
+                switch_row_forms = [SwitchRowForm(get_data, prefix=str(i)) for i in range(number_of_rows)]
+                if all([switch_row_form.is_valid() for switch_row_form in switch_row_forms]):
+                    active_rows = {i for i, switch_row_form in enumerate(switch_row_forms)
+                                   if switch_row_form.cleaned_data["active"] or i == 0}
+                    descriptive_name = data.descriptive_name
+                    table = generate_table_rows(flatten_tree(data, consume=True), columns, selected_columns,
+                                                label_column, label_column_heading)
+                    reduced_table = (row for i, row in enumerate(table) if i in active_rows)
+                    if requested_mime_type == "application/json":
+                        head_row = next(reduced_table)
+                        data = [dict((head_row[i], cell) for i, cell in enumerate(row) if cell) for row in reduced_table]
+                        return jb_common.utils.base.respond_in_json(data)
+                    else:
+                        response = StreamingHttpResponse(_generate_csv(reduced_table),
+                                                         content_type="text/csv; charset=utf-8")
+                        response['Content-Disposition'] = \
+                            "attachment; filename=juliabase--{0}.txt".format(defaultfilters.slugify(descriptive_name))
+                        return response
+            table = list(generate_table_rows(flatten_tree(data), columns, selected_columns, label_column,
+                                             label_column_heading))
             start_column_index = 1 if any(label_column) else 0
             if not(previous_columns) and selected_columns:
                 switch_row_forms = [SwitchRowForm(prefix=str(i), initial={"active": any(row[start_column_index:])})
                                     for i, row in enumerate(table)]
-            else:
+            elif switch_row_forms is None:
                 switch_row_forms = [SwitchRowForm(get_data, prefix=str(i)) for i in range(len(table))]
-            all_switch_row_forms_valid = all([switch_row_form.is_valid() for switch_row_form in switch_row_forms])
-            if all_switch_row_forms_valid and \
-                    previous_column_groups == selected_column_groups and previous_columns == selected_columns:
-                reduced_table = [row for i, row in enumerate(table) if switch_row_forms[i].cleaned_data["active"] or i == 0]
-                if requested_mime_type == "application/json":
-                    data = [dict((reduced_table[0][i], cell) for i, cell in enumerate(row) if cell)
-                            for row in reduced_table[1:]]
-                    return jb_common.utils.base.respond_in_json(data)
-                else:
-                    response = HttpResponse(content_type="text/csv; charset=utf-8")
-                    response['Content-Disposition'] = \
-                        "attachment; filename=juliabase--{0}.txt".format(defaultfilters.slugify(data.descriptive_name))
-                    writer = UnicodeWriter(response) if six.PY2 else csv.writer(response, dialect=csv.excel_tab)
-                    writer.writerows(reduced_table)
-                return response
     if selected_column_groups != previous_column_groups:
         columns_form = ColumnsForm(column_groups, columns, selected_column_groups, initial={"columns": selected_columns})
     old_data_form = OldDataForm(initial={"column_groups": selected_column_groups, "columns": selected_columns})
     return (column_groups_form, columns_form, table, switch_row_forms, old_data_form)
 
 
+def bulk_submittable(view):
+    """Marks a view as callable within a bulk submission of the remote client,
+    see :py:func:`samples.views.json_client.bulk_submit`.  Only views which add
+    or edit data, and which are used by the remote client, should be marked.
+    It can be used as a decorator, or applied to the view in the URL
+    configuration, e.g. for class-based views.
+
+    :param view: the view function
+
+    :type view: function
+
+    :return:
+      the view function
+
+    :rtype: function
+    """
+    view.bulk_submittable = True
+    return view
+
+
 def median(numeric_values):
     """Calculates the median from a list of numeric values.
 
@@ -256,7 +256,7 @@ class ProcessWithoutSamplesView(TemplateView):
         referentially_valid = self.is_referentially_valid()
         if all_valid and referentially_valid:
             self.process = self.save_to_database()
-            Reporter(request.user).report_physical_process(
+            Reporter(request.user, deferred=True).report_physical_process(
                 self.process, self.forms["edit_description"].cleaned_data if self.forms["edit_description"] else None)
             success_report = _("{process} was successfully changed in the database."). \
                 format(process=self.process) if self.id else \
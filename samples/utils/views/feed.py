@@ -24,8 +24,10 @@ the database was changed in one way or another.
 
 from __future__ import absolute_import, unicode_literals
 
+import django.contrib.auth.models
 from django.contrib.contenttypes.models import ContentType
 import jb_common.models
+from jb_common.utils.base import run_after_commit
 from samples import models, permissions
 
 
@@ -61,32 +63,46 @@ class Reporter(object):
         feed_utils.Reporter(request.user).report_result_process(
                 result, edit_description=None)
 
-    :ivar interested_users: all users that get informed with the next generated
-      feed entry by a call to `__connect_with_users`
+    The recipients of the feed entries are determined with a constant number of
+    database queries, and they are connected with the entries with one bulk
+    insert.  In deferred mode, the latter happens only after the transaction of
+    the current request was committed, see
+    :py:func:`jb_common.utils.base.run_after_commit`.
 
-    :ivar already_informed_users: All users who have already received a feed
-      entry from this instance of ``Reporter``.  They won't get a second
-      entry.
+    :ivar interested_users: the IDs of all users that get informed with the
+      next generated feed entry by a call to `__connect_with_users`
+
+    :ivar already_informed_users: The IDs of all users who have already
+      received a feed entry from this instance of ``Reporter``.  They won't get
+      a second entry.
 
     :ivar originator: the user responsible for the databse change reported by
       the feed entry of this instance of ``Reporter``.
 
-    :type interested_users: set of django.contrib.auth.models.User
-    :type already_informed_users: set of django.contrib.auth.models.User
+    :ivar deferred: whether the feed entries are connected with their
+      recipients after the current transaction was committed
+
+    :type interested_users: set of int
+    :type already_informed_users: set of int
     :type originator: django.contrib.auth.models.User
+    :type deferred: bool
     """
 
-    def __init__(self, originator):
+    def __init__(self, originator, deferred=False):
         """Class constructor.
 
         :param originator: the user who did the database change to be reported;
             almost always, this is the currently logged-in user
+        :param deferred: whether the feed entries should be connected with
+            their recipients only after the current transaction was committed
 
         :type originator: django.contrib.auth.models.User
+        :type deferred: bool
         """
         self.interested_users = set()
         self.already_informed_users = set()
         self.originator = originator
+        self.deferred = deferred
 
     def __connect_with_users(self, entry, sending_model=None):
         """Take an already generated feed entry and set its recipients to all
@@ -104,17 +120,25 @@ class Reporter(object):
         :type entry: `samples.models.FeedEntry`
         :type sending_model: class, descendant of ``models.Model``
         """
-        self.interested_users -= self.already_informed_users
-        if sending_model:
-            self.interested_users &= set(user_details.user for user_details in
-                                         ContentType.objects.get_for_model(sending_model).subscribed_users.all())
-        self.already_informed_users.update(self.interested_users)
-        self.interested_users.discard(self.originator)
-        if self.interested_users:
-            entry.users = self.interested_users
-        else:
-            entry.delete()
+        interested_users = self.interested_users
         self.interested_users = set()
+        def connect_with_users():
+            recipients = interested_users - self.already_informed_users
+            if sending_model:
+                recipients &= set(ContentType.objects.get_for_model(sending_model).subscribed_users.
+                                  values_list("user", flat=True))
+            self.already_informed_users.update(recipients)
+            recipients.discard(self.originator.pk)
+            if recipients:
+                through_model = models.FeedEntry.users.through
+                through_model.objects.bulk_create(through_model(feedentry_id=entry.pk, user_id=user_id)
+                                                  for user_id in recipients)
+            else:
+                entry.delete()
+        if self.deferred:
+            run_after_commit(connect_with_users)
+        else:
+            connect_with_users()
 
     def __add_interested_users(self, samples, important=True):
         """Add users interested in news about the given samples.  These are
@@ -126,14 +150,30 @@ class Reporter(object):
         :param important: whether the news is marked as being important;
             defaults to ``True``
 
-        :type samples: list of `samples.models.Sample`
+        :type samples: list of `samples.models.Sample` or QuerySet
         :type important: bool
         """
-        for sample in samples:
-            for user in sample.watchers.all():
-                if (important or not user.samples_user_details.only_important_news) and \
-                        permissions.has_permission_to_fully_view_sample(user, sample):
-                    self.interested_users.add(user)
+        sample_ids = [sample.pk for sample in samples]
+        watchings = list(models.Sample.watchers.through.objects.filter(sample__in=sample_ids).
+                         exclude(user__in=self.interested_users).values_list("user_id", "sample_id"))
+        if not watchings:
+            return
+        users = django.contrib.auth.models.User.objects.filter(pk__in={user_id for user_id, __ in watchings}). \
+                select_related("jb_user_details__department", "samples_user_details")
+        if not important:
+            users = users.filter(samples_user_details__only_important_news=False)
+        users = {user.pk: user for user in users}
+        if not users:
+            return
+        # The topic members are prefetched so that the permission check doesn't
+        # need further database queries.
+        samples = {sample.pk: sample for sample in models.Sample.objects.filter(pk__in=sample_ids).
+                   select_related("topic", "currently_responsible_person__jb_user_details__department").
+                   prefetch_related("topic__members")}
+        for user_id, sample_id in watchings:
+            if user_id in users and user_id not in self.interested_users and \
+                    permissions.has_permission_to_fully_view_sample(users[user_id], samples[sample_id]):
+                self.interested_users.add(user_id)
 
     def __add_watchers(self, process_or_sample_series, important=True):
         """Add users interested in news about the given process or sample
@@ -165,8 +205,8 @@ class Reporter(object):
 
         :type topic: `jb_common.models.Topic`
         """
-        self.interested_users.update(user for user in topic.members.iterator()
-                                     if not user.samples_user_details.only_important_news)
+        self.interested_users.update(topic.members.filter(samples_user_details__only_important_news=False).
+                                     values_list("pk", flat=True))
 
     def __get_subscribers(self, sample_series):
         """
@@ -176,10 +216,10 @@ class Reporter(object):
         :type sample_series: `samples.models.SampleSeries`
 
         :return:
-          all user who watch a sample in this sample series, and therefore, the
-          sample series itself, too
+          the IDs of all user who watch a sample in this sample series, and
+          therefore, the sample series itself, too
 
-        :rtype: list of `models.UserDetails`
+        :rtype: set of int
         """
         # This is a hack but I think it's okay.  I save
         # ``self.interested_users``, fill it with the subscribers, and restore
@@ -275,7 +315,7 @@ class Reporter(object):
         """
         entry = models.FeedCopiedMySamples.objects.create(originator=self.originator, comments=comments)
         entry.samples = samples
-        self.interested_users.add(recipient)
+        self.interested_users.add(recipient.pk)
         self.__connect_with_users(entry, models.Sample)
 
     def report_new_responsible_person_samples(self, samples, edit_description):
@@ -299,7 +339,7 @@ class Reporter(object):
             originator=self.originator, description=edit_description["description"],
             important=edit_description["important"], responsible_person_changed=True)
         entry.samples = samples
-        self.interested_users.add(samples[0].currently_responsible_person)
+        self.interested_users.add(samples[0].currently_responsible_person_id)
         self.__connect_with_users(entry, models.Sample)
 
     def report_changed_sample_topic(self, samples, old_topic, edit_description):
@@ -411,7 +451,7 @@ class Reporter(object):
         entry = models.FeedEditedSampleSeries.objects.create(
             originator=self.originator, description=edit_description["description"],
             important=edit_description["important"], responsible_person_changed=True, sample_series=sample_series)
-        self.interested_users.add(sample_series.currently_responsible_person)
+        self.interested_users.add(sample_series.currently_responsible_person_id)
         self.__connect_with_users(entry, models.SampleSeries)
 
     def report_changed_sample_series_topic(self, sample_series, old_topic, edit_description):
@@ -471,7 +511,7 @@ class Reporter(object):
         :type action: str
         """
         entry = models.FeedChangedTopic.objects.create(originator=self.originator, topic=topic, action=action)
-        self.interested_users = set(users)
+        self.interested_users = set(user.pk for user in users)
         self.__connect_with_users(entry, jb_common.models.Topic)
 
     def report_status_message(self, process_class, status_message):
@@ -487,7 +527,7 @@ class Reporter(object):
         """
         entry = models.FeedStatusMessage.objects.create(originator=self.originator, process_class=process_class,
                                                         status=status_message)
-        self.interested_users = set(user_details.user for user_details in process_class.subscribed_users.all())
+        self.interested_users = set(process_class.subscribed_users.values_list("user", flat=True))
         self.__connect_with_users(entry)
 
     def report_withdrawn_status_message(self, process_class, status_message):
@@ -503,7 +543,7 @@ class Reporter(object):
         """
         entry = models.FeedWithdrawnStatusMessage.objects.create(
             originator=self.originator, process_class=process_class, status=status_message)
-        self.interested_users = set(user_details.user for user_details in process_class.subscribed_users.all())
+        self.interested_users = set(process_class.subscribed_users.values_list("user", flat=True))
         self.__connect_with_users(entry)
 
     def report_task(self, task, edit_description=None):
@@ -519,11 +559,11 @@ class Reporter(object):
         :type edit_description: dict mapping str to ``object`` or ``None``
         """
         process_class = task.process_class
-        self.interested_users = set(permissions.get_all_adders(task.process_class.model_class()))
+        self.interested_users = set(user.pk for user in permissions.get_all_adders(task.process_class.model_class()))
         if edit_description is None:
             entry = models.FeedNewTask.objects.create(originator=self.originator, task=task)
         else:
-            self.interested_users.add(task.customer)
+            self.interested_users.add(task.customer_id)
             important = edit_description["important"]
             entry = models.FeedEditedTask.objects.create(originator=self.originator, task=task,
                                                          description=edit_description["description"], important=important)
@@ -537,8 +577,8 @@ class Reporter(object):
 
         :type task: `models.Task`
         """
-        self.interested_users = set(permissions.get_all_adders(task.process_class.model_class()))
-        self.interested_users.add(task.customer)
+        self.interested_users = set(user.pk for user in permissions.get_all_adders(task.process_class.model_class()))
+        self.interested_users.add(task.customer_id)
         entry = models.FeedRemovedTask.objects.create(old_id=task.id, originator=self.originator,
                                                       process_class=task.process_class)
         entry.samples = task.samples.all()
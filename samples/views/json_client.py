@@ -25,12 +25,16 @@ communication to the remote client happens in JSON format.
 """
 
 from __future__ import absolute_import, unicode_literals
+import django.utils.six as six
 
-import sys, json
+import sys, json, re, copy
+from django.db import transaction
 from django.db.utils import IntegrityError
 from django.db.models import Q
 from django.conf import settings
-from django.http import Http404
+from django.http import Http404, QueryDict
+from django.utils.datastructures import MultiValueDict
+import django.core.urlresolvers
 from django.utils.translation import ugettext as _
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
@@ -41,11 +45,13 @@ import django.contrib.auth
 from django.shortcuts import get_object_or_404
 from django.contrib.contenttypes.models import ContentType
 from jb_common.models import Topic
-from jb_common.utils.base import respond_in_json, JSONRequestException, int_or_zero
+from jb_common.utils.base import respond_in_json, JSONRequestException, int_or_zero, pop_after_commit_callbacks, \
+    start_collecting_after_commit_callbacks
 import samples.utils.views as utils
 from samples import models, permissions
 
 
+@utils.bulk_submittable
 @login_required
 @require_http_methods(["POST"])
 @ensure_csrf_cookie
@@ -158,13 +164,23 @@ def primary_keys(request):
         if request.GET["samples"] == "*":
             result_dict["samples"] = dict(request.user.my_samples.values_list("name", "id"))
         else:
-            restricted_samples = utils.restricted_samples_query(request.user)
-            sample_names = request.GET["samples"].split(",")
-            result_dict["samples"] = {}
-            for alias, sample_id in models.SampleAlias.objects.filter(name__in=sample_names, sample__in=restricted_samples). \
-               values_list("name", "sample"):
-                result_dict["samples"].setdefault(alias, set()).add(sample_id)
-            result_dict["samples"].update(restricted_samples.filter(name__in=sample_names).values_list("name", "id"))
+            restricted_samples = utils.restricted_samples_query(request.user).order_by()
+            sample_names = sorted(set(request.GET["samples"].split(",")))
+            sample_ids, alias_sample_ids = {}, {}
+            # Names and aliases are looked up with one query.  The aliases are
+            # joined with an outer join, so each row contains a matching
+            # sample with one of its aliases, or with ``None``.  The chunks
+            # keep the number of SQL parameters in bounds.
+            for i in range(0, len(sample_names), 400):
+                chunk = set(sample_names[i:i + 400])
+                for sample_id, name, alias in restricted_samples. \
+                    filter(Q(name__in=chunk) | Q(aliases__name__in=chunk)).values_list("id", "name", "aliases__name"):
+                    if name in chunk:
+                        sample_ids[name] = sample_id
+                    if alias in chunk:
+                        alias_sample_ids.setdefault(alias, set()).add(sample_id)
+            alias_sample_ids.update(sample_ids)
+            result_dict["samples"] = alias_sample_ids
     if "depositions" in request.GET:
         deposition_numbers = request.GET["depositions"].split(",")
         result_dict["depositions"] = dict(models.Deposition.objects.
@@ -373,6 +389,131 @@ def change_my_samples(request):
     return respond_in_json(changed_sample_ids)
 
 
+_result_reference_pattern = re.compile(r"\x00result:(\d+)\x00")
+
+def _substitute_result_references(value, results):
+    """Replaces the references to results of earlier requests in a value of
+    the POST data or in the URL of a request in `bulk_submit`.  Results which are lists
+    become comma-separated strings, like sample ID lists in the remote client.
+
+    :param value: one value of the POST data, or the URL
+    :param results: the results of the previous requests in the bulk
+
+    :type value: unicode
+    :type results: list
+
+    :return:
+      the value with all references replaced
+
+    :rtype: unicode
+    """
+    def replace(match):
+        try:
+            result = results[int(match.group(1))]
+        except IndexError:
+            raise JSONRequestException(5, "Reference to a later request.")
+        if isinstance(result, list):
+            return ",".join(six.text_type(item) for item in result)
+        return six.text_type(result)
+    return _result_reference_pattern.sub(replace, value)
+
+
+class _BulkFormError(Exception):
+    """Raised in `bulk_submit` if a view returned a web form with errors.
+
+    :ivar response: the response of the view
+    """
+    def __init__(self, response):
+        super(_BulkFormError, self).__init__()
+        self.response = response
+
+
+# Maximal number of requests in one bulk submission.
+max_bulk_requests = 1000
+
+@login_required
+@require_http_methods(["POST"])
+@ensure_csrf_cookie
+def bulk_submit(request):
+    """Processes many POST requests of the remote client at once.  All of them
+    are processed in one transaction: Either all of them succeed, or nothing is
+    changed in the database.  Work which is done after the commit, e.g. feed
+    entries and cache expiry, is done only once for the whole bulk.
+
+    Only views marked with :py:func:`samples.utils.views.bulk_submittable`
+    can be called, and at most `max_bulk_requests` requests are accepted.
+
+    :param request: The current HTTP Request object.  It must contain in
+        ``"requests"`` a JSON list of requests, each of them being a list with
+        the URL (without the root URL, as for the remote client's
+        ``connection.open``) and a dict with the POST data.  The POST values
+        may contain references of the form :samp:`\\x00result:{index}\\x00` to
+        the result of an earlier request in the list.
+
+    :type request: HttpRequest
+
+    :return:
+      The results of all requests.  If a request failed, the error is the same
+      as for the request alone, but with its index in the error message.
+
+    :rtype: HttpResponse
+    """
+    try:
+        requests = json.loads(request.POST["requests"])
+    except KeyError:
+        raise JSONRequestException(3, '"requests" missing')
+    except ValueError:
+        raise JSONRequestException(5, '"requests" is not valid JSON')
+    if not isinstance(requests, list):
+        raise JSONRequestException(5, '"requests" is not a list')
+    if len(requests) > max_bulk_requests:
+        raise JSONRequestException(5, "More than {0} requests in the bulk.".format(max_bulk_requests))
+    results = []
+    try:
+        with transaction.atomic():
+            for i, (relative_url, data) in enumerate(requests):
+                relative_url = _substitute_result_references(relative_url, results)
+                path, __, query_string = relative_url.partition("?")
+                try:
+                    resolver_match = django.core.urlresolvers.resolve("/" + path)
+                except django.core.urlresolvers.Resolver404:
+                    raise Http404("Request {0}: URL {1} not found.".format(i, relative_url))
+                if not getattr(resolver_match.func, "bulk_submittable", False):
+                    raise JSONRequestException(6, "Request {0}: URL {1} can't be used in a bulk.".format(i, relative_url))
+                sub_request = copy.copy(request)
+                sub_request.path = request.path[:len(request.path) - len(request.path_info)] + "/" + path
+                sub_request.path_info = "/" + path
+                sub_request.resolver_match = resolver_match
+                sub_request.GET = QueryDict(query_string)
+                sub_request.POST = QueryDict("", mutable=True)
+                for key, value in data.items():
+                    values = value if isinstance(value, list) else [value]
+                    sub_request.POST.setlist(key, [_substitute_result_references(value, results) for value in values])
+                sub_request._files = MultiValueDict()
+                try:
+                    response = resolver_match.func(sub_request, *resolver_match.args, **resolver_match.kwargs)
+                except Http404 as error:
+                    raise Http404("Request {0}: {1}".format(i, error.args[0] if error.args else ""))
+                except JSONRequestException as error:
+                    raise JSONRequestException(error.error_number, "Request {0}: {1}".format(i, error.error_message))
+                content_type = response.get("Content-Type", "")
+                if response.status_code == 200 and content_type.startswith("text/html"):
+                    raise _BulkFormError(response)
+                if response.status_code != 200 or not content_type.startswith("application/json"):
+                    raise JSONRequestException(5, "Request {0}: unexpected response with status {1}.".format(
+                        i, response.status_code))
+                results.append(json.loads(response.content.decode("utf-8")))
+    except _BulkFormError as error:
+        # The web form with the errors is returned as is, and JSONClientMiddleware
+        # turns it into an error page.  The database changes of the bulk have
+        # been rolled back, so the work scheduled for after the commit must be
+        # discarded, too.
+        pop_after_commit_callbacks()
+        start_collecting_after_commit_callbacks()
+        return error.response
+    return respond_in_json(results)
+
+
 def _is_folded(process_id, folded_process_classes, exceptional_processes, switch):
     """Helper routine to determine whether the process is folded or not. Is the switch
     parameter is ``True``, the new status is saved.
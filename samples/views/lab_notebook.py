@@ -26,6 +26,10 @@ methods of physical process models, and the layout work is done in the
 Furthermore, if you'd like to add a lab notebook function, you must add its URL
 explicitly to ``urls.py``.  See :py:mod:`samples.utils.urls` for further
 information.
+
+The rendered months and their data trees are cached until a process of the
+respective class and month is saved or deleted.  Therefore, the lab notebook
+templates must not contain anything which depends on the current user.
 """
 
 from __future__ import absolute_import, unicode_literals
@@ -39,7 +43,10 @@ import django.forms as forms
 from django.utils.translation import ugettext_lazy as _, ugettext
 from django.contrib.auth.decorators import login_required
 from django.utils.http import urlquote_plus
-from jb_common.utils.base import help_link, HttpResponseSeeOther, get_all_models, camel_case_to_underscores, capitalize_first_letter
+from django.core.cache import cache
+from django.utils.translation import get_language
+from jb_common.utils.base import help_link, HttpResponseSeeOther, get_all_models, camel_case_to_underscores, \
+    capitalize_first_letter, get_cache_generation, get_from_cache
 from samples import permissions
 import samples.utils.views as utils
 
@@ -124,6 +131,36 @@ def get_previous_next_urls(process_name, year, month):
     return previous_url, next_url
 
 
+def get_snapshot_cache_key(kind, process_class, year, month, settings_hash):
+    """Returns the cache key of a cached lab notebook month.  It contains the
+    generation of the month, which is incremented in
+    :py:func:`samples.signals.expire_lab_notebook_snapshots` whenever a
+    process of that month is saved or deleted.
+
+    :param kind: the kind of the cached item, ``"html"`` for the rendered
+        body, or ``"data"`` for the data tree
+    :param process_class: the model class of the physical process
+    :param year: the year of the lab notebook month
+    :param month: the month of the lab notebook month
+    :param settings_hash: hash over all settings which affect the cached item,
+        e.g. the language
+
+    :type kind: str
+    :type process_class: ``class``
+    :type year: int
+    :type month: int
+    :type settings_hash: str
+
+    :return:
+      the cache key
+
+    :rtype: str
+    """
+    generation = get_cache_generation("lab-notebook-generation:{0}:{1}-{2}".format(process_class.__name__, year, month))
+    return "lab-notebook-{0}:{1}:{2}-{3}:{4}-{5}".format(kind, process_class.__name__, year, month, settings_hash,
+                                                        generation)
+
+
 @help_link("demo.html#lab-notebooks")
 @login_required
 def show(request, process_name, year_and_month):
@@ -164,9 +201,13 @@ def show(request, process_name, year_and_month):
                     kwargs={"year_and_month": "{year}/{month}".format(**year_month_form.cleaned_data)}))
     else:
         year_month_form = YearMonthForm(initial={"year": year, "month": month})
-    template = loader.get_template("samples/lab_notebook_" + process_name + ".html")
-    template_context = RequestContext(request, process_class.get_lab_notebook_context(year, month))
-    html_body = template.render(template_context)
+    cache_key = get_snapshot_cache_key("html", process_class, year, month, request.user.jb_user_details.get_data_hash())
+    html_body = get_from_cache(cache_key)
+    if html_body is None:
+        template = loader.get_template("samples/lab_notebook_" + process_name + ".html")
+        template_context = RequestContext(request, process_class.get_lab_notebook_context(year, month))
+        html_body = template.render(template_context)
+        cache.set(cache_key, html_body)
     previous_url, next_url = get_previous_next_urls(process_name, year, month)
     try:
         export_url = django.core.urlresolvers.reverse(
@@ -207,7 +248,11 @@ def export(request, process_name, year_and_month):
     process_class = get_all_models()[process_name]
     permissions.assert_can_view_lab_notebook(request.user, process_class)
     year, month = parse_year_and_month(year_and_month)
-    data = process_class.get_lab_notebook_data(year, month)
+    cache_key = get_snapshot_cache_key("data", process_class, year, month, get_language())
+    data = get_from_cache(cache_key)
+    if data is None:
+        data = process_class.get_lab_notebook_data(year, month)
+        cache.set(cache_key, data)
     result = utils.table_export(request, data, _("process"))
     if isinstance(result, tuple):
         column_groups_form, columns_form, table, switch_row_forms, old_data_form = result
@@ -32,10 +32,10 @@ import django.core.urlresolvers
 import django.forms as forms
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.utils.translation import ugettext_lazy as _, ugettext
+from django.core.cache import cache
+from django.utils.translation import ugettext_lazy as _, ugettext, get_language
 from jb_common.utils.base import help_link, is_json_requested, respond_in_json, get_all_models, unquote_view_parameters, \
-    camel_case_to_underscores
-from jb_common.models import Topic
+    camel_case_to_underscores, get_actual_instances, get_cache_generation, get_from_cache
 import samples.utils.views as utils
 from samples.models import ExternalOperator
 
@@ -90,6 +90,56 @@ class MySeries(object):
         return self.__is_complete
 
 
+def get_capabilities(user):
+    """Returns what the user is allowed to do, as far as it is shown in the
+    main menu.  This involves many permission checks.  Therefore, the result
+    is cached until the display settings of the user are touched, see
+    :py:meth:`samples.models.UserDetails.touch_display_settings`, or a topic
+    is changed.
+
+    :param user: the current user
+
+    :type user: django.contrib.auth.models.User
+
+    :return:
+      the capabilities of the user, mapping the keys ``"can_add_topic"``,
+      ``"can_edit_topics"``, ``"can_add_external_operator"``,
+      ``"can_rename_samples"``, ``"physical_processes"`` (see
+      :py:func:`samples.permissions.get_allowed_physical_processes`), and
+      ``"lab_notebooks"`` (list of dicts with ``"label"`` and ``"url"``)
+
+    :rtype: dict mapping str to object
+    """
+    cache_key = "main-menu-capabilities:{0}-{1}-{2}-{3}-{4}".format(
+        user.pk, user.samples_user_details.display_settings_timestamp.strftime("%Y%m%d%H%M%S%f"), user.is_superuser,
+        get_language(), get_cache_generation("topics-generation"))
+    capabilities = get_from_cache(cache_key)
+    if capabilities is None:
+        lab_notebooks = []
+        for process_class, process in permissions.get_all_addable_physical_process_models().items():
+            try:
+                url = django.core.urlresolvers.reverse("lab_notebook_" + camel_case_to_underscores(process["type"]),
+                                                       kwargs={"year_and_month": ""})
+            except django.core.urlresolvers.NoReverseMatch:
+                pass
+            else:
+                if permissions.has_permission_to_view_lab_notebook(user, process_class):
+                    lab_notebooks.append({"label": six.text_type(process["label_plural"]), "url": url})
+        lab_notebooks.sort(key=lambda process: process["label"].lower())
+        physical_processes = permissions.get_allowed_physical_processes(user)
+        for process in physical_processes:
+            process["label"], process["label_plural"] = \
+                six.text_type(process["label"]), six.text_type(process["label_plural"])
+        capabilities = {"can_add_topic": permissions.has_permission_to_edit_users_topics(user),
+                        "can_edit_topics": permissions.can_edit_any_topic(user),
+                        "can_add_external_operator": permissions.has_permission_to_add_external_operator(user),
+                        "can_rename_samples": user.has_perm("samples.rename_samples") or user.is_superuser,
+                        "physical_processes": physical_processes,
+                        "lab_notebooks": lab_notebooks}
+        cache.set(cache_key, capabilities)
+    return capabilities
+
+
 @help_link("demo.html#the-my-samples-list")
 @login_required
 def main_menu(request):
@@ -107,34 +157,21 @@ def main_menu(request):
     :rtype: HttpResponse
     """
     my_topics, topicless_samples = utils.build_structured_sample_list(request.user)
-    allowed_physical_processes = permissions.get_allowed_physical_processes(request.user)
-    lab_notebooks = []
-    for process_class, process in permissions.get_all_addable_physical_process_models().items():
-        try:
-            url = django.core.urlresolvers.reverse("lab_notebook_" + camel_case_to_underscores(process["type"]),
-                                                   kwargs={"year_and_month": ""})
-        except django.core.urlresolvers.NoReverseMatch:
-            pass
-        else:
-            if permissions.has_permission_to_view_lab_notebook(request.user, process_class):
-                lab_notebooks.append({"label": process["label_plural"], "url": url})
-    if lab_notebooks:
-        lab_notebooks.sort(key=lambda process: process["label"].lower())
+    capabilities = get_capabilities(request.user)
     return render(request, "samples/main_menu.html",
                   {"title": _("Main menu"),
                    "my_topics": my_topics,
                    "topicless_samples": topicless_samples,
                    "add_sample_url": django.core.urlresolvers.reverse(settings.ADD_SAMPLES_VIEW),
                    "user_hash": permissions.get_user_hash(request.user),
-                   "can_add_topic": permissions.has_permission_to_edit_users_topics(request.user),
-                   "can_edit_topics": any(permissions.has_permission_to_edit_topic(request.user, topic)
-                                          for topic in Topic.objects.all()),
-                   "can_add_external_operator": permissions.has_permission_to_add_external_operator(request.user),
+                   "can_add_topic": capabilities["can_add_topic"],
+                   "can_edit_topics": capabilities["can_edit_topics"],
+                   "can_add_external_operator": capabilities["can_add_external_operator"],
                    "has_external_contacts": request.user.external_contacts.exists() or
-                                            (ExternalOperator.objects.exists() and request.user.is_superuser),
-                   "can_rename_samples": request.user.has_perm("samples.rename_samples") or request.user.is_superuser,
-                   "physical_processes": allowed_physical_processes,
-                   "lab_notebooks": lab_notebooks})
+                                            (request.user.is_superuser and ExternalOperator.objects.exists()),
+                   "can_rename_samples": capabilities["can_rename_samples"],
+                   "physical_processes": capabilities["physical_processes"],
+                   "lab_notebooks": capabilities["lab_notebooks"]})
 
 
 class SearchDepositionsForm(forms.Form):
@@ -172,10 +209,9 @@ def deposition_search(request):
     if search_depositions_form.is_valid():
         number_pattern = search_depositions_form.cleaned_data["number_pattern"]
         if number_pattern:
-            found_depositions = models.Deposition.objects.filter(number__icontains=number_pattern)
-            too_many_results = found_depositions.count() > max_results
-            found_depositions = found_depositions[:max_results] if too_many_results else found_depositions
-            found_depositions = [deposition.actual_instance for deposition in found_depositions]
+            found_depositions = list(models.Deposition.objects.filter(number__icontains=number_pattern)[:max_results + 1])
+            too_many_results = len(found_depositions) > max_results
+            found_depositions = get_actual_instances(found_depositions[:max_results])
     return render(request, "samples/search_depositions.html", {"title": _("Search for deposition"),
                                                                "search_depositions": search_depositions_form,
                                                                "found_depositions": found_depositions,
@@ -146,11 +146,9 @@ def is_referentially_valid(current_user, my_samples_form, action_form):
                 action_data["copy_to_user"].remove(action_data["new_currently_responsible_person"])
             except ValueError:
                 pass
-            try:
-                for sample in my_samples_form.cleaned_data["samples"]:
-                    for user in action_data["copy_to_user"]:
-                        permissions.assert_can_fully_view_sample(user, sample)
-            except permissions.PermissionError:
+            selected_samples = my_samples_form.cleaned_data["samples"]
+            if any(len(permissions.filter_viewable_samples(user, selected_samples)) < len(selected_samples)
+                   for user in action_data["copy_to_user"]):
                 action_form.add_error("clearance", _("If you copy samples over to another person who cannot fully view one of the "
                                             "samples, you must select a clearance option."))
                 referentially_valid = False
@@ -18,24 +18,41 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-"""View for showing a plot as a PDF file.
+"""Views for showing plots as PDF files or thumbnails.
 """
 
 from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 
 import os.path
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-from matplotlib.figure import Figure
 from django.shortcuts import get_object_or_404
 from django.http import Http404
+from django.utils.cache import get_conditional_response
 from django.contrib.auth.decorators import login_required
-from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.views.decorators.http import require_http_methods
 import jb_common.utils.base
 from jb_common.signals import storage_changed
 from samples import models, permissions
 import samples.utils.views as utils
-from samples.utils.plots import PlotError
+from samples.utils.plots import PlotError, get_plot_filepath, is_plot_update_necessary, generate_plot
+
+
+def get_plot_version(plot_filepath):
+    """Returns the version of a plot file, i.e. its content-addressed name
+    without extension.  It changes whenever the content of the plot file
+    changes.
+
+    :param plot_filepath: absolute path to the plot file
+
+    :type plot_filepath: str
+
+    :return:
+      the version of the plot file
+
+    :rtype: str
+    """
+    return os.path.splitext(os.path.basename(plot_filepath))[0]
 
 
 @login_required
@@ -43,6 +60,15 @@ def show_plot(request, process_id, plot_id, thumbnail):
     """Shows a particular plot.  Although its response is a bitmap rather than
     an HTML file, it is served by Django in order to enforce user permissions.
 
+    Normally, the plot file has already been generated by the ``render_plots``
+    management command, or it is shared with another process with the same raw
+    data.  Only if it is missing from the plot cache, it is generated here.
+    Since the plot files are content-addressed, their names are used as ETags,
+    so that browsers can revalidate their cached copies cheaply.  If the URL
+    contains the name as the query parameter ``v``, as the URLs returned by
+    `show_plot_thumbnails` do, the response never changes, so browsers may
+    cache it without revalidation.
+
     :param request: the current HTTP Request object
     :param process_id: the database ID of the process to show
     :param plot_id: the plot_id of the image.  This is mostly ``u""`` because
@@ -62,43 +88,76 @@ def show_plot(request, process_id, plot_id, thumbnail):
     process = get_object_or_404(models.Process, pk=utils.convert_id_to_int(process_id))
     process = process.actual_instance
     permissions.assert_can_view_physical_process(request.user, process)
-    plot_filepath = process.calculate_plot_locations(plot_id)["thumbnail_file" if thumbnail else "plot_file"]
-    datafile_name = process.get_datafile_name(plot_id)
-    if datafile_name is None:
-        raise Http404("No such plot available.")
-    timestamps = [] if thumbnail else [sample.last_modified for sample in process.samples.all()]
-    timestamps.append(process.last_modified)
-    if datafile_name:
-        datafile_names = datafile_name if isinstance(datafile_name, list) else [datafile_name]
-        if not all(os.path.exists(filename) for filename in datafile_names):
-            raise Http404("One of the raw datafiles was not found.")
-        update_necessary = jb_common.utils.base.is_update_necessary(plot_filepath, datafile_names, timestamps)
-    else:
-        update_necessary = jb_common.utils.base.is_update_necessary(plot_filepath, timestamps=timestamps)
-    if update_necessary:
-        try:
-            if thumbnail:
-                figure = Figure(frameon=False, figsize=(4, 3))
-                canvas = FigureCanvasAgg(figure)
-                axes = figure.add_subplot(111)
-                axes.set_position((0.17, 0.16, 0.78, 0.78))
-                axes.grid(True)
-                process.draw_plot(axes, plot_id, datafile_name, for_thumbnail=True)
-                jb_common.utils.base.mkdirs(plot_filepath)
-                canvas.print_figure(plot_filepath, dpi=settings.THUMBNAIL_WIDTH / 4)
-            else:
-                figure = Figure()
-                canvas = FigureCanvasAgg(figure)
-                axes = figure.add_subplot(111)
-                axes.grid(True)
-                axes.set_title(six.text_type(process))
-                process.draw_plot(axes, plot_id, datafile_name, for_thumbnail=False)
-                # FixMe: Activate this line with Matplotlib 1.1.0.
-#                figure.tight_layout()
-                jb_common.utils.base.mkdirs(plot_filepath)
-                canvas.print_figure(plot_filepath, format="pdf")
+    try:
+        plot_filepath = get_plot_filepath(process, plot_id, thumbnail)
+        if is_plot_update_necessary(process, plot_id, thumbnail):
+            plot_filepath = generate_plot(process, plot_id, thumbnail)
             storage_changed.send(models.Process)
-        except PlotError as e:
-            raise Http404(six.text_type(e) or "Plot could not be generated.")
-    return jb_common.utils.base.static_file_response(plot_filepath,
-                                                     None if thumbnail else process.get_plotfile_basename(plot_id) + ".pdf")
+    except PlotError as e:
+        raise Http404(six.text_type(e) or "Plot could not be generated.")
+    version = get_plot_version(plot_filepath)
+    etag = '"{0}"'.format(version)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = jb_common.utils.base.static_file_response(
+            plot_filepath, None if thumbnail else process.get_plotfile_basename(plot_id) + ".pdf")
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, max-age=31536000, immutable" if request.GET.get("v") == version else \
+                                "private, no-cache"
+    return response
+
+
+@login_required
+@require_http_methods(["GET"])
+def show_plot_thumbnails(request):
+    """Makes sure that many plot thumbnails are available at once, e.g. all
+    thumbnails of a sample data sheet.  The plots are given in the repeated
+    query string parameter ``plots`` with values of the form ``<process_id>``
+    for the default plot or ``<process_id>/<plot_id>``.  The permissions are
+    checked for all processes together, and missing thumbnails are generated.
+
+    The response is a JSON object which maps the requested entries to the URLs
+    of the thumbnails, which the browser then fetches as usual.  The URLs
+    contain the version of the thumbnail, see `show_plot`, so that the browser
+    fetches every thumbnail only once and takes it from its cache on all
+    further page loads.  Entries which the user must not see or whose plot could
+    not be generated are missing in the result.  The browser side is
+    implemented in ``juliabase.loadPlotThumbnails``.
+
+    :param request: the current HTTP Request object
+
+    :type request: HttpRequest
+
+    :return:
+      the HTTP response object with the thumbnail URLs
+
+    :rtype: HttpResponse
+    """
+    plot_ids_by_process_id = {}
+    for entry in request.GET.getlist("plots"):
+        process_id, __, plot_id = entry.partition("/")
+        if process_id.isdigit():
+            plot_ids_by_process_id.setdefault(int(process_id), set()).add(plot_id)
+    processes = models.Process.objects.filter(pk__in=plot_ids_by_process_id).select_related("content_type")
+    process_ids_by_content_type = {}
+    for process in permissions.get_viewable_physical_processes(request.user, processes):
+        process_ids_by_content_type.setdefault(process.content_type_id, []).append(process.id)
+    thumbnail_urls = {}
+    storage_has_changed = False
+    for content_type_id, process_ids in process_ids_by_content_type.items():
+        process_class = ContentType.objects.get_for_id(content_type_id).model_class()
+        for process in process_class.objects.filter(pk__in=process_ids):
+            for plot_id in plot_ids_by_process_id[process.id]:
+                try:
+                    plot_filepath = get_plot_filepath(process, plot_id, thumbnail=True)
+                    if is_plot_update_necessary(process, plot_id, thumbnail=True):
+                        plot_filepath = generate_plot(process, plot_id, thumbnail=True)
+                        storage_has_changed = True
+                except PlotError:
+                    continue
+                entry = "{0}/{1}".format(process.id, plot_id) if plot_id else str(process.id)
+                thumbnail_urls[entry] = "{0}?v={1}".format(process.calculate_plot_locations(plot_id)["thumbnail_url"],
+                                                           get_plot_version(plot_filepath))
+    if storage_has_changed:
+        storage_changed.send(models.Process)
+    return jb_common.utils.base.respond_in_json(thumbnail_urls)
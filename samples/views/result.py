@@ -499,6 +499,7 @@ class FormSet(object):
                 "value_lists": self.value_form_lists}
 
 
+@utils.bulk_submittable
 @help_link("demo.html#result-process")
 @login_required
 def edit(request, process_id):
@@ -48,7 +48,7 @@ import jb_common.search
 from jb_common.signals import storage_changed
 from jb_common.utils.base import format_enumeration, unquote_view_parameters, HttpResponseSeeOther, \
     adjust_timezone_information, is_json_requested, respond_in_json, get_all_models, \
-    mkdirs, cache_key_locked, get_from_cache, unlazy_object, int_or_zero, help_link
+    mkdirs, get_cache_generation, get_from_cache, unlazy_object, int_or_zero, help_link
 from jb_common.utils.views import UserField, TopicField
 from samples import models, permissions, data_tree
 import samples.utils.views as utils
@@ -271,7 +271,8 @@ class SamplesAndProcesses(object):
         :rtype: `SamplesAndProcesses`
         """
         sample, clearance = utils.lookup_sample(sample_name, user, with_clearance=True)
-        cache_key = "sample:{0}-{1}".format(sample.pk, user.jb_user_details.get_data_hash())
+        cache_key = "sample:{0}-{1}-{2}".format(sample.pk, user.jb_user_details.get_data_hash(),
+                                                get_cache_generation("sample-generation:{0}".format(sample.pk)))
         # The following ``10`` is the expectation value of the number of
         # processes.  To get accurate results, use
         # ``samples.processes.count()`` instead.  However, this would slow down
@@ -279,20 +280,15 @@ class SamplesAndProcesses(object):
         samples_and_processes = get_from_cache(cache_key, hits=10)
         if samples_and_processes is None:
             samples_and_processes = SamplesAndProcesses(sample, clearance, user, post_data)
-            keys_list_key = "sample-keys:{0}".format(sample.pk)
-            with cache_key_locked("sample-lock:{0}".format(sample.pk)):
-                keys = cache.get(keys_list_key, [])
-                keys.append(cache_key)
-                cache.set(keys_list_key, keys, settings.CACHES["default"].get("TIMEOUT", 300) + 10)
-                # FixMe: Remove try block when it is clear that request.user is
-                # a SimpleLazyObject which is not pickable.  Maybe this can be
-                # removed completely if
-                # https://code.djangoproject.com/ticket/16563 is fixed.
-                try:
-                    samples_and_processes.user = unlazy_object(samples_and_processes.user)
-                except AttributeError:
-                    pass
-                cache.set(cache_key, samples_and_processes)
+            # FixMe: Remove try block when it is clear that request.user is a
+            # SimpleLazyObject which is not pickable.  Maybe this can be
+            # removed completely if https://code.djangoproject.com/ticket/16563
+            # is fixed.
+            try:
+                samples_and_processes.user = unlazy_object(samples_and_processes.user)
+            except AttributeError:
+                pass
+            cache.set(cache_key, samples_and_processes)
             samples_and_processes.remove_noncleared_process_contexts(user, clearance)
         else:
             samples_and_processes.personalize(user, clearance, post_data)
@@ -317,46 +313,32 @@ class SamplesAndProcesses(object):
         self.update_sample_context_for_user(user, clearance, post_data)
         self.process_contexts = []
         self.process_ids = set()
-        def collect_process_contexts(local_context=None):
-            """Constructs the list of process context dictionaries.  This
-            internal helper function directly populates
-            ``self.process_contexts``.  It consists of three parts: First, we
-            ascend through the ancestors of the sample to the first parent.
-            Then, for every ancestor and for the sample itself, the relevant
-            processes are found in form of a QuerySet, paying attention to
-            a possible clearance and to the so-called “cutoff timestamps”.  And
-            finally, we iterate over the QuerySet and get the process
-            context dictionary, possibly from the cache.
-
-            :param local_context: Information about the current sample to
-                process.  This is important when we walk through the ancestors
-                and need to keep track of where we are currently.  In
-                particular, this is used for sample splits because they must
-                know which is the current sample, which is the main sample
-                which will be actually displayed etc.
-
-            :type local_context: dict mapping str to ``object``
-            """
-            if local_context is None:
-                local_context = self.sample_context.copy()
-                local_context.update({"original_sample": sample, "latest_descendant": None, "cutoff_timestamp": None})
-            split = local_context["sample"].split_origin
-            if split:
-                new_local_context = local_context.copy()
-                new_local_context["sample"] = split.parent
-                new_local_context["latest_descendant"] = local_context["sample"]
-                new_local_context["cutoff_timestamp"] = split.timestamp
-                collect_process_contexts(new_local_context)
-            processes = models.Process.objects. \
+        # First, we ascend through the ancestors of the sample to the first
+        # parent.  Each of them gets its own local context.  This is important
+        # for sample splits because they must know which is the current sample,
+        # which is the main sample which will be actually displayed etc.
+        local_context = self.sample_context.copy()
+        local_context.update({"original_sample": sample, "latest_descendant": None, "cutoff_timestamp": None})
+        local_contexts = [local_context]
+        for ancestor, split in sample.get_ancestry():
+            local_context = local_context.copy()
+            local_context.update({"sample": ancestor, "latest_descendant": local_context["sample"],
+                                  "cutoff_timestamp": split.timestamp})
+            local_contexts.append(local_context)
+        # Then, for every ancestor and for the sample itself, the relevant
+        # processes are found, paying attention to the so-called “cutoff
+        # timestamps”.  Afterwards, the process context dictionaries are
+        # fetched from the cache in one go.
+        processes = []
+        for local_context in reversed(local_contexts):
+            local_processes = models.Process.objects. \
                 filter(Q(samples=local_context["sample"]) | Q(result__sample_series__samples=local_context["sample"])). \
                 distinct()
             if local_context["cutoff_timestamp"]:
-                processes = processes.filter(timestamp__lte=local_context["cutoff_timestamp"])
-            for process in processes:
-                process_context = utils.digest_process(process, user, local_context)
-                self.process_contexts.append(process_context)
-                self.process_ids.add(process.id)
-        collect_process_contexts()
+                local_processes = local_processes.filter(timestamp__lte=local_context["cutoff_timestamp"])
+            processes.extend((process, local_context) for process in local_processes)
+        self.process_contexts.extend(utils.digest_processes(processes, user))
+        self.process_ids.update(process.id for process, __ in processes)
         self.process_lists = []
 
     def update_sample_context_for_user(self, user, clearance, post_data):
@@ -786,8 +768,9 @@ def search(request):
                 found_samples = base_query.filter(Q(name__icontains=name_pattern) | Q(aliases__name__icontains=name_pattern))
             else:
                 found_samples = base_query.filter(name__icontains=name_pattern)
-            too_many_results = found_samples.count() > max_results
-            found_samples = found_samples[:max_results] if too_many_results else found_samples
+            found_samples = list(found_samples[:max_results + 1])
+            too_many_results = len(found_samples) > max_results
+            del found_samples[max_results:]
     my_samples = request.user.my_samples.all()
     if request.method == "POST":
         sample_ids = set(int_or_zero(key.partition("-")[0]) for key, value in request.POST.items()
@@ -833,7 +816,9 @@ def advanced_search(request):
     search_performed = False
     no_permission_message = None
     _search_parameters_hash = hashlib.sha1(json.dumps(sorted(dict((key, value) for key, value in request.GET.items()
-                                    if not "__" in key and key != "_search_parameters_hash").items())).encode("utf-8")).hexdigest()
+                                    if not "__" in key and key not in ["_search_parameters_hash", "_after"]).items())).encode("utf-8")).hexdigest()
+    after = int_or_zero(request.GET.get("_after")) or None
+    next_results_url = None
     column_groups_form = columns_form = table = switch_row_forms = old_data_form = None
     if root_form.is_valid() and root_form.cleaned_data["_model"]:
         search_tree = get_all_models()[root_form.cleaned_data["_model"]].get_search_tree_node()
@@ -848,7 +833,11 @@ def advanced_search(request):
                     Q(currently_responsible_person=request.user)).distinct()
             else:
                 base_query = None
-            results, too_many_results = jb_common.search.get_search_results(search_tree, max_results, base_query)
+            results, too_many_results = jb_common.search.get_search_results(search_tree, max_results, base_query, after)
+            if too_many_results:
+                query_dict = request.GET.copy()
+                query_dict["_after"] = max(result.pk for result in results)
+                next_results_url = "?" + query_dict.urlencode()
             if search_tree.model_class == models.Sample:
                 if request.method == "POST":
                     sample_ids = set(int_or_zero(key[2:].partition("-")[0]) for key, value in request.POST.items() if value == "on")
@@ -861,6 +850,9 @@ def advanced_search(request):
                 add_forms = len(results) * [None]
             if results and root_form.cleaned_data["_search_parameters_hash"] == _search_parameters_hash:
                 data_node = data_tree.DataNode(_("search results"))
+                viewable_samples = set(permissions.filter_viewable_samples(
+                    request.user, [result for result in results if isinstance(result, models.Sample)]))
+                viewable_results = []
                 for result in results:
                     insert = False
                     if isinstance(result, models.PhysicalProcess) \
@@ -869,15 +861,15 @@ def advanced_search(request):
                     elif isinstance(result, models.Result) \
                         and permissions.has_permission_to_view_result_process(request.user, result):
                             insert = True
-                    elif isinstance(result, models.Sample) \
-                        and permissions.has_permission_to_fully_view_sample(request.user, result):
+                    elif isinstance(result, models.Sample) and result in viewable_samples:
                             insert = True
                     elif isinstance(result, models.SampleSeries) \
                         and permissions.has_permission_to_view_sample_series(request.user, result):
                             insert = True
                     if insert:
-                        data_node.children.append(result.get_data_for_table_export())
-                if len(data_node.children) == 0:
+                        viewable_results.append(result)
+                data_node.children = data_tree.LazyChildren(viewable_results)
+                if not viewable_results:
                     no_permission_message = _("You don't have the permission to see any content of the search results.")
                 else:
                     export_result = utils.table_export(request, data_node, "")
@@ -895,6 +887,7 @@ def advanced_search(request):
     content_dict = {"title": _("Advanced search"), "search_root": root_form, "search_tree": search_tree,
                     "results": list(zip(results, add_forms)), "search_performed": search_performed,
                     "something_to_add": any(add_forms), "too_many_results": too_many_results, "max_results": max_results,
+                    "next_results_url": next_results_url,
                     "column_groups": column_groups_form, "columns": columns_form, "old_data": old_data_form,
                     "rows": list(zip(table, switch_row_forms)) if table else None,
                     "no_permission_message": no_permission_message}
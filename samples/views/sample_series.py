@@ -195,7 +195,7 @@ def show(request, name):
     """
     sample_series = get_object_or_404(models.SampleSeries, name=name)
     permissions.assert_can_view_sample_series(request.user, sample_series)
-    result_processes = [utils.digest_process(result, request.user) for result in sample_series.results.all()]
+    result_processes = utils.digest_processes([(result, {}) for result in sample_series.results.all()], request.user)
     can_edit = permissions.has_permission_to_edit_sample_series(request.user, sample_series)
     can_add_result = permissions.has_permission_to_add_result_process(request.user, sample_series)
     return render(request, "samples/show_sample_series.html",
@@ -352,8 +352,11 @@ def export(request, name):
     """
     sample_series = get_object_or_404(models.SampleSeries, name=name)
     permissions.assert_can_view_sample_series(request.user, sample_series)
-    for sample in sample_series.samples.all():
-        permissions.assert_can_fully_view_sample(request.user, sample)
+    all_samples = sample_series.samples.all()
+    viewable_samples = set(permissions.filter_viewable_samples(request.user, all_samples))
+    for sample in all_samples:
+        if sample not in viewable_samples:
+            permissions.assert_can_fully_view_sample(request.user, sample)
 
     data = sample_series.get_data_for_table_export()
     result = utils.table_export(request, data, _("sample"))
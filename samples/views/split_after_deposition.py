@@ -448,6 +448,7 @@ def forms_from_database(user, deposition, remote_client, new_names):
     return original_data_forms, new_name_form_lists, global_new_data_form
 
 
+@utils.bulk_submittable
 @login_required
 @unquote_view_parameters
 def split_and_rename_after_deposition(request, deposition_number):
@@ -39,6 +39,7 @@ from django.conf import settings
 import django
 from jb_common import __version__
 import jb_common.utils.base as utils
+from samples.utils.plots import datafile_cache_hit_rate
 
 
 def get_cache_connections():
@@ -86,9 +87,12 @@ def statistics(request):
 
     :rtype: HttpResponse
     """
+    datafile_hit_rate = datafile_cache_hit_rate()
     return render(request, "samples/statistics.html",
                   {"title": _("JuliaBase server statistics"),
                    "cache_hit_rate": int(round((utils.cache_hit_rate() or 0) * 100)),
+                   "cache_prefetch_latency": utils.cache_prefetch_latency(),
+                   "datafile_cache_hit_rate": None if datafile_hit_rate is None else int(round(datafile_hit_rate * 100)),
                    "cache_connections": get_cache_connections()})
 
 
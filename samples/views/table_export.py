@@ -56,7 +56,11 @@ without duplicates.  So, the first row tree is walked through, and each of its
 nodes is put into the ``column_groups`` list directly.  Then, the next tree is
 scanned, but only *new* nodes (i.e., with a so-far unknown ``name``) are added,
 and so forth.  I try to make the order within ``column_groups`` senseful,
-however in theory, it doesn't matter really.
+however in theory, it doesn't matter really.  Since nodes of the same name
+needn't have the same keys (e.g. result processes), keys not seen before are
+added to known column groups, too.  Thus, the row trees are needed only one
+at a time, and they may be created lazily, see
+:py:class:`samples.data_tree.LazyChildren`.
 
 The second data structure for columns is simply called ``columns``, and it is
 built parallely to ``column_groups`` in `build_column_group_list`.  Whenever a
@@ -250,7 +254,7 @@ class Column(object):
         """
         for column_group_name in self.column_group_names:
             if column_group_name in row:
-                return row[column_group_name][self.key]
+                return row[column_group_name].get(self.key, "")
         return ""
 
 
@@ -321,55 +325,72 @@ def build_column_group_list(root):
         for column in columns:
             if column.key in duplicates:
                 column.disambig()
+    def add_columns(column_group, node):
+        """Adds the keys of the node which are not yet in the column group to
+        the column group and to the list of columns.  Nodes of the same name
+        needn't have the same keys, e.g. result processes, so every node is
+        checked.
+
+        :param column_group: the column group of the node
+        :param node: the node whose items should be added
+
+        :type column_group: `ColumnGroup`
+        :type node: `samples.data_tree.DataNode`
+        """
+        for item in node.items:
+            if item.key in column_group.key_indices:
+                continue
+            if node.top_level and item.origin:
+                shared_key = (item.origin, item.key)
+                if shared_key in shared_columns:
+                    column_group.key_indices[item.key] = shared_columns[shared_key]
+                    columns[shared_columns[shared_key]].append_name(column_group.name)
+                    continue
+                else:
+                    shared_columns[shared_key] = len(columns)
+            column_group.key_indices[item.key] = len(columns)
+            columns.append(Column(column_group.name, item.key))
+
     columns = []
     column_groups = []
     shared_columns = {}
     position = 0
-    for row, row_tree in enumerate(root.children):
+    for row_tree in root.children:
         for node in walk_row_tree(row_tree):
-            if row > 0 and node in column_groups:
+            try:
                 position = column_groups.index(node)
-            else:
-                name = node.name
-                column_group = ColumnGroup(name)
-                i = len(columns)
-                for item in node.items:
-                    if node.top_level and item.origin:
-                        shared_key = (item.origin, item.key)
-                        if shared_key in shared_columns:
-                            column_group.key_indices[item.key] = shared_columns[shared_key]
-                            columns[shared_columns[shared_key]].append_name(name)
-                            continue
-                        else:
-                            shared_columns[shared_key] = i
-                    column_group.key_indices[item.key] = i
-                    columns.append(Column(name, item.key))
-                    i += 1
-                column_groups.insert(position, column_group)
+            except ValueError:
+                column_groups.insert(position, ColumnGroup(node.name))
+            add_columns(column_groups[position], node)
             position += 1
     disambig_key_names(columns)
     return column_groups, columns
 
 
-def flatten_tree(root):
-    """Walk through a ``DataNode`` tree and convert it to a list of nested
-    dictionaries for easy cell value lookup.  The resulting data structure is
-    used in :py:meth:`Column.get_value`.
+def flatten_tree(root, consume=False):
+    """Walk through a ``DataNode`` tree and convert it to nested dictionaries
+    for easy cell value lookup, one row at a time.  The resulting data
+    structure is used in :py:meth:`Column.get_value`.  Since this is a
+    generator, only the current row is held in flattened form.
 
     :param root: The root node of the ``DataNode`` tree.  It must be a complete
         tree, i.e. the top-level children are considered the row tree.  The
         node names must have been made unambiguous within a row tree already
         using `DataNode.find_unambiguous_names`.
+    :param consume: whether the row trees should be removed from ``root``
+        after they have been flattened, so that the memory can be released
+        while the rows are processed; lazily created row trees are never held
+        in ``root`` anyway
 
     :type root: `samples.data_tree.DataNode`
+    :type consume: bool
 
     :return:
-      list of all rows containg a dictionary mapping node names (loosely
-      corresponding to column group names) to dictionaries mapping key names to
-      cell values
+      all rows containg a dictionary mapping node names (loosely corresponding
+      to column group names) to dictionaries mapping key names to cell values
 
-    :rtype: list of dictionary mapping unicode to dictionary mapping unicode to
-      unicode
+    :rtype: iterator over dictionary mapping unicode to dictionary mapping
+      unicode to unicode
     """
 
     def flatten_row_tree(node):
@@ -378,7 +399,10 @@ def flatten_tree(root):
             name_dict.update(flatten_row_tree(child))
         return name_dict
 
-    return [flatten_row_tree(row) for row in root.children]
+    for i, row in enumerate(root.children):
+        yield flatten_row_tree(row)
+        if consume and isinstance(root.children, list):
+            root.children[i] = None
 
 
 def generate_table_rows(flattened_tree, columns, selected_key_indices, label_column, label_column_heading):
@@ -386,7 +410,7 @@ def generate_table_rows(flattened_tree, columns, selected_key_indices, label_col
     that for ODF or Excel output, you should also take the column group list
     into account for better formatting.
 
-    :param flattened_tree: the transformed tree as constructed by
+    :param flattened_tree: the transformed tree as generated by
         `flatten_tree`.
     :param columns: list of columns as constructed by `build_column_group_list`
     :param selected_key_indices: list of the column indices which the user
@@ -405,7 +429,7 @@ def generate_table_rows(flattened_tree, columns, selected_key_indices, label_col
         rows are the samples of the series, and their names are printed in the
         first column.
 
-    :type flattened_tree: list of dictionary mapping unicode to dictionary
+    :type flattened_tree: iterable of dictionary mapping unicode to dictionary
       mapping unicode to unicode
     :type columns: list of `Column`
     :type selected_key_indices: list of int
@@ -413,21 +437,22 @@ def generate_table_rows(flattened_tree, columns, selected_key_indices, label_col
     :type label_column_heading: unicode
 
     :return:
-      The table as a nested list.  The outer list are the rows, the inner the
-      columns.  Each cell is a unicode string.
+      The table rows, beginning with the head row.  Each row is a list of the
+      cells.  Each cell is a unicode string.  The rows are generated one at a
+      time, so that large tables can be written without holding them in
+      memory.
 
-    :rtype: list of list of object
+    :rtype: iterator over list of object
     """
     generate_label_column = any(label_column)
     head_row = [label_column_heading] if generate_label_column else []
     head_row.extend([six.text_type(columns[key_index].heading) for key_index in selected_key_indices])
-    table_rows = [head_row]
+    yield head_row
     for i, row in enumerate(flattened_tree):
         table_row = [label_column[i]] if generate_label_column else []
         for key_index in selected_key_indices:
             table_row.append(columns[key_index].get_value(row))
-        table_rows.append(table_row)
-    return table_rows
+        yield table_row
 
 
 class ColumnGroupsForm(forms.Form):
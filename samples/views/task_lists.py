@@ -208,15 +208,21 @@ class TaskForTemplate(object):
     """
     def __init__(self, task, user):
         self.task = task
-        self.samples = [sample if (sample.topic and not sample.topic.confidential)
-                        or (permissions.has_permission_to_fully_view_sample(user, sample) or
-                            permissions.has_permission_to_add_edit_physical_process(user, self.task.finished_process,
-                                                                                    self.task.process_class.model_class()))
-                        else _("confidential sample") for sample in self.task.samples.all()]
+        samples = list(self.task.samples.all())
+        viewable_samples = set(permissions.filter_viewable_samples(user, samples))
+        can_add_edit_process = None
+        self.samples = []
+        for sample in samples:
+            if not (sample.topic and not sample.topic.confidential) and sample not in viewable_samples:
+                if can_add_edit_process is None:
+                    can_add_edit_process = permissions.has_permission_to_add_edit_physical_process(
+                        user, self.task.finished_process, self.task.process_class.model_class())
+                if not can_add_edit_process:
+                    sample = _("confidential sample")
+            self.samples.append(sample)
         self.user_can_edit = user == self.task.customer or \
             permissions.has_permission_to_add_physical_process(user, task.process_class.model_class())
-        self.user_can_see_everything = self.user_can_edit or \
-            all([permissions.has_permission_to_fully_view_sample(user, sample) for sample in self.task.samples.all()])
+        self.user_can_see_everything = self.user_can_edit or len(viewable_samples) == len(samples)
         self.user_can_delete = user == self.task.customer
 
 
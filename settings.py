@@ -93,6 +93,7 @@ TEMPLATE_LOADERS = (
                                                "django.template.loaders.filesystem.Loader")),)
 
 MIDDLEWARE_CLASSES = (
+    "jb_common.middleware.CacheStatisticsMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "jb_common.middleware.MessageMiddleware",
@@ -101,6 +102,7 @@ MIDDLEWARE_CLASSES = (
     "jb_common.middleware.LocaleMiddleware",
     "samples.middleware.juliabase.ExceptionsMiddleware",
     "jb_common.middleware.JSONClientMiddleware",
+    "jb_common.middleware.AfterCommitMiddleware",
 )
 APPEND_SLASH = False
 